@@ -1,18 +1,56 @@
 # cuda-lab-back/app.py
 
 
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional, Union
+import asyncio
 import json
+import time
 
-from convolution_service import process_convolution_request
+from convolution_service import (
+    convolution_batch_key,
+    process_convolution_request,
+    process_convolution_batch,
+    process_binary_convolution_request,
+    process_batch_convolution_request,
+    process_custom_kernel_request,
+    iter_batch_convolution,
+)
 from progressive_convolution import process_progressive_convolution
-from image_utils import decode_image_base64
+from filter_graph import process_filter_graph_request
+from image_utils import check_color_mode, decode_image_base64
+from filters import resolve_backend
+from autotune import parse_block_dim
+from compute_worker import get_compute_worker
+from worker_pool import get_worker_pool, start_worker_pool, stop_worker_pool
+from stage_timing import StageTimer, server_timing_enabled, server_timing_header
+from metrics import record_request, render_metrics
+from warmup import get_warmup_state, run_warmup
+from kernel_specialization import get_specialization_cache, specialization_enabled
+
 
-app = FastAPI(title="CUDA Image Lab Backend")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # CUDA_LAB_WORKERS > 0: filters run in pinned worker processes
+    await run_in_threadpool(start_worker_pool)
+    # Otherwise all compute runs on one owned thread (it also owns the CUDA context)
+    worker = get_compute_worker()
+    worker.start()
+    # Device init + parallel precompilation of the filter modules; /ready waits for it
+    warmup = asyncio.create_task(run_warmup(worker))
+    yield
+    warmup.cancel()
+    await worker.stop()
+    await run_in_threadpool(stop_worker_pool)
+
+
+app = FastAPI(title="CUDA Image Lab Backend", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -21,6 +59,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allow all methods (GET, POST, etc.)
     allow_headers=["*"],  # Allow all headers
+    # Let the browser read the metadata headers of /convolve-raw responses
+    expose_headers=[
+        "X-Execution-Time-Ms", "X-Kernel-Time-Ms", "X-Image-Width", "X-Image-Height",
+        "X-Filter-Used", "X-Mask-Size-Used", "X-Backend-Used", "X-Block-Dim", "X-Channels",
+        "X-Engine-Used", "X-Output-Format", "X-Encoded-Bytes", "X-Encode-Time-Ms", "Server-Timing",
+    ],
 )
 
 # ---------- Pydantic Models ----------
@@ -29,32 +73,126 @@ class FilterConfig(BaseModel):
     type: str           # filter type, e.g., "blur", "sharpen"
     mask_size: int      # filter mask size
     gain: float = 8.0   # gain for edge enhancement (Prewitt), default 8.0
+    engine: str = "auto"   # algorithm variant, e.g. box_blur "direct" | "running_sum"
     
+class OutputConfig(BaseModel):
+    format: str = "png"                   # "png", "bmp", "jpeg", "webp" or "npy"
+    compress_level: Optional[int] = None  # png: 0-9 (None = Pillow default, 6)
+    quality: Optional[int] = None         # jpeg / webp: 1-100 (default 90 / 80)
+
 class CudaConfig(BaseModel):
-    block_dim: List[int]   # [blockDimX, blockDimY]
+    block_dim: Union[List[int], str]   # [blockDimX, blockDimY] or "auto" (autotuned)
     grid_dim: List[int]    # [gridDimX, gridDimY]
 
 class ConvolutionRequest(BaseModel):
     image_base64: str
     filter: FilterConfig
     cuda_config: CudaConfig
+    backend: str = "auto"   # "cuda", "cpu" or "auto" (CUDA if available, else CPU)
+    color_mode: str = "grayscale"   # "grayscale" or "rgb" (color PNG in, color PNG out)
+    output: OutputConfig = OutputConfig()   # response encoding (/convolve-stream always sends PNG)
+
+class BatchConvolutionRequest(BaseModel):
+    images: List[str]             # base64 images, each decoded once
+    filters: List[FilterConfig]   # applied to every image
+    cuda_config: CudaConfig
+    backend: str = "auto"
+    color_mode: str = "grayscale"
+    stream: bool = False          # True = SSE, one event per result as it completes
+    output: OutputConfig = OutputConfig()
+
+class CustomKernelRequest(BaseModel):
+    image_base64: str
+    kernel: List[List[float]]     # NxN weights (N odd), applied as correlation
+    cuda_config: CudaConfig
+    backend: str = "auto"
+    color_mode: str = "grayscale"
+    postprocess: str = "clip"     # "clip" (clamp to [0,255]) or "abs" (edge kernels)
+    max_rank: int = 3             # most row/column pass pairs before falling back to dense
+    rank_tolerance: float = 1e-5  # singular values below this fraction of the largest are dropped
+    output: OutputConfig = OutputConfig()
+
+class GraphNode(BaseModel):
+    id: str
+    filter: FilterConfig
+    input: str = "input"          # "input" = source image, or another node id
+
+class FilterGraphRequest(BaseModel):
+    image_base64: str
+    nodes: List[GraphNode]
+    outputs: List[str]            # node ids to return
+    cuda_config: CudaConfig
+    backend: str = "auto"
+    color_mode: str = "grayscale"
+    output: OutputConfig = OutputConfig()   # encoding of every returned output
 
 
 # ---------- Routes ----------
 
+def _set_server_timing(response: Response, result: dict):
+    """Optional Server-Timing header (CUDA_LAB_SERVER_TIMING=1) from stage_timings_ms."""
+    if server_timing_enabled() and result.get("stage_timings_ms"):
+        response.headers["Server-Timing"] = server_timing_header(result["stage_timings_ms"])
+
+
+def _record_batch_item(result: dict):
+    """Batch items are observed one by one, with their own stage total as latency."""
+    if result.get("status") == "ok":
+        ms = result.get("stage_timings_ms", {}).get("total", result.get("execution_time_ms", 0.0))
+        record_request("/convolve-batch", result, ms / 1000.0)
+
+
 @app.get("/health")
 def health_check():
-    return {"status": "ok"}
+    health = {
+        "status": "ok",
+        "compute_worker": get_compute_worker().stats(),
+        "warmup": get_warmup_state().as_dict(),
+        "kernel_specialization": {
+            "enabled": specialization_enabled(),
+            **get_specialization_cache().stats(),
+        },
+    }
+    pool = get_worker_pool()
+    if pool is not None:
+        health["worker_pool"] = pool.health()
+    return health
+
+
+@app.get("/ready")
+def readiness_check():
+    """Readiness probe: 200 once the startup warm-up has finished, 503 before (or if it failed)."""
+    state = get_warmup_state()
+    body = {"ready": state.ready, "warmup": state.as_dict()}
+    if not state.ready:
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus text-format metrics (latency histograms, queue gauges, cache counters)."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 
 @app.post("/convolve")
-def convolve(req: ConvolutionRequest):
+async def convolve(req: ConvolutionRequest, response: Response):
     """
     Main endpoint that applies convolution on the GPU.
-    Receives a ConvolutionRequest, passes it to convolution_service, and returns the result.
+    Receives a ConvolutionRequest, passes it to convolution_service on the
+    compute worker, and returns the result.
     """
+    start = time.perf_counter()
     try:
         payload = req.model_dump()  # dict with image_base64, filter, cuda_config
-        result = process_convolution_request(payload)
+        key = convolution_batch_key(payload)
+        if key is None:
+            result = await get_compute_worker().submit(process_convolution_request, payload)
+        else:
+            # Same-shape, same-filter requests queued together share one launch
+            result = await get_compute_worker().submit_batched(process_convolution_batch, payload, key)
+        _set_server_timing(response, result)
+        record_request("/convolve", result, time.perf_counter() - start)
         return result
     except ValueError as e:
         # Data validation errors (mask_size, filter, etc.)
@@ -69,30 +207,176 @@ def convolve(req: ConvolutionRequest):
         raise HTTPException(status_code=500, detail=error_detail)
 
 
+@app.post("/convolve-raw")
+async def convolve_raw(
+    request: Request,
+    filter_type: str,
+    mask_size: int,
+    gain: float = 8.0,
+    block_x: int = 16,
+    block_y: int = 16,
+    backend: str = "auto",
+    output: str = "png",
+    color_mode: str = "grayscale",
+    engine: str = "auto",
+    compress_level: Optional[int] = None,
+    quality: Optional[int] = None,
+):
+    """
+    Binary variant of /convolve: the request body is the raw image (PNG, JPEG, ...
+    or application/x-npy) and the response body is the encoded result (output:
+    png, bmp, jpeg, webp or npy, with compress_level / quality).
+    Filter settings come as query params; timing metadata comes back as X-* headers.
+    """
+    start = time.perf_counter()
+    body = await request.body()
+    filter_conf = {"type": filter_type, "mask_size": mask_size, "gain": gain, "engine": engine}
+    block_dim = (block_x, block_y)
+
+    try:
+        content, media_type, meta = await get_compute_worker().submit(
+            process_binary_convolution_request,
+            body,
+            request.headers.get("content-type", ""),
+            filter_conf,
+            block_dim,
+            block_dim,
+            backend,
+            {"format": output, "compress_level": compress_level, "quality": quality},
+            color_mode,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        import traceback
+        error_detail = f"Internal server error: {str(e)}\n{traceback.format_exc()}"
+        raise HTTPException(status_code=500, detail=error_detail)
+
+    headers = {
+        "X-Execution-Time-Ms": f"{meta['execution_time_ms']:.4f}",
+        "X-Kernel-Time-Ms": f"{meta['kernel_time_ms']:.4f}",
+        "X-Image-Width": str(meta["image_width"]),
+        "X-Image-Height": str(meta["image_height"]),
+        "X-Filter-Used": meta["filter_used"],
+        "X-Mask-Size-Used": str(meta["mask_size_used"]),
+        "X-Backend-Used": meta["backend_used"],
+        "X-Block-Dim": ",".join(str(v) for v in meta["block_dim"]),
+        "X-Channels": str(meta["channels"]),
+        "X-Engine-Used": meta["engine_used"],
+        "X-Output-Format": meta["output_format"],
+        "X-Encoded-Bytes": str(meta["encoded_bytes"]),
+        "X-Encode-Time-Ms": f"{meta['encode_ms']:.4f}",
+    }
+    if meta.get("stage_timings_ms"):
+        # Headers are the only metadata channel here, so the stages always go out
+        headers["Server-Timing"] = server_timing_header(meta["stage_timings_ms"])
+    record_request("/convolve-raw", meta, time.perf_counter() - start)
+    return Response(content=content, media_type=media_type, headers=headers)
+
+
+@app.post("/convolve-graph")
+async def convolve_graph(req: FilterGraphRequest, response: Response):
+    """
+    Graph endpoint: runs a small DAG of filters on one image.
+    Intermediates stay in memory, identical nodes are computed once, and only
+    the requested outputs are encoded. Returns per-node timings.
+    """
+    start = time.perf_counter()
+    try:
+        result = await get_compute_worker().submit(process_filter_graph_request, req.model_dump())
+        _set_server_timing(response, result)
+        record_request("/convolve-graph", result, time.perf_counter() - start, filter_used="graph")
+        return result
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        import traceback
+        error_detail = f"Internal server error: {str(e)}\n{traceback.format_exc()}"
+        raise HTTPException(status_code=500, detail=error_detail)
+
+
+@app.post("/convolve-custom")
+async def convolve_custom(req: CustomKernelRequest, response: Response):
+    """
+    Custom kernel endpoint: applies an arbitrary NxN float kernel.
+    Rank-1 kernels run as a row pass plus a column pass, low-rank kernels as a
+    few such passes, anything else as the dense loop; the response reports
+    the chosen path, the rank and the reason.
+    """
+    start = time.perf_counter()
+    try:
+        result = await get_compute_worker().submit(process_custom_kernel_request, req.model_dump())
+        _set_server_timing(response, result)
+        record_request("/convolve-custom", result, time.perf_counter() - start, filter_used="custom")
+        return result
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        import traceback
+        error_detail = f"Internal server error: {str(e)}\n{traceback.format_exc()}"
+        raise HTTPException(status_code=500, detail=error_detail)
+
+
 @app.post("/convolve-stream")
-async def convolve_stream(req: ConvolutionRequest):
+async def convolve_stream(
+    req: ConvolutionRequest, chunk_size: int = 32, delay_ms: float = 0.0, preview_width: int = 0
+):
     """
     Stream endpoint that applies convolution progressively and streams results.
     Returns Server-Sent Events (SSE) with progressive updates showing pixel-by-pixel processing.
+    Each event carries only the newly finished row band; the last one carries the full image.
+    Query params: chunk_size (rows per event), delay_ms (optional pacing between events),
+    preview_width (downscale intermediate bands to this width; 0 = full resolution).
     """
+    start = time.perf_counter()
+    worker = get_compute_worker()
+    try:
+        # "auto" may initialize CUDA, which must happen on the compute thread
+        backend = await worker.submit(resolve_backend, req.backend)
+        block_dim = parse_block_dim(req.cuda_config.block_dim)
+        color_mode = check_color_mode(req.color_mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    timer = StageTimer()
+
+    def decode():
+        with timer.stage("decode"):
+            return decode_image_base64(req.image_base64, color_mode)
+
     try:
         # Decode image first
-        img_np = decode_image_base64(req.image_base64)
+        img_np = await worker.submit(decode)
         
         filter_type = req.filter.type
         mask_size = req.filter.mask_size
         gain = req.filter.gain
-        block_dim = tuple(req.cuda_config.block_dim)
         grid_dim = tuple(req.cuda_config.grid_dim)
         
-        # Generator function for SSE
-        def event_stream():
+        # Generator function for SSE: each chunk is computed on the compute
+        # worker, pacing happens here so it never blocks the worker thread
+        async def event_stream():
             try:
-                for update in process_progressive_convolution(
-                    img_np, filter_type, mask_size, gain, block_dim, grid_dim
-                ):
+                updates = process_progressive_convolution(
+                    img_np, filter_type, mask_size, gain, block_dim, grid_dim,
+                    chunk_size=chunk_size, backend=backend, engine=req.filter.engine,
+                    timer=timer, preview_width=preview_width,
+                )
+                async for update in worker.iterate(updates):
                     # Format as SSE: data: {json}\n\n
                     yield f"data: {json.dumps(update)}\n\n"
+                    if update.get("completed"):
+                        record_request("/convolve-stream", update, time.perf_counter() - start)
+                    if delay_ms > 0 and not update.get("completed"):
+                        await asyncio.sleep(delay_ms / 1000.0)
             except Exception as e:
                 import traceback
                 error_data = {
@@ -114,3 +398,49 @@ async def convolve_stream(req: ConvolutionRequest):
         import traceback
         error_detail = f"Stream initialization error: {str(e)}\n{traceback.format_exc()}"
         raise HTTPException(status_code=500, detail=error_detail)
+
+
+@app.post("/convolve-batch")
+async def convolve_batch(req: BatchConvolutionRequest):
+    """
+    Batch endpoint: applies every filter in `filters` to every image in `images`.
+    Returns all results ordered by (image_index, filter_index), or streams them
+    as SSE events in completion order when `stream` is true.
+    """
+    payload = req.model_dump()
+    worker = get_compute_worker()
+    try:
+        if not req.stream:
+            result = await worker.submit(process_batch_convolution_request, payload)
+            for item in result["results"]:
+                _record_batch_item(item)
+            return result
+        # Validation resolves the backend, so it also runs on the compute thread
+        results = await worker.submit(iter_batch_convolution, payload)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        import traceback
+        error_detail = f"Internal server error: {str(e)}\n{traceback.format_exc()}"
+        raise HTTPException(status_code=500, detail=error_detail)
+
+    async def event_stream():
+        try:
+            async for result in worker.iterate(results):
+                yield f"data: {json.dumps(result)}\n\n"
+                _record_batch_item(result)
+            yield f"data: {json.dumps({'completed': True})}\n\n"
+        except Exception as e:
+            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        }
+    )
@@ -0,0 +1,238 @@
+# cuda-lab-back/autotune.py
+"""
+Block-dimension autotuner with persisted per-shape launch configs.
+
+With block_dim = "auto", the first request for a given
+(backend, filter, mask_size, engine, image-shape bucket) benchmarks a set of
+candidate block dims on that image and stores the fastest one in a local
+JSON store; later requests in the same bucket reuse it without tuning.
+
+Tuning runs inline on that first request, so it is bounded: at most
+MAX_CANDIDATES candidates x MAX_REPEATS runs, and it stops early once
+budget_ms is spent (the default block dim is always measured first). The
+fft engine runs on the host and ignores block_dim, so it is never tuned.
+
+The store is shared by all processes (e.g. the CUDA_LAB_WORKERS pool):
+writes re-read and merge the file under an exclusive flock before the
+atomic replace, and lookups that miss re-read it, so workers reuse each
+other's winners instead of overwriting them.
+
+The timing function is pluggable (Autotuner(timer=...)), so the harness can
+be exercised against the CPU backend or a fake timer without a GPU.
+
+Configuration (environment variables):
+    CUDA_LAB_AUTOTUNE_PATH  JSON store (default ~/.cache/cuda-lab/autotune.json)
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: writes are still atomic, just not merged across processes
+    fcntl = None
+
+DEFAULT_STORE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "cuda-lab", "autotune.json")
+DEFAULT_BLOCK_DIM = (16, 16)
+MAX_THREADS_PER_BLOCK = 1024
+
+DEFAULT_CANDIDATES: List[Tuple[int, int]] = [
+    (16, 16), (32, 8), (16, 8), (32, 16), (64, 4), (8, 8),
+]
+MAX_CANDIDATES = 8
+MAX_REPEATS = 3
+DEFAULT_TUNE_BUDGET_MS = 500.0
+
+# Engines that ignore block_dim (run on the host)
+UNTUNED_ENGINES = ("fft",)
+
+BlockDim = Union[Tuple[int, int], str]
+
+# timer(filter_info, image, block_dim, gain, backend) -> milliseconds
+Timer = Callable[[dict, np.ndarray, Tuple[int, int], float, str], float]
+
+
+def parse_block_dim(value) -> BlockDim:
+    """
+    Normalize a request block_dim: "auto" or a [x, y] pair.
+
+    Raises:
+        ValueError: On anything else, or on more than 1024 threads per block
+    """
+    if isinstance(value, str):
+        if value.lower() == "auto":
+            return "auto"
+        raise ValueError(f"block_dim must be [x, y] or \"auto\", got {value!r}")
+
+    dims = tuple(int(v) for v in value)
+    if len(dims) != 2 or dims[0] < 1 or dims[1] < 1:
+        raise ValueError(f"block_dim must be two positive integers, got {list(value)}")
+    if dims[0] * dims[1] > MAX_THREADS_PER_BLOCK:
+        raise ValueError(
+            f"block_dim {list(dims)} has {dims[0] * dims[1]} threads, max is {MAX_THREADS_PER_BLOCK}"
+        )
+    return dims
+
+
+def shape_bucket(height: int, width: int) -> str:
+    """Round each side up to a power of two, e.g. (1080, 1920) -> '2048x2048'."""
+    def up(n: int) -> int:
+        return 1 << max(int(n) - 1, 0).bit_length()
+    return f"{up(width)}x{up(height)}"
+
+
+def tune_key(backend: str, filter_type: str, mask_size: int, engine: str, height: int, width: int) -> str:
+    return f"{backend}|{filter_type}|{mask_size}|{engine}|{shape_bucket(height, width)}"
+
+
+class AutotuneStore:
+    """Small JSON file of tuned launch configs, merged and rewritten atomically."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries: Dict[str, dict] = {}
+
+    def _read_file(self) -> Dict[str, dict]:
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                # Another process may have tuned it since we last looked
+                self._entries.update(self._read_file())
+                entry = self._entries.get(key)
+            return entry
+
+    def put(self, key: str, entry: dict):
+        with self._lock:
+            self._entries[key] = entry
+            directory = os.path.dirname(self.path) or "."
+            tmp_path = None
+            try:
+                os.makedirs(directory, exist_ok=True)
+                with open(self.path + ".lock", "a") as lock_file:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX)  # released when the file closes
+                    entries = self._read_file()
+                    entries[key] = entry
+                    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+                    with os.fdopen(fd, "w") as f:
+                        json.dump(entries, f, indent=2, sort_keys=True)
+                    os.replace(tmp_path, self.path)
+                    tmp_path = None
+                self._entries.update(entries)
+            except (OSError, TypeError, ValueError):
+                pass  # keep the in-memory entry; persistence is best effort
+            finally:
+                if tmp_path is not None:
+                    try:
+                        os.unlink(tmp_path)
+                    except OSError:
+                        pass
+
+
+def filter_timer(filter_info: dict, image: np.ndarray, block_dim: Tuple[int, int],
+                 gain: float, backend: str) -> float:
+    """Default timer: kernel time reported by the filter (CUDA events on GPU)."""
+    from filters import apply_filter
+
+    start = time.perf_counter()
+    _, timings = apply_filter(filter_info, image, block_dim, (1, 1), gain=gain, backend=backend)
+    kernel_ms = float(timings.get("kernel_time_ms", 0.0))
+    return kernel_ms if kernel_ms > 0 else (time.perf_counter() - start) * 1000.0
+
+
+class Autotuner:
+    """Picks and remembers the fastest block_dim per (backend, filter, mask, engine, shape bucket)."""
+
+    def __init__(
+        self,
+        store: AutotuneStore,
+        candidates: Optional[List[Tuple[int, int]]] = None,
+        timer: Optional[Timer] = None,
+        repeats: int = 2,
+        budget_ms: float = DEFAULT_TUNE_BUDGET_MS,
+    ):
+        self.store = store
+        # The default dims go first so an exhausted budget still compares against them
+        ordered = dict.fromkeys([DEFAULT_BLOCK_DIM] + [tuple(c) for c in (candidates or DEFAULT_CANDIDATES)])
+        self.candidates = list(ordered)[:MAX_CANDIDATES]
+        self.timer = timer or filter_timer
+        self.repeats = min(max(int(repeats), 1), MAX_REPEATS)
+        self.budget_ms = budget_ms
+        self._tune_lock = threading.Lock()
+
+    def tune(self, filter_info: dict, image: np.ndarray, gain: float, backend: str) -> dict:
+        """Benchmark the candidates (best of `repeats`, within budget_ms) and return the store entry."""
+        results = {}
+        start = time.perf_counter()
+        for block_dim in self.candidates:
+            if results and (time.perf_counter() - start) * 1000.0 > self.budget_ms:
+                break
+            samples = [self.timer(filter_info, image, block_dim, gain, backend)
+                       for _ in range(self.repeats)]
+            results[f"{block_dim[0]}x{block_dim[1]}"] = min(samples)
+
+        best = min(results, key=results.get)
+        return {
+            "block_dim": [int(v) for v in best.split("x")],
+            "time_ms": results[best],
+            "candidates_ms": results,
+            "tuned_on": list(image.shape),
+            "tuned_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }
+
+    def resolve(self, filter_info: dict, image: np.ndarray, gain: float, backend: str) -> Tuple[int, int]:
+        """Stored block_dim for this request's bucket, tuning it first if needed."""
+        if filter_info.get("engine") in UNTUNED_ENGINES:
+            return DEFAULT_BLOCK_DIM
+
+        height, width = image.shape[:2]
+        key = tune_key(backend, filter_info["type"], filter_info["mask_size_used"],
+                       filter_info.get("engine", "direct"), height, width)
+
+        entry = self.store.get(key)
+        if entry is None:
+            # One tuning run per key even with concurrent requests
+            with self._tune_lock:
+                entry = self.store.get(key)
+                if entry is None:
+                    entry = self.tune(filter_info, image, gain, backend)
+                    self.store.put(key, entry)
+
+        return tuple(entry["block_dim"])
+
+
+_autotuner: Optional[Autotuner] = None
+_autotuner_lock = threading.Lock()
+
+
+def get_autotuner() -> Autotuner:
+    """Process-wide autotuner backed by CUDA_LAB_AUTOTUNE_PATH."""
+    global _autotuner
+    with _autotuner_lock:
+        if _autotuner is None:
+            _autotuner = Autotuner(
+                AutotuneStore(os.environ.get("CUDA_LAB_AUTOTUNE_PATH", DEFAULT_STORE_PATH))
+            )
+        return _autotuner
+
+
+def set_autotuner(tuner: Optional[Autotuner]):
+    """Replace the process-wide autotuner (e.g. with a fake timer)."""
+    global _autotuner
+    with _autotuner_lock:
+        _autotuner = tuner
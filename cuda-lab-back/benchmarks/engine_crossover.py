@@ -0,0 +1,110 @@
+# benchmarks/engine_crossover.py
+"""
+Measure where each alternative engine starts beating "direct".
+
+For every filter in ENGINE_ALTERNATIVES and every mask size, times the whole
+apply_filter() call of both engines on one synthetic image, so setup work
+such as the Prewitt SAT build (row + column scans) counts against the
+alternative. The crossover is the smallest measured mask size from which
+the alternative wins at every larger size too (null if it never does).
+The entry for the measured backend is merged into
+filters/engine_crossover.json, which engine "auto" reads at runtime.
+
+Usage:
+    python benchmarks/engine_crossover.py --backend cpu
+    python benchmarks/engine_crossover.py --backend cuda --resolution 3840x2160
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from filters import resolve_backend
+from filters.engine_crossover import ENGINE_CROSSOVER_PATH
+from image_utils import decode_image_bytes
+from fft_crossover import time_engine
+from run_benchmarks import make_test_png
+
+# filter -> engine compared against "direct"
+ENGINE_ALTERNATIVES = {
+    "prewitt": "sat",
+    "laplacian": "separable",
+}
+MASK_SIZES = [3, 5, 7, 9, 11, 15, 21, 31, 51]
+
+
+def crossover(points: List[dict]) -> Optional[int]:
+    """Smallest mask size from which the alternative is faster at every measured size."""
+    best = None
+    for p in reversed(points):
+        if p["engine_ms"] >= p["direct_ms"]:
+            break
+        best = p["mask_size"]
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the direct vs. alternative engine crossover")
+    parser.add_argument("--backend", default="auto", help="cuda, cpu or auto (default)")
+    parser.add_argument("--filters", nargs="+", default=list(ENGINE_ALTERNATIVES))
+    parser.add_argument("--mask-sizes", type=int, nargs="+", default=MASK_SIZES)
+    parser.add_argument("--resolution", default="1024x1024", help="WIDTHxHEIGHT")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("-o", "--output", default=ENGINE_CROSSOVER_PATH, help="table to update")
+    args = parser.parse_args()
+
+    backend = resolve_backend(args.backend)
+    width, height = (int(v) for v in args.resolution.lower().split("x"))
+    img = decode_image_bytes(make_test_png(width, height))
+
+    table: Dict[str, Dict[str, Optional[int]]] = {}
+    points: Dict[str, List[dict]] = {}
+    for filter_type in args.filters:
+        engine = ENGINE_ALTERNATIVES[filter_type]
+        points[filter_type] = []
+        for mask_size in sorted(args.mask_sizes):
+            try:
+                engine_ms = time_engine(img, filter_type, mask_size, engine, backend, args.repeats)
+            except ValueError:
+                continue  # engine not defined for this mask size
+            direct_ms = time_engine(img, filter_type, mask_size, "direct", backend, args.repeats)
+            points[filter_type].append({
+                "mask_size": mask_size, "engine": engine,
+                "direct_ms": round(direct_ms, 3), "engine_ms": round(engine_ms, 3),
+            })
+            print(f"{filter_type:10s} N={mask_size:<4d} direct {direct_ms:9.2f} ms   "
+                  f"{engine} {engine_ms:9.2f} ms", flush=True)
+        table[filter_type] = {engine: crossover(points[filter_type])}
+
+    try:
+        with open(args.output) as f:
+            report = json.load(f)
+    except (OSError, ValueError):
+        report = {}
+
+    report.setdefault("crossover", {}).setdefault(backend, {}).update(table)
+    report.setdefault("measured", {}).setdefault(backend, {})
+    measured = report["measured"][backend]
+    measured.pop("placeholder", None)
+    measured.pop("note", None)
+    measured.update({
+        "resolution": [width, height],
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    })
+    measured.setdefault("points", {}).update(points)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"crossover[{backend}] = {report['crossover'][backend]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# benchmarks/fft_crossover.py
+"""
+Measure where the FFT engine starts beating the other engines.
+
+For every filter and mask size, times engine "fft" against the engine that
+"auto" would otherwise pick, on one synthetic image. The crossover is the
+smallest measured mask size from which fft wins at every larger size too
+(null if it never does). The entry for the measured backend is merged into
+filters/fft_crossover.json, which engine "auto" reads at runtime.
+
+Only backends in FFT_BACKENDS can be measured: on CUDA the fft engine runs
+the host implementation, so a "cuda" table would compare GPU kernels with
+a CPU path.
+
+Usage:
+    python benchmarks/fft_crossover.py --backend cpu
+    python benchmarks/fft_crossover.py --backend cpu --resolution 3840x2160
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from filters import FILTER_ENGINES, apply_filter, get_filter_kernel, resolve_backend, resolve_engine
+from filters.fft import FFT_BACKENDS, FFT_CROSSOVER_PATH
+from image_utils import decode_image_bytes
+from run_benchmarks import make_test_png
+
+MASK_SIZES = [3, 5, 7, 9, 15, 21, 31, 51, 75, 101]
+
+
+def time_engine(img: np.ndarray, filter_type: str, mask_size: int, engine: str,
+                backend: str, repeats: int) -> float:
+    """Best-of-repeats wall time of apply_filter() in ms (after one warm-up run)."""
+    info = get_filter_kernel(filter_type, mask_size, engine)
+    apply_filter(info, img, (16, 16), (1, 1), backend=backend)
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        apply_filter(info, img, (16, 16), (1, 1), backend=backend)
+        samples.append((time.perf_counter() - start) * 1000.0)
+    return min(samples)
+
+
+def crossover(points: List[dict]) -> Optional[int]:
+    """Smallest mask size from which fft is faster at every measured size."""
+    best = None
+    for p in reversed(points):
+        if p["fft_ms"] >= p["other_ms"]:
+            break
+        best = p["mask_size"]
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the FFT engine crossover mask sizes")
+    parser.add_argument("--backend", default="cpu", help=f"one of {list(FFT_BACKENDS)} (default cpu)")
+    parser.add_argument("--filters", nargs="+", default=list(FILTER_ENGINES))
+    parser.add_argument("--mask-sizes", type=int, nargs="+", default=MASK_SIZES)
+    parser.add_argument("--resolution", default="1024x1024", help="WIDTHxHEIGHT")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("-o", "--output", default=FFT_CROSSOVER_PATH, help="table to update")
+    args = parser.parse_args()
+
+    backend = resolve_backend(args.backend)
+    if backend not in FFT_BACKENDS:
+        parser.error(f"the fft engine has no native {backend} path to measure")
+    width, height = (int(v) for v in args.resolution.lower().split("x"))
+    img = decode_image_bytes(make_test_png(width, height))
+
+    table: Dict[str, Optional[int]] = {}
+    points: Dict[str, List[dict]] = {}
+    for filter_type in args.filters:
+        points[filter_type] = []
+        for mask_size in sorted(args.mask_sizes):
+            # Without a backend, "auto" resolves to the non-FFT engine
+            other = resolve_engine(filter_type, mask_size, "auto")
+            other_ms = time_engine(img, filter_type, mask_size, other, backend, args.repeats)
+            fft_ms = time_engine(img, filter_type, mask_size, "fft", backend, args.repeats)
+            points[filter_type].append({
+                "mask_size": mask_size, "other_engine": other,
+                "other_ms": round(other_ms, 3), "fft_ms": round(fft_ms, 3),
+            })
+            print(f"{filter_type:10s} N={mask_size:<4d} {other:12s} {other_ms:9.2f} ms   "
+                  f"fft {fft_ms:9.2f} ms", flush=True)
+        table[filter_type] = crossover(points[filter_type])
+
+    try:
+        with open(args.output) as f:
+            report = json.load(f)
+    except (OSError, ValueError):
+        report = {}
+
+    report.setdefault("crossover", {})[backend] = table
+    report.setdefault("measured", {})[backend] = {
+        "resolution": [width, height],
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "points": points,
+    }
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"crossover[{backend}] = {table}")
+
+
+if __name__ == "__main__":
+    main()
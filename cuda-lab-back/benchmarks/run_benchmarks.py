@@ -0,0 +1,226 @@
+# benchmarks/run_benchmarks.py
+"""
+Reproducible benchmark runner: filters x mask sizes x image sizes x block_dim.
+
+Each case times the three stages of a /convolve request separately:
+    decode  - PNG bytes -> float32 array (decode_image_bytes)
+    compute - apply_filter() on the selected backend
+    encode  - float32 array -> base64 PNG (encode_image_base64)
+
+Inputs are synthetic and seeded, so runs are comparable across machines and
+commits. Results are written as JSON and can be compared against a stored
+baseline; a case regresses when its median compute time grows by more than
+--threshold. Without a GPU the "auto" backend falls back to the CPU
+implementation (block_dim is then irrelevant and only the first one is run).
+
+Usage:
+    python benchmarks/run_benchmarks.py --quick -o results.json
+    python benchmarks/run_benchmarks.py --baseline baseline.json -o results.json
+"""
+
+import argparse
+import io
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+
+from filters import get_filter_kernel, apply_filter, resolve_backend
+from image_utils import decode_image_bytes, encode_image_base64
+
+FILTERS = ["box_blur", "gaussian", "laplacian", "prewitt"]
+MASK_SIZES = [3, 5, 7, 9, 15, 21, 31]
+RESOLUTIONS = [(256, 256), (512, 512), (1024, 1024), (2048, 2048), (3840, 2160), (7680, 4320)]
+BLOCK_DIMS = [(8, 8), (16, 16), (32, 8), (32, 16)]
+
+QUICK_MASK_SIZES = [3, 9, 21]
+QUICK_RESOLUTIONS = [(256, 256), (1024, 1024)]
+QUICK_BLOCK_DIMS = [(16, 16)]
+
+
+def make_test_png(width: int, height: int, seed: int = 0) -> bytes:
+    """Deterministic grayscale PNG with gradients, edges and noise."""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:height, 0:width]
+    img = (xx * 255.0 / max(width - 1, 1)) * 0.5 + (yy * 255.0 / max(height - 1, 1)) * 0.25
+    img += ((xx // 32 + yy // 32) % 2) * 48.0
+    img += rng.normal(0.0, 12.0, size=(height, width))
+    img_u8 = np.clip(img, 0, 255).astype(np.uint8)
+
+    buffer = io.BytesIO()
+    Image.fromarray(img_u8, mode="L").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _summary(samples: List[float]) -> Dict[str, float]:
+    return {
+        "median": statistics.median(samples),
+        "min": min(samples),
+        "mean": statistics.fmean(samples),
+    }
+
+
+def run_case(
+    png: bytes,
+    filter_type: str,
+    mask_size: int,
+    block_dim: Tuple[int, int],
+    backend: str,
+    repeats: int,
+    warmup: int,
+    engine: str = "auto",
+) -> dict:
+    """Time decode / compute / encode of one configuration."""
+    filter_info = get_filter_kernel(filter_type, mask_size, engine, backend)
+    stages = {"decode_ms": [], "compute_ms": [], "kernel_ms": [], "encode_ms": []}
+
+    for i in range(warmup + repeats):
+        t0 = time.perf_counter()
+        img_np = decode_image_bytes(png)
+        t1 = time.perf_counter()
+        result_np, timings = apply_filter(
+            filter_info, img_np, block_dim, (1, 1), gain=8.0, backend=backend
+        )
+        t2 = time.perf_counter()
+        encode_image_base64(result_np)
+        t3 = time.perf_counter()
+
+        if i < warmup:
+            continue
+        stages["decode_ms"].append((t1 - t0) * 1000.0)
+        stages["compute_ms"].append((t2 - t1) * 1000.0)
+        stages["kernel_ms"].append(float(timings.get("kernel_time_ms", 0.0)))
+        stages["encode_ms"].append((t3 - t2) * 1000.0)
+
+    height, width = img_np.shape
+    compute_median = statistics.median(stages["compute_ms"])
+    return {
+        "filter": filter_type,
+        "mask_size": mask_size,
+        "engine": filter_info["engine"],
+        "width": width,
+        "height": height,
+        "block_dim": list(block_dim),
+        "backend": backend,
+        **{name: _summary(samples) for name, samples in stages.items()},
+        "mpix_per_s": (width * height / 1e6) / (compute_median / 1000.0) if compute_median > 0 else 0.0,
+    }
+
+
+def case_key(case: dict) -> str:
+    return "{filter}|{mask_size}|{engine}|{width}x{height}|{bx}x{by}|{backend}".format(
+        bx=case["block_dim"][0], by=case["block_dim"][1], **{"engine": "direct", **case}
+    )
+
+
+def compare_to_baseline(results: List[dict], baseline: List[dict], threshold: float) -> List[dict]:
+    """Cases whose median compute time grew by more than threshold (fraction)."""
+    base = {case_key(c): c for c in baseline}
+    regressions = []
+    for case in results:
+        ref = base.get(case_key(case))
+        if ref is None:
+            continue
+        now = case["compute_ms"]["median"]
+        before = ref["compute_ms"]["median"]
+        if before > 0 and now > before * (1.0 + threshold):
+            regressions.append({
+                "case": case_key(case),
+                "baseline_ms": before,
+                "current_ms": now,
+                "slowdown": now / before,
+            })
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CUDA Image Lab filters")
+    parser.add_argument("--backend", default="auto", help="cuda, cpu or auto (default)")
+    parser.add_argument("--filters", nargs="+", default=FILTERS)
+    parser.add_argument("--engines", nargs="+", default=["auto"],
+                        help="filter engines to compare, e.g. direct running_sum")
+    parser.add_argument("--mask-sizes", type=int, nargs="+", default=None)
+    parser.add_argument("--resolutions", nargs="+", default=None, help="WIDTHxHEIGHT, e.g. 1024x1024")
+    parser.add_argument("--block-dims", nargs="+", default=None, help="XxY, e.g. 16x16")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--quick", action="store_true", help="small matrix for smoke runs")
+    parser.add_argument("-o", "--output", default=None, help="write JSON results here")
+    parser.add_argument("--baseline", default=None, help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown (0.10 = 10%%)")
+    args = parser.parse_args()
+
+    backend = resolve_backend(args.backend)
+
+    mask_sizes = args.mask_sizes or (QUICK_MASK_SIZES if args.quick else MASK_SIZES)
+    resolutions = (
+        [tuple(int(v) for v in r.lower().split("x")) for r in args.resolutions]
+        if args.resolutions else (QUICK_RESOLUTIONS if args.quick else RESOLUTIONS)
+    )
+    block_dims = (
+        [tuple(int(v) for v in b.lower().split("x")) for b in args.block_dims]
+        if args.block_dims else (QUICK_BLOCK_DIMS if args.quick else BLOCK_DIMS)
+    )
+    if backend == "cpu":
+        block_dims = block_dims[:1]  # ignored by the CPU backend
+
+    results = []
+    for width, height in resolutions:
+        png = make_test_png(width, height)
+        for filter_type in args.filters:
+            for mask_size in mask_sizes:
+                for engine, block_dim in itertools.product(args.engines, block_dims):
+                    try:
+                        case = run_case(png, filter_type, mask_size, block_dim, backend,
+                                        args.repeats, args.warmup, engine)
+                    except ValueError:
+                        continue  # engine not available for this filter
+                    results.append(case)
+                    print(f"{case_key(case):55s} decode {case['decode_ms']['median']:8.2f} ms  "
+                          f"compute {case['compute_ms']['median']:8.2f} ms  "
+                          f"encode {case['encode_ms']['median']:8.2f} ms", flush=True)
+
+    report = {
+        "meta": {
+            "backend": backend,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "repeats": args.repeats,
+            "warmup": args.warmup,
+        },
+        "results": results,
+    }
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare_to_baseline(results, baseline, args.threshold)
+        report["regressions"] = regressions
+        for r in regressions:
+            print(f"REGRESSION {r['case']}: {r['baseline_ms']:.2f} -> {r['current_ms']:.2f} ms "
+                  f"(x{r['slowdown']:.2f})")
+        if regressions:
+            exit_code = 1
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
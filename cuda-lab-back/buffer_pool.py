@@ -0,0 +1,309 @@
+# cuda-lab-back/buffer_pool.py
+"""
+Size-class buffer pool shared by the apply_*_cuda filter functions.
+
+Instead of calling cuda.mem_alloc for every buffer of every request (and
+relying on garbage collection to free them), filters lease buffers from a
+pool. Requests are rounded up to a size class (four classes per power of
+two, so at most 25% padding), released buffers are kept for reuse, and the
+total memory held by the pool (leased + idle) is capped. Idle buffers are
+freed (oldest first) when a new allocation would exceed the cap; if it
+still does not fit, the buffer is allocated directly at its exact size and
+freed on release, as before the pool existed, instead of failing the
+request.
+
+The pool only talks to an Allocator, so the PyCUDA device allocator can be
+swapped for FakeDeviceAllocator to exercise pooling without a GPU.
+
+Configuration (environment variables):
+    CUDA_LAB_DEVICE_POOL_MAX_BYTES  device pool cap (default 2 GiB)
+    CUDA_LAB_HOST_POOL_MAX_BYTES    pinned host pool cap (default 512 MiB)
+"""
+
+import os
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+MIN_SIZE_CLASS = 4096
+CLASSES_PER_DOUBLING = 4
+DEFAULT_DEVICE_POOL_MAX_BYTES = 2 * 1024 * 1024 * 1024
+DEFAULT_HOST_POOL_MAX_BYTES = 512 * 1024 * 1024
+
+
+# ---------- Allocators ----------
+
+class Allocator:
+    """Interface between BufferPool and the memory it manages."""
+
+    def alloc(self, nbytes: int):
+        raise NotImplementedError
+
+    def free(self, buf):
+        raise NotImplementedError
+
+
+class PyCudaAllocator(Allocator):
+    """Device memory through cuda.mem_alloc (needs an active CUDA context)."""
+
+    def alloc(self, nbytes: int):
+        import pycuda.driver as cuda
+        return cuda.mem_alloc(nbytes)
+
+    def free(self, buf):
+        buf.free()
+
+
+class PinnedHostAllocator(Allocator):
+    """Page-locked host staging memory (faster device <-> host copies)."""
+
+    def alloc(self, nbytes: int):
+        import pycuda.driver as cuda
+        return cuda.pagelocked_empty(nbytes, dtype=np.uint8)
+
+    def free(self, buf):
+        buf.base.free()
+
+
+class FakeDeviceAllocator(Allocator):
+    """In-memory stand-in for device memory, with allocation counters."""
+
+    def __init__(self):
+        self.allocs = 0
+        self.frees = 0
+        self.live = 0
+
+    def alloc(self, nbytes: int):
+        self.allocs += 1
+        self.live += 1
+        return bytearray(nbytes)
+
+    def free(self, buf):
+        self.frees += 1
+        self.live -= 1
+
+
+# ---------- Pool ----------
+
+def size_class(nbytes: int) -> int:
+    """
+    Round nbytes up to its size class (at least MIN_SIZE_CLASS).
+
+    Classes split each power-of-two range into CLASSES_PER_DOUBLING equal
+    steps (e.g. 8K, 10K, 12K, 14K, 16K), so padding stays under 25%.
+    """
+    n = max(int(nbytes), MIN_SIZE_CLASS)
+    upper = 1 << (n - 1).bit_length()
+    step = max(upper // (2 * CLASSES_PER_DOUBLING), 1)
+    return -(-n // step) * step
+
+
+class Lease:
+    """A buffer borrowed from a BufferPool; return it with release()."""
+
+    __slots__ = ("pool", "buffer", "nbytes", "size_class", "pooled", "_released")
+
+    def __init__(self, pool: "BufferPool", buffer, nbytes: int, cls: int, pooled: bool = True):
+        self.pool = pool
+        self.buffer = buffer
+        self.nbytes = nbytes
+        self.size_class = cls
+        self.pooled = pooled  # False: direct allocation over the cap, freed on release
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.pool._release(self)
+
+    def __enter__(self):
+        return self.buffer
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class LeaseGroup:
+    """Collects several leases and releases them together on exit."""
+
+    def __init__(self, pool: "BufferPool"):
+        self.pool = pool
+        self._leases: List[Lease] = []
+
+    def alloc(self, nbytes: int):
+        lease = self.pool.acquire(nbytes)
+        self._leases.append(lease)
+        return lease.buffer
+
+    def release(self):
+        while self._leases:
+            self._leases.pop().release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class BufferPool:
+    """Thread-safe size-class pool with a memory cap and usage stats."""
+
+    def __init__(self, allocator: Allocator, max_bytes: Optional[int] = None):
+        self.allocator = allocator
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Idle buffers per size class, keyed by id() (buffers may compare equal)
+        self._free: Dict[int, OrderedDict] = defaultdict(OrderedDict)
+        self._idle_order: OrderedDict = OrderedDict()  # id -> size_class, oldest first
+        self._live_bytes = 0
+        self._pooled_bytes = 0
+        self._overflow_bytes = 0
+        self._high_water = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "overflows": 0}
+
+    def acquire(self, nbytes: int) -> Lease:
+        cls = size_class(nbytes)
+        direct = False
+        with self._lock:
+            free_list = self._free[cls]
+            if free_list:
+                key, buf = free_list.popitem()  # most recently released
+                del self._idle_order[key]
+                self._pooled_bytes -= cls
+                self._stats["hits"] += 1
+            elif self._make_room(cls):
+                buf = None
+                self._stats["misses"] += 1
+            else:
+                # Over the cap even with no idle buffers: allocate exactly what
+                # was asked for, outside the pool, rather than fail the request
+                direct = True
+                cls = max(int(nbytes), 1)
+                self._overflow_bytes += cls
+                self._stats["overflows"] += 1
+
+            if not direct:
+                self._live_bytes += cls
+                self._high_water = max(self._high_water, self._live_bytes)
+
+        if direct:
+            return self._direct_lease(nbytes, cls)
+
+        if buf is None:
+            try:
+                buf = self.allocator.alloc(cls)
+            except BaseException:
+                with self._lock:
+                    self._live_bytes -= cls
+                raise
+
+        return Lease(self, buf, int(nbytes), cls)
+
+    def _direct_lease(self, nbytes: int, size: int) -> Lease:
+        try:
+            buf = self.allocator.alloc(size)
+        except BaseException:
+            with self._lock:
+                self._overflow_bytes -= size
+            raise
+        return Lease(self, buf, int(nbytes), size, pooled=False)
+
+    def leases(self) -> LeaseGroup:
+        """Context manager handing out buffers that are all released on exit."""
+        return LeaseGroup(self)
+
+    def _make_room(self, cls: int) -> bool:
+        """Free idle buffers until cls more bytes fit under the cap (lock held); False if they can't."""
+        if self.max_bytes is None:
+            return True
+
+        while self._live_bytes + self._pooled_bytes + cls > self.max_bytes and self._idle_order:
+            key, old_cls = self._idle_order.popitem(last=False)
+            buf = self._free[old_cls].pop(key)
+            self._pooled_bytes -= old_cls
+            self._stats["evictions"] += 1
+            self.allocator.free(buf)
+
+        return self._live_bytes + self._pooled_bytes + cls <= self.max_bytes
+
+    def _release(self, lease: Lease):
+        if not lease.pooled:
+            self.allocator.free(lease.buffer)
+            with self._lock:
+                self._overflow_bytes -= lease.size_class
+            return
+
+        with self._lock:
+            self._live_bytes -= lease.size_class
+            key = id(lease.buffer)
+            self._free[lease.size_class][key] = lease.buffer
+            self._idle_order[key] = lease.size_class
+            self._pooled_bytes += lease.size_class
+
+    def trim(self):
+        """Free every idle buffer held by the pool."""
+        with self._lock:
+            while self._idle_order:
+                key, cls = self._idle_order.popitem(last=False)
+                buf = self._free[cls].pop(key)
+                self._pooled_bytes -= cls
+                self.allocator.free(buf)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "live_bytes": self._live_bytes,
+                "pooled_bytes": self._pooled_bytes,
+                "overflow_bytes": self._overflow_bytes,
+                "high_water_bytes": self._high_water,
+                "max_bytes": self.max_bytes or 0,
+                **self._stats,
+            }
+
+
+# ---------- Process-wide pools ----------
+
+_device_pool: Optional[BufferPool] = None
+_host_pool: Optional[BufferPool] = None
+_pools_lock = threading.Lock()
+
+
+def get_device_pool() -> BufferPool:
+    """Pool of device buffers (PyCUDA allocator unless replaced)."""
+    global _device_pool
+    with _pools_lock:
+        if _device_pool is None:
+            _device_pool = BufferPool(
+                PyCudaAllocator(),
+                int(os.environ.get("CUDA_LAB_DEVICE_POOL_MAX_BYTES", DEFAULT_DEVICE_POOL_MAX_BYTES)),
+            )
+        return _device_pool
+
+
+def get_host_pool() -> BufferPool:
+    """Pool of pinned host staging buffers (numpy uint8 arrays)."""
+    global _host_pool
+    with _pools_lock:
+        if _host_pool is None:
+            _host_pool = BufferPool(
+                PinnedHostAllocator(),
+                int(os.environ.get("CUDA_LAB_HOST_POOL_MAX_BYTES", DEFAULT_HOST_POOL_MAX_BYTES)),
+            )
+        return _host_pool
+
+
+def set_device_pool(pool: Optional[BufferPool]):
+    """Replace the device pool (e.g. with a FakeDeviceAllocator-backed one)."""
+    global _device_pool
+    with _pools_lock:
+        _device_pool = pool
+
+
+def set_host_pool(pool: Optional[BufferPool]):
+    """Replace the host staging pool."""
+    global _host_pool
+    with _pools_lock:
+        _host_pool = pool
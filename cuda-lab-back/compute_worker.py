@@ -0,0 +1,296 @@
+# cuda-lab-back/compute_worker.py
+"""
+Dedicated compute worker behind the async endpoints.
+
+The CUDA context is created by whichever thread first calls into the
+filters, so all compute runs on one owned executor thread instead of
+FastAPI's shared threadpool. Endpoints put jobs on a bounded asyncio queue
+and await a future; a dispatcher coroutine pulls jobs off the queue and
+hands them to the executor thread as soon as one is free.
+
+Micro-batching: jobs submitted with submit_batched() carry a batch key
+(image shape and filter parameters). When one reaches the front, the
+dispatcher waits up to batch_window_ms for more, takes every queued job
+with the same key (up to max_batch) and hands them to one batch function
+call, which filters them all in a single grouped launch (see
+convolution_service.process_convolution_batch). Jobs with other keys keep
+their place in line.
+
+With a multi-process worker pool (CUDA_LAB_WORKERS > 0) the filters run in
+the pool and the executor gets one thread per pool worker, which only
+decode, encode and wait on the pool.
+
+Configuration (environment variables):
+    CUDA_LAB_QUEUE_MAX        queued jobs before requests are rejected (default 64)
+    CUDA_LAB_BATCH_WINDOW_MS  micro-batching window (default 2, 0 = only already queued jobs)
+    CUDA_LAB_MAX_BATCH        jobs per grouped launch (default 8, 1 disables batching)
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Deque, Dict, Hashable, Iterator, List, Optional
+
+DEFAULT_QUEUE_MAX = 64
+DEFAULT_BATCH_WINDOW_MS = 2.0
+DEFAULT_MAX_BATCH = 8
+
+_END = object()
+
+
+class WorkerBusyError(RuntimeError):
+    """Raised when the request queue is full (mapped to HTTP 503)."""
+
+
+class _Job:
+    __slots__ = ("fn", "args", "batch_key", "future", "enqueued_at")
+
+    def __init__(self, fn: Callable, args: tuple, batch_key: Optional[Hashable], future: asyncio.Future):
+        self.fn = fn
+        self.args = args
+        self.batch_key = batch_key
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+def _set_result(future: asyncio.Future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_exception(future: asyncio.Future, exc: BaseException):
+    if not future.done():
+        future.set_exception(exc)
+
+
+class ComputeWorker:
+    """Executor thread(s) fed by a bounded asyncio queue, with micro-batching."""
+
+    def __init__(
+        self,
+        max_queue: int = DEFAULT_QUEUE_MAX,
+        threads: int = 1,
+        batch_window_ms: float = DEFAULT_BATCH_WINDOW_MS,
+        max_batch: int = DEFAULT_MAX_BATCH,
+    ):
+        self.max_queue = max_queue
+        self.threads = max(threads, 1)
+        self.batch_window_s = max(batch_window_ms, 0.0) / 1000.0
+        self.max_batch = max(max_batch, 1)
+
+        self._queue: Optional[asyncio.Queue] = None
+        # Jobs pulled off the queue while collecting a batch, still in arrival order
+        self._held: Deque[_Job] = deque()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._running = 0
+
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "batches": 0,        # grouped launches (more than one job)
+            "batched_jobs": 0,   # jobs that ran in one
+            "max_batch_size": 0,
+            "wait_ms_total": 0.0,
+            "wait_ms_max": 0.0,
+        }
+
+    # ---------- lifecycle ----------
+
+    def start(self):
+        """Create the queue, executor thread and dispatcher on the running loop."""
+        if self._dispatcher is not None and not self._dispatcher.done():
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._slots = asyncio.Semaphore(self.threads)
+        self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="cuda-lab-compute")
+        self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+
+    async def stop(self):
+        """Stop dispatching, fail queued jobs and shut the executor thread down."""
+        if self._dispatcher is None:
+            return
+        self._dispatcher.cancel()
+        try:
+            await self._dispatcher
+        except asyncio.CancelledError:
+            pass
+
+        while not self._queue.empty():
+            self._held.append(self._queue.get_nowait())
+        while self._held:
+            job = self._held.popleft()
+            _set_exception(job.future, WorkerBusyError("Compute worker is shutting down"))
+
+        self._executor.shutdown(wait=False)
+        self._dispatcher = None
+        self._executor = None
+        self._queue = None
+
+    # ---------- submission ----------
+
+    async def submit(self, fn: Callable, *args):
+        """
+        Run fn(*args) on the compute thread and return its result.
+
+        Args:
+            fn: Blocking function (decode + filter + encode)
+
+        Raises:
+            WorkerBusyError: If the queue is full
+            Whatever fn raises
+        """
+        return await self._enqueue(fn, args, None)
+
+    async def submit_batched(self, batch_fn: Callable, item, batch_key: Hashable):
+        """
+        Run batch_fn([item, ...]) on the compute thread and return this item's result.
+
+        Queued jobs with an equal batch_key share one batch_fn call.
+
+        Args:
+            batch_fn: Blocking function taking a list of items and returning
+                one result per item, in order; an exception instance in that
+                list fails only its own job
+            item: This job's input
+            batch_key: Jobs may be grouped only when their keys are equal
+
+        Raises:
+            WorkerBusyError: If the queue is full
+            This item's exception, or whatever batch_fn raises
+        """
+        return await self._enqueue(batch_fn, (item,), batch_key)
+
+    async def _enqueue(self, fn: Callable, args: tuple, batch_key: Optional[Hashable]):
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        # Held jobs left the asyncio queue but still count against its bound
+        if self._queue.qsize() + len(self._held) >= self.max_queue:
+            with self._stats_lock:
+                self._stats["rejected"] += 1
+            raise WorkerBusyError(f"Compute queue is full ({self.max_queue} requests waiting)")
+        self._queue.put_nowait(_Job(fn, args, batch_key, future))
+
+        with self._stats_lock:
+            self._stats["submitted"] += 1
+        return await future
+
+    async def iterate(self, gen: Iterator) -> AsyncIterator:
+        """Advance a blocking generator step by step on the compute thread."""
+        while True:
+            item = await self.submit(next, gen, _END)
+            if item is _END:
+                return
+            yield item
+
+    # ---------- dispatch ----------
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Take a job only once an executor thread is free, in arrival order
+            await self._slots.acquire()
+            job = self._held.popleft() if self._held else await self._queue.get()
+
+            batch = [job]
+            if job.batch_key is not None and self.max_batch > 1:
+                # Give same-key jobs a short window to arrive, then group them
+                if self.batch_window_s > 0:
+                    await asyncio.sleep(self.batch_window_s)
+                batch += self._take_same_key(job.batch_key, self.max_batch - 1)
+
+            self._running += len(batch)
+            hop = loop.run_in_executor(self._executor, self._run_batch, batch, loop)
+            hop.add_done_callback(lambda _, n=len(batch): self._hop_done(n))
+
+    def _take_same_key(self, batch_key: Hashable, limit: int) -> List[_Job]:
+        """Remove up to limit waiting jobs with batch_key; the rest keep their order."""
+        while not self._queue.empty():
+            self._held.append(self._queue.get_nowait())
+
+        taken: List[_Job] = []
+        kept: Deque[_Job] = deque()
+        for job in self._held:
+            if len(taken) < limit and job.batch_key == batch_key:
+                taken.append(job)
+            else:
+                kept.append(job)
+        self._held = kept
+        return taken
+
+    def _hop_done(self, jobs: int):
+        self._running -= jobs
+        self._slots.release()
+
+    def _run_batch(self, batch: List[_Job], loop: asyncio.AbstractEventLoop):
+        """Runs on the compute thread: one plain job, or one batch_fn call for a group."""
+        jobs = [job for job in batch if not job.future.cancelled()]  # clients gone while queued
+        if not jobs:
+            return
+        now = time.perf_counter()
+        waits = [(now - job.enqueued_at) * 1000.0 for job in jobs]
+
+        if jobs[0].batch_key is None:
+            try:
+                outcomes = [(True, jobs[0].fn(*jobs[0].args))]
+            except BaseException as e:
+                outcomes = [(False, e)]
+        else:
+            try:
+                results = jobs[0].fn([job.args[0] for job in jobs])
+                outcomes = [(not isinstance(r, BaseException), r) for r in results]
+            except BaseException as e:
+                outcomes = [(False, e)] * len(jobs)
+
+        with self._stats_lock:
+            for ok, _ in outcomes:
+                self._stats["completed" if ok else "failed"] += 1
+            if len(jobs) > 1:
+                self._stats["batches"] += 1
+                self._stats["batched_jobs"] += len(jobs)
+                self._stats["max_batch_size"] = max(self._stats["max_batch_size"], len(jobs))
+            self._stats["wait_ms_total"] += sum(waits)
+            self._stats["wait_ms_max"] = max([self._stats["wait_ms_max"], *waits])
+
+        for job, (ok, value) in zip(jobs, outcomes):
+            if ok:
+                loop.call_soon_threadsafe(_set_result, job.future, value)
+            else:
+                loop.call_soon_threadsafe(_set_exception, job.future, value)
+
+    # ---------- metrics ----------
+
+    def stats(self) -> Dict[str, float]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        done = stats["completed"] + stats["failed"]
+        stats["wait_ms_avg"] = stats["wait_ms_total"] / done if done else 0.0
+        stats["queue_depth"] = (self._queue.qsize() if self._queue is not None else 0) + len(self._held)
+        stats["queue_max"] = self.max_queue
+        stats["in_flight"] = self._running
+        return stats
+
+
+_worker: Optional[ComputeWorker] = None
+_worker_lock = threading.Lock()
+
+
+def get_compute_worker() -> ComputeWorker:
+    """Process-wide compute worker configured from the environment."""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = ComputeWorker(
+                max_queue=int(os.environ.get("CUDA_LAB_QUEUE_MAX", DEFAULT_QUEUE_MAX)),
+                threads=int(os.environ.get("CUDA_LAB_WORKERS", 0)) or 1,
+                batch_window_ms=float(os.environ.get("CUDA_LAB_BATCH_WINDOW_MS", DEFAULT_BATCH_WINDOW_MS)),
+                max_batch=int(os.environ.get("CUDA_LAB_MAX_BATCH", DEFAULT_MAX_BATCH)),
+            )
+        return _worker
@@ -1,66 +1,535 @@
-from filters import get_filter_kernel
-from image_utils import decode_image_base64, encode_image_base64
-from cuda_kernels import convolve_gpu_single
+import time
+from typing import Dict, Generator, List, Optional, Tuple, Union
 
-def process_convolution_request(payload: dict) -> dict:
-    """Main orchestrator - delegates to each filter implementation."""
-    image_b64 = payload["image_base64"]
-    filter_conf = payload["filter"]
-    cuda_conf = payload["cuda_config"]
+import numpy as np
+
+from autotune import DEFAULT_BLOCK_DIM, BlockDim, parse_block_dim
+from filters import (
+    get_filter_kernel, apply_filter, executed_backend, resolve_backend, plan_custom_kernel, apply_custom_kernel,
+)
+from result_cache import get_result_cache
+from stage_timing import StageTimer
+from tiled_convolution import estimate_working_set, get_memory_budget, tiled_apply_filter
+from image_utils import (
+    check_color_mode,
+    decode_base64_bytes,
+    decode_image_base64,
+    decode_image_bytes,
+    decode_image_npy,
+    encode_image,
+    output_cache_tag,
+    parse_output_options,
+    peek_image_shape_base64,
+    to_data_url,
+)
+
+# Upper bound on images x filters in one /convolve-batch call
+MAX_BATCH_ITEMS = 1024
+
+
+def filter_image(
+    img_np: np.ndarray,
+    filter_conf: dict,
+    block_dim: BlockDim,
+    grid_dim: Tuple[int, int],
+    backend: str,
+    timer: Optional[StageTimer] = None,
+) -> Tuple[np.ndarray, dict]:
+    """
+    Filter an already decoded image; returns (result, response metadata).
+
+    block_dim may be "auto"; the response then reports the autotuned dims.
+    The filter's upload / kernel / download split is added to timer if given.
+    """
+    return filter_images([img_np], filter_conf, block_dim, grid_dim, backend, [timer])[0]
+
+
+def filter_images(
+    images: List[np.ndarray],
+    filter_conf: dict,
+    block_dim: BlockDim,
+    grid_dim: Tuple[int, int],
+    backend: str,
+    timers: Optional[List[Optional[StageTimer]]] = None,
+) -> List[Tuple[np.ndarray, dict]]:
+    """
+    Filter same-shape images in one grouped launch; returns filter_image() output per image.
 
+    Channels are filtered independently, so the images are stacked as the
+    channel planes of one (H, W, sum of C) image and every kernel runs once
+    for all of them (one grid z-slice per plane on CUDA). Each timer gets
+    the shared launch timings.
+
+    Raises:
+        ValueError: If the images do not all have the same height and width
+    """
     filter_type = filter_conf["type"]
     mask_size = int(filter_conf["mask_size"])
     gain = float(filter_conf.get("gain", 8.0))  # Para Prewitt
 
-    block_dim = tuple(cuda_conf["block_dim"])
-    grid_dim = tuple(cuda_conf["grid_dim"])
+    height, width = images[0].shape[:2]
+    if any(img.shape[:2] != (height, width) for img in images):
+        raise ValueError("Grouped images must all have the same height and width")
+    channels = [img.shape[2] if img.ndim == 3 else 1 for img in images]
 
-    img_np = decode_image_base64(image_b64)
-    height, width = img_np.shape
+    if len(images) == 1:
+        stacked = images[0]
+    else:
+        stacked = np.concatenate([img.reshape(height, width, -1) for img in images], axis=2)
 
     # Get filter
-    filter_info = get_filter_kernel(filter_type, mask_size)
+    filter_info = get_filter_kernel(filter_type, mask_size, filter_conf.get("engine", "auto"), backend)
     filter_used = filter_info["type"]
     mask_size_used = filter_info["mask_size_used"]
 
-    # Execute filter based on type
-    if filter_used == "prewitt":
-        # Prewitt has its own complete CUDA function in filters/prewitt.py
-        prewitt_func = filter_info["cuda_function"]
-        result_np, timings = prewitt_func(img_np, block_dim, grid_dim, gain=gain, mask_size=mask_size_used)
-    elif filter_used == "laplacian":
-        # Laplacian has its own complete CUDA function in filters/laplacian.py
-        laplacian_func = filter_info["cuda_function"]
-        result_np, timings = laplacian_func(img_np, block_dim, grid_dim, mask_size=mask_size_used)
-    elif filter_used == "gaussian":
-        # Gaussian has its own complete CUDA function in filters/gaussian.py
-        gaussian_func = filter_info["cuda_function"]
-        result_np, timings = gaussian_func(img_np, block_dim, grid_dim, mask_size=mask_size_used)
-    elif filter_used == "box_blur":
-        # Box Blur has its own complete CUDA function in filters/box_blur.py
-        box_blur_func = filter_info["cuda_function"]
-        result_np, timings = box_blur_func(img_np, block_dim, grid_dim, mask_size=mask_size_used)
+    # Each filter has its own complete CUDA and CPU implementation in filters/.
+    # Images whose working set exceeds the memory budget are processed in tiles
+    # (bit-identical output).
+    tiled = estimate_working_set(filter_used, height, width, sum(channels)) > get_memory_budget()
+    run = tiled_apply_filter if tiled else apply_filter
+    result_np, timings = run(
+        filter_info, stacked, block_dim, grid_dim, gain=gain, backend=backend
+    )
+    for timer in timers or ():
+        if timer is not None:
+            timer.add_filter(timings)
+
+    outputs = []
+    offset = 0
+    for img, c in zip(images, channels):
+        if len(images) == 1:
+            part = result_np
+        elif img.ndim == 2:
+            part = np.ascontiguousarray(result_np[:, :, offset])
+        else:
+            part = np.ascontiguousarray(result_np[:, :, offset:offset + c])
+        offset += c
+        outputs.append((part, {
+            "status": "ok",
+            "execution_time_ms": float(timings.get("execution_time_ms", 0.0)),
+            "kernel_time_ms": float(timings.get("kernel_time_ms", 0.0)),
+            "image_width": width,
+            "image_height": height,
+            "channels": c,
+            "filter_used": filter_used,
+            "mask_size_used": mask_size_used,
+            "engine_used": filter_info["engine"],
+            "block_dim": list(timings.get("block_dim", block_dim)),
+            "grid_dim": list(grid_dim),
+            "backend_used": executed_backend(filter_info, backend),
+            "tiled": tiled,
+        }))
+    return outputs
+
+
+def encode_result(
+    result_np: np.ndarray,
+    output: Optional[dict],
+    timer: Optional[StageTimer] = None,
+) -> Tuple[bytes, str, dict]:
+    """
+    Encode a filter result with parse_output_options() options.
+
+    Returns:
+        (encoded_bytes, media_type, info) where info holds output_format,
+        encoded_bytes (size before base64) and encode_ms for the response
+    """
+    output = output or parse_output_options()
+    start = time.perf_counter()
+    content, media_type = encode_image(result_np, output)
+    encode_ms = (time.perf_counter() - start) * 1000.0
+    if timer is not None:
+        timer.add("encode", encode_ms)
+    return content, media_type, {
+        "output_format": output["format"],
+        "encoded_bytes": len(content),
+        "encode_ms": encode_ms,
+    }
+
+
+def convolve_image(
+    img_np: np.ndarray,
+    filter_conf: dict,
+    block_dim: BlockDim,
+    grid_dim: Tuple[int, int],
+    backend: str,
+    timer: Optional[StageTimer] = None,
+    output: Optional[dict] = None,
+) -> dict:
+    """Filter an already decoded image and build the /convolve response."""
+    if timer is None:
+        timer = StageTimer()
+    result_np, meta = filter_image(img_np, filter_conf, block_dim, grid_dim, backend, timer)
+
+    # Encode result
+    content, media_type, encoding = encode_result(result_np, output, timer)
+    return _with_stages({
+        "result_image_base64": to_data_url(content, media_type), **meta, **encoding
+    }, timer)
+
+
+def _with_stages(response: dict, timer: StageTimer) -> dict:
+    """Attach stage_timings_ms (dropped when stage timing is disabled)."""
+    stages = timer.as_dict()
+    if stages:
+        response["stage_timings_ms"] = stages
     else:
-        # Fallback to generic kernel (should not happen)
-        result_np, timings = convolve_gpu_single(
-            img_np,
-            filter_info["kernel"],
-            block_dim,
-            grid_dim,
+        response.pop("stage_timings_ms", None)
+    return response
+
+
+def convolution_batch_key(payload: dict) -> Optional[tuple]:
+    """
+    Micro-batching key of a /convolve payload (see ComputeWorker.submit_batched).
+
+    Requests with equal keys have the same image shape and filter settings,
+    so process_convolution_batch() can filter them in one grouped launch.
+    None if the image header cannot be read (the request then runs alone).
+    """
+    shape = peek_image_shape_base64(payload["image_base64"])
+    if shape is None:
+        return None
+    filter_conf = payload["filter"]
+    return (
+        shape, filter_conf["type"], int(filter_conf["mask_size"]), float(filter_conf.get("gain", 8.0)),
+        filter_conf.get("engine", "auto"), str(payload["cuda_config"]["block_dim"]),
+        payload.get("backend", "auto"), payload.get("color_mode", "grayscale"),
+    )
+
+
+def process_convolution_request(payload: dict) -> dict:
+    """Main orchestrator - delegates to each filter implementation."""
+    result = process_convolution_batch([payload])[0]
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def process_convolution_batch(payloads: List[dict]) -> List[Union[dict, Exception]]:
+    """
+    Run several /convolve payloads, filtering same-shape, same-filter ones together.
+
+    Every payload is decoded (or served from the result cache) on its own;
+    the decoded images are then grouped by shape, filter, mask size, engine,
+    block_dim and backend, and each group runs in one filter_images() launch.
+
+    Returns:
+        One entry per payload, in order: the /convolve response, or the
+        exception that request raised (other requests are unaffected)
+    """
+    results: List[Union[dict, Exception, None]] = [None] * len(payloads)
+    groups: Dict[tuple, List[Tuple[int, dict]]] = {}
+    for index, payload in enumerate(payloads):
+        try:
+            request = _open_convolution_request(payload)
+        except Exception as e:
+            results[index] = e
+            continue
+        if "response" in request:
+            results[index] = request["response"]
+        else:
+            groups.setdefault(request["group_key"], []).append((index, request))
+
+    for members in groups.values():
+        first = members[0][1]
+        try:
+            outputs = filter_images(
+                [request["img_np"] for _, request in members], first["filter_conf"],
+                first["block_dim"], first["grid_dim"], first["backend"],
+                [request["timer"] for _, request in members],
+            )
+        except Exception as e:
+            for index, _ in members:
+                results[index] = e
+            continue
+
+        for (index, request), (result_np, meta) in zip(members, outputs):
+            try:
+                results[index] = _finish_convolution_request(request, result_np, meta)
+            except Exception as e:
+                results[index] = e
+    return results
+
+
+def _open_convolution_request(payload: dict) -> dict:
+    """
+    Parse and decode one /convolve payload.
+
+    Returns {"response": ...} on a result cache hit, else the request state
+    for filter_images() and _finish_convolution_request().
+    """
+    timer = StageTimer()
+    image_b64 = payload["image_base64"]
+    filter_conf = payload["filter"]
+    cuda_conf = payload["cuda_config"]
+
+    block_dim = parse_block_dim(cuda_conf["block_dim"])  # [x, y] or "auto"
+    grid_dim = tuple(cuda_conf["grid_dim"])
+
+    # "cuda", "cpu" or "auto" (CUDA if a device is available, else CPU)
+    backend = resolve_backend(payload.get("backend", "auto"))
+    # "grayscale" (default) or "rgb": all channels filtered in one pass, one color PNG back
+    color_mode = check_color_mode(payload.get("color_mode", "grayscale"))
+    output = parse_output_options(payload.get("output"))
+
+    filter_info = get_filter_kernel(
+        filter_conf["type"], int(filter_conf["mask_size"]), filter_conf.get("engine", "auto"), backend
+    )
+    gain = float(filter_conf.get("gain", 8.0)) if filter_info["type"] == "prewitt" else 0.0
+
+    with timer.stage("decode"):
+        img_bytes = decode_base64_bytes(image_b64)
+
+    # Same image + same output-affecting params -> serve the encoded result
+    cache = get_result_cache()
+    key = None
+    if cache is not None:
+        key = cache.make_key(
+            img_bytes, filter_info["type"], filter_info["mask_size_used"], gain, color_mode,
+            output_cache_tag(output), filter_info["engine"], backend,
         )
+        with timer.stage("cache"):
+            cached = cache.get(key)
+        if cached is not None:
+            return {"response": _with_stages({
+                **cached,
+                # "auto" keeps the dims that produced the cached result
+                "block_dim": cached["block_dim"] if block_dim == "auto" else list(block_dim),
+                "grid_dim": list(grid_dim),
+                "encode_ms": 0.0,
+                "cached": True,
+            }, timer)}
 
-    # Encode result
-    result_b64 = encode_image_base64(result_np)
+    with timer.stage("decode"):
+        img_np = decode_image_bytes(img_bytes, color_mode)
 
     return {
+        "timer": timer,
+        "filter_conf": filter_conf,
+        "block_dim": block_dim,
+        "grid_dim": grid_dim,
+        "backend": backend,
+        "output": output,
+        "img_np": img_np,
+        "cache_key": key,
+        "group_key": (
+            img_np.shape[:2], filter_info["type"], filter_info["mask_size_used"], gain,
+            filter_info["engine"], str(block_dim), backend,
+        ),
+    }
+
+
+def _finish_convolution_request(request: dict, result_np: np.ndarray, meta: dict) -> dict:
+    """Encode a filtered /convolve result, build the response and cache it."""
+    timer = request["timer"]
+    content, media_type, encoding = encode_result(result_np, request["output"], timer)
+    response = _with_stages({
+        "result_image_base64": to_data_url(content, media_type), **meta, **encoding
+    }, timer)
+    response["cached"] = False
+
+    cache = get_result_cache()
+    if cache is not None and request["cache_key"] is not None:
+        cache.put(request["cache_key"], response)
+
+    return response
+
+
+def process_binary_convolution_request(
+    body: bytes,
+    content_type: str,
+    filter_conf: dict,
+    block_dim: Tuple[int, int],
+    grid_dim: Tuple[int, int],
+    backend: str = "auto",
+    output: Union[str, dict] = "png",
+    color_mode: str = "grayscale",
+) -> Tuple[bytes, str, dict]:
+    """
+    /convolve for raw binary bodies: no base64 and no JSON on either side.
+
+    Args:
+        body: Encoded image bytes (PNG, JPEG, ...) or a .npy array
+        content_type: Request Content-Type; "application/x-npy" selects NPY input
+            ((H, W) or (H, W, C) arrays, color_mode does not apply)
+        output: Format name or encoding options (see parse_output_options())
+        color_mode: "grayscale" or "rgb" for encoded images
+
+    Returns:
+        (result_bytes, media_type, metadata) where metadata is the /convolve
+        response without the image
+    """
+    output = parse_output_options(output)
+
+    timer = StageTimer()
+    backend = resolve_backend(backend)
+    color_mode = check_color_mode(color_mode)
+
+    with timer.stage("decode"):
+        if (content_type or "").split(";")[0].strip() == "application/x-npy":
+            img_np = decode_image_npy(body)
+        else:
+            img_np = decode_image_bytes(body, color_mode)
+
+    result_np, meta = filter_image(img_np, filter_conf, block_dim, grid_dim, backend, timer)
+
+    content, media_type, encoding = encode_result(result_np, output, timer)
+    return content, media_type, _with_stages({**meta, **encoding}, timer)
+
+
+def process_custom_kernel_request(payload: dict) -> dict:
+    """
+    /convolve-custom: apply a user-supplied NxN kernel.
+
+    The kernel's SVD rank picks the path (one row + column pass, a few such
+    passes, or the dense loop); the response reports the path and why.
+    block_dim "auto" uses the default dims (one-off kernels are not tuned).
+    """
+    timer = StageTimer()
+    cuda_conf = payload["cuda_config"]
+    block_dim = parse_block_dim(cuda_conf["block_dim"])
+    if block_dim == "auto":
+        block_dim = DEFAULT_BLOCK_DIM
+    grid_dim = tuple(cuda_conf["grid_dim"])
+    backend = resolve_backend(payload.get("backend", "auto"))
+    color_mode = check_color_mode(payload.get("color_mode", "grayscale"))
+    output = parse_output_options(payload.get("output"))
+
+    plan = plan_custom_kernel(
+        payload["kernel"], payload.get("max_rank", 3), payload.get("rank_tolerance", 1e-5)
+    )
+
+    with timer.stage("decode"):
+        img_np = decode_image_base64(payload["image_base64"], color_mode)
+    height, width = img_np.shape[:2]
+
+    result_np, timings = apply_custom_kernel(
+        plan, img_np, block_dim, backend, payload.get("postprocess", "clip")
+    )
+    timer.add_filter(timings)
+
+    content, media_type, encoding = encode_result(result_np, output, timer)
+
+    return _with_stages({
         "status": "ok",
-        "result_image_base64": result_b64,
+        "result_image_base64": to_data_url(content, media_type),
         "execution_time_ms": float(timings.get("execution_time_ms", 0.0)),
         "kernel_time_ms": float(timings.get("kernel_time_ms", 0.0)),
         "image_width": width,
         "image_height": height,
-        "filter_used": filter_used,
-        "mask_size_used": mask_size_used,
+        "channels": img_np.shape[2] if img_np.ndim == 3 else 1,
+        "mask_size_used": plan["mask_size"],
+        "path": plan["path"],
+        "path_reason": plan["reason"],
+        "rank": plan["rank"],
+        "singular_values": plan["singular_values"],
+        "reconstruction_error": plan["reconstruction_error"],
         "block_dim": list(block_dim),
         "grid_dim": list(grid_dim),
+        "backend_used": backend,
+        **encoding,
+    }, timer)
+
+
+def iter_batch_convolution(payload: dict) -> Generator[dict, None, None]:
+    """
+    Validate a batch and return a generator over its results, in completion order.
+
+    Each image is decoded once, when its turn comes, and dropped after its
+    filters ran, so only one decoded image is held at a time. Filters are
+    grouped by (filter, mask_size) so the same compiled module and pooled
+    buffers are reused back to back. Every
+    result carries image_index / filter_index; decode or filter errors are
+    reported per item instead of failing the whole batch.
+
+    Raises:
+        ValueError: If the batch is empty, too large, or a filter config is invalid
+    """
+    images: List[str] = payload["images"]
+    filters: List[dict] = payload["filters"]
+    cuda_conf = payload["cuda_config"]
+
+    if not images or not filters:
+        raise ValueError("Batch needs at least one image and one filter")
+    if len(images) * len(filters) > MAX_BATCH_ITEMS:
+        raise ValueError(
+            f"Batch too large: {len(images)} images x {len(filters)} filters "
+            f"exceeds {MAX_BATCH_ITEMS} items"
+        )
+
+    block_dim = parse_block_dim(cuda_conf["block_dim"])
+    grid_dim = tuple(cuda_conf["grid_dim"])
+    backend = resolve_backend(payload.get("backend", "auto"))
+    color_mode = check_color_mode(payload.get("color_mode", "grayscale"))
+    output = parse_output_options(payload.get("output"))
+
+    # Validate every filter up front and group identical (type, mask_size, engine)
+    groups: Dict[Tuple[str, int, str], List[int]] = {}
+    for f_idx, filter_conf in enumerate(filters):
+        info = get_filter_kernel(
+            filter_conf["type"], int(filter_conf["mask_size"]), filter_conf.get("engine", "auto"), backend
+        )
+        groups.setdefault((info["type"], info["mask_size_used"], info["engine"]), []).append(f_idx)
+
+    # Validation above runs eagerly; the work itself is lazy
+    return _run_batch(images, filters, groups, block_dim, grid_dim, backend, color_mode, output)
+
+
+def _run_batch(
+    images: List[str],
+    filters: List[dict],
+    groups: Dict[Tuple[str, int, str], List[int]],
+    block_dim: BlockDim,
+    grid_dim: Tuple[int, int],
+    backend: str,
+    color_mode: str,
+    output: dict,
+) -> Generator[dict, None, None]:
+    # Images are decoded one at a time and released before the next one, so
+    # peak memory is one decoded image regardless of batch size. Within an
+    # image, filters run in group order so identical (type, mask_size, engine)
+    # configs reuse the compiled module and pooled buffers back to back.
+    order = [f_idx for filter_indices in groups.values() for f_idx in filter_indices]
+    for i_idx, image_b64 in enumerate(images):
+        start = time.perf_counter()
+        try:
+            img_np = decode_image_base64(image_b64, color_mode)
+        except Exception as e:
+            for f_idx in range(len(filters)):
+                yield {
+                    "status": "error",
+                    "image_index": i_idx,
+                    "filter_index": f_idx,
+                    "detail": f"Invalid image: {e}",
+                }
+            continue
+        decode_ms = (time.perf_counter() - start) * 1000.0
+
+        for f_idx in order:
+            timer = StageTimer()
+            timer.add("decode", decode_ms)
+            try:
+                result = convolve_image(
+                    img_np, filters[f_idx], block_dim, grid_dim, backend, timer, output
+                )
+            except (ValueError, RuntimeError) as e:
+                result = {"status": "error", "detail": str(e)}
+            result["image_index"] = i_idx
+            result["filter_index"] = f_idx
+            yield result
+        del img_np
+
+
+def process_batch_convolution_request(payload: dict) -> dict:
+    """Run a whole batch and return the results ordered by (image_index, filter_index)."""
+    start = time.perf_counter()
+    results = list(iter_batch_convolution(payload))
+    results.sort(key=lambda r: (r["image_index"], r["filter_index"]))
+
+    return {
+        "status": "ok",
+        "results": results,
+        "total_items": len(results),
+        "failed_items": sum(1 for r in results if r["status"] != "ok"),
+        "total_time_ms": (time.perf_counter() - start) * 1000.0,
     }
@@ -9,48 +9,82 @@ import numpy as np
 import os
 import subprocess
 import tempfile
+import threading
+import time
 
 # Lazy imports de CUDA
 CUDA_AVAILABLE = None
 CUDA_ERROR = None
 _cuda_initialized = False
+# The context binds to the thread that creates it, so only one thread may try
+_cuda_init_lock = threading.Lock()
+
+# PTX ya compilado en este proceso, por (código fuente, arch); lo llena el
+# warm-up (compilaciones en paralelo) aunque el cache en disco esté desactivado
+_ptx_memo: Dict[Tuple[str, str], str] = {}
 
 
 def compile_cuda_kernel_to_ptx(kernel_source, arch="sm_89"):
     """
     Compilar kernel CUDA usando nvcc directamente (bypass PyCUDA auto-detection)
+    
+    El PTX resultante se guarda en un cache persistente en disco (ptx_cache.py),
+    indexado por hash del código fuente, arquitectura y versión de nvcc, de modo
+    que los workers y reinicios posteriores no vuelven a invocar nvcc.
+    
     Args:
         kernel_source (str): Código fuente del kernel CUDA
         arch (str): Arquitectura CUDA (sm_89 para RTX 5070 Ti)
     Returns:
         str: Código PTX compilado
     """
+    from ptx_cache import get_ptx_cache, get_nvcc_version
+    
+    ptx_code = _ptx_memo.get((kernel_source, arch))
+    if ptx_code is not None:
+        return ptx_code
+    
+    cache = get_ptx_cache()
+    if cache is not None:
+        key = cache.make_key(kernel_source, arch, get_nvcc_version())
+        ptx_code = cache.get(key)
+    
+    if ptx_code is None:
+        ptx_code = _run_nvcc_to_ptx(kernel_source, arch)
+        if cache is not None:
+            cache.put(key, ptx_code)
+    
+    _ptx_memo[(kernel_source, arch)] = ptx_code
+    return ptx_code
+
+
+def _run_nvcc_to_ptx(kernel_source, arch):
+    """Invocar nvcc sobre archivos temporales y devolver el PTX generado."""
     # Crear archivo temporal para el código CUDA
     with tempfile.NamedTemporaryFile(mode='w', suffix='.cu', delete=False) as f:
         f.write(kernel_source)
         cu_file = f.name
     
     # Compilar a PTX usando nvcc
-    ptx_file = cu_file.replace('.cu', '.ptx')
+    ptx_file = cu_file[:-len('.cu')] + '.ptx'
     cmd = ['nvcc', f'-arch={arch}', '--ptx', cu_file, '-o', ptx_file]
     
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    
-    if result.returncode != 0:
-        # Limpiar archivo temporal en caso de error
-        try:
-            os.unlink(cu_file)
-        except:
-            pass
-        raise Exception(f"CUDA compilation failed: {result.stderr}")
-    
-    # Leer el PTX generado
-    with open(ptx_file, 'r') as f:
-        ptx_code = f.read()
-    
-    # Limpiar archivos temporales
-    os.unlink(cu_file)
-    os.unlink(ptx_file)
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        
+        if result.returncode != 0:
+            raise Exception(f"CUDA compilation failed: {result.stderr}")
+        
+        # Leer el PTX generado
+        with open(ptx_file, 'r') as f:
+            ptx_code = f.read()
+    finally:
+        # Limpiar archivos temporales
+        for path in (cu_file, ptx_file):
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
     
     return ptx_code
 
@@ -111,17 +145,26 @@ def _initialize_cuda():
     if _cuda_initialized:
         return
     
-    try:
-        import pycuda.driver as drv
-        drv.init()
-        global _cuda_context
-        _cuda_context = drv.Device(0).make_context()
-        CUDA_AVAILABLE = True
-        _cuda_initialized = True
-    except Exception as e:
-        CUDA_AVAILABLE = False
-        CUDA_ERROR = str(e)
-        _cuda_initialized = True
+    with _cuda_init_lock:
+        if _cuda_initialized:
+            return
+        try:
+            import pycuda.driver as drv
+            drv.init()
+            global _cuda_context
+            _cuda_context = drv.Device(0).make_context()
+            CUDA_AVAILABLE = True
+            _cuda_initialized = True
+        except Exception as e:
+            CUDA_AVAILABLE = False
+            CUDA_ERROR = str(e)
+            _cuda_initialized = True
+
+
+def is_cuda_available() -> bool:
+    """Return True if a CUDA device could be initialized (lazy)."""
+    _initialize_cuda()
+    return bool(CUDA_AVAILABLE)
 
 
 def _ensure_cuda_compiled():
@@ -147,6 +190,32 @@ def _ensure_cuda_compiled():
             )
 
 
+def timed_copy(copy, dst, src) -> float:
+    """Run a synchronous pycuda memcpy (memcpy_htod / memcpy_dtoh) and return its wall time in ms."""
+    start = time.perf_counter()
+    copy(dst, src)
+    return (time.perf_counter() - start) * 1000.0
+
+
+def to_planes(image: np.ndarray) -> np.ndarray:
+    """
+    (H, W) or (H, W, C) image -> contiguous (C, H, W) channel planes.
+
+    Filter kernels pick their plane with blockIdx.z, so one launch with
+    grid z = C filters every channel.
+    """
+    if image.ndim == 2:
+        return np.ascontiguousarray(image[np.newaxis])
+    return np.ascontiguousarray(np.moveaxis(image, -1, 0))
+
+
+def from_planes(planes: np.ndarray, ndim: int) -> np.ndarray:
+    """Inverse of to_planes for an image that had `ndim` dimensions."""
+    if ndim == 2:
+        return planes[0]
+    return np.moveaxis(planes, 0, -1)
+
+
 def convolve_gpu_single(
     image: np.ndarray,
     kernel: np.ndarray,
@@ -0,0 +1,265 @@
+# cuda-lab-back/filter_graph.py
+"""
+Filter graph executor - runs a small DAG of existing filters on one image.
+
+Instead of chaining /convolve calls (one uint8 PNG encode/decode round-trip
+per step), a graph request describes nodes that each apply one filter to
+either the input image or another node's output. The executor:
+
+- only evaluates nodes needed by the requested outputs,
+- computes structurally identical nodes once (same filter parameters on the
+  same input, e.g. a single Gaussian feeding several consumers),
+- keeps intermediates in memory and drops each one after its last consumer,
+- encodes only the requested outputs.
+
+Intermediates are the filters' own float32 results (already quantized to
+uint8 values), so the outputs are identical to chaining /convolve calls.
+"""
+
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from autotune import BlockDim, parse_block_dim
+from filters import get_filter_kernel, apply_filter, executed_backend, resolve_backend
+from convolution_service import encode_result
+from image_utils import check_color_mode, decode_image_base64, parse_output_options, to_data_url
+from stage_timing import StageTimer
+
+INPUT_NODE = "input"
+MAX_GRAPH_NODES = 64
+
+
+def _node_signature(
+    node: dict, by_id: Dict[str, dict], memo: Dict[str, tuple], backend: Optional[str] = None
+) -> tuple:
+    """
+    Canonical (filter params, input signature) tuple used for reuse detection.
+
+    The engine is resolved for `backend` exactly as execution resolves it, so
+    "auto" and the concrete engine it picks on that backend share a signature.
+    """
+    node_id = node["id"]
+    if node_id in memo:
+        return memo[node_id]
+
+    info = get_filter_kernel(
+        node["filter"]["type"], int(node["filter"]["mask_size"]), node["filter"].get("engine", "auto"), backend
+    )
+    gain = float(node["filter"].get("gain", 8.0)) if info["type"] == "prewitt" else 0.0
+
+    src = node.get("input", INPUT_NODE)
+    src_sig = (INPUT_NODE,) if src == INPUT_NODE else _node_signature(by_id[src], by_id, memo, backend)
+
+    sig = (info["type"], info["mask_size_used"], info["engine"], gain, src_sig)
+    memo[node_id] = sig
+    return sig
+
+
+def plan_filter_graph(
+    nodes: List[dict], outputs: List[str], backend: Optional[str] = None
+) -> Tuple[List[dict], Dict[str, str]]:
+    """
+    Validate a graph and compute its execution plan.
+
+    Args:
+        nodes: [{"id", "filter": {"type", "mask_size", "gain", "engine"}, "input"}]
+        outputs: node ids whose results are returned
+        backend: Resolved backend the graph will run on (engine "auto" picks
+                 per backend, see filters.resolve_engine)
+
+    Returns:
+        (steps, alias) where steps are the unique nodes to compute, in
+        dependency order, and alias maps every needed node id to the id of
+        the step that computes its value
+
+    Raises:
+        ValueError: On duplicate/unknown ids, cycles, invalid filters or too many nodes
+    """
+    if not nodes:
+        raise ValueError("Graph needs at least one node")
+    if not outputs:
+        raise ValueError("Graph needs at least one output")
+    if len(nodes) > MAX_GRAPH_NODES:
+        raise ValueError(f"Graph has {len(nodes)} nodes, maximum is {MAX_GRAPH_NODES}")
+
+    by_id: Dict[str, dict] = {}
+    for node in nodes:
+        node_id = node["id"]
+        if node_id == INPUT_NODE:
+            raise ValueError(f"'{INPUT_NODE}' is reserved for the source image")
+        if node_id in by_id:
+            raise ValueError(f"Duplicate node id: {node_id}")
+        by_id[node_id] = node
+
+    for node in nodes:
+        src = node.get("input", INPUT_NODE)
+        if src != INPUT_NODE and src not in by_id:
+            raise ValueError(f"Node '{node['id']}' reads unknown input '{src}'")
+    for out in outputs:
+        if out not in by_id:
+            raise ValueError(f"Unknown output node: {out}")
+
+    # Depth-first topological order of the nodes reachable from the outputs
+    order: List[str] = []
+    state: Dict[str, int] = {}  # 1 = visiting, 2 = done
+
+    def visit(node_id: str):
+        if state.get(node_id) == 2:
+            return
+        if state.get(node_id) == 1:
+            raise ValueError(f"Graph has a cycle through '{node_id}'")
+        state[node_id] = 1
+        src = by_id[node_id].get("input", INPUT_NODE)
+        if src != INPUT_NODE:
+            visit(src)
+        state[node_id] = 2
+        order.append(node_id)
+
+    for out in outputs:
+        visit(out)
+
+    # Common-subexpression elimination: first node with a signature computes it
+    memo: Dict[str, tuple] = {}
+    owner: Dict[tuple, str] = {}
+    alias: Dict[str, str] = {}
+    steps: List[dict] = []
+    for node_id in order:
+        sig = _node_signature(by_id[node_id], by_id, memo, backend)
+        if sig in owner:
+            alias[node_id] = owner[sig]
+            continue
+        owner[sig] = node_id
+        alias[node_id] = node_id
+        steps.append(by_id[node_id])
+
+    return steps, alias
+
+
+def execute_filter_graph(
+    img_np: np.ndarray,
+    nodes: List[dict],
+    outputs: List[str],
+    block_dim: BlockDim,
+    grid_dim: Tuple[int, int],
+    backend: str,
+    timer: Optional[StageTimer] = None,
+) -> Tuple[Dict[str, np.ndarray], List[dict]]:
+    """
+    Run a filter graph on a decoded image (node timings summed into timer if given).
+
+    Returns:
+        (results, node_timings) where results maps each requested output id
+        to its float32 image
+    """
+    steps, alias = plan_filter_graph(nodes, outputs, backend)
+
+    # Remaining consumers per computed value, so intermediates can be freed early
+    remaining: Dict[str, int] = {}
+    for step in steps:
+        src = step.get("input", INPUT_NODE)
+        if src != INPUT_NODE:
+            remaining[alias[src]] = remaining.get(alias[src], 0) + 1
+    keep = {alias[out] for out in outputs}
+
+    values: Dict[str, np.ndarray] = {}
+    node_timings: List[dict] = []
+
+    for step in steps:
+        src = step.get("input", INPUT_NODE)
+        src_img = img_np if src == INPUT_NODE else values[alias[src]]
+
+        filter_conf = step["filter"]
+        filter_info = get_filter_kernel(
+            filter_conf["type"], int(filter_conf["mask_size"]), filter_conf.get("engine", "auto"), backend
+        )
+
+        start = time.perf_counter()
+        result_np, timings = apply_filter(
+            filter_info,
+            src_img,
+            block_dim,
+            grid_dim,
+            gain=float(filter_conf.get("gain", 8.0)),
+            backend=backend,
+        )
+        wall_ms = (time.perf_counter() - start) * 1000.0
+        if timer is not None:
+            timer.add_filter(timings)
+
+        values[step["id"]] = result_np
+        node_timings.append({
+            "id": step["id"],
+            "filter_used": filter_info["type"],
+            "mask_size_used": filter_info["mask_size_used"],
+            "engine_used": filter_info["engine"],
+            "backend_used": executed_backend(filter_info, backend),
+            "input": src,
+            "execution_time_ms": float(timings.get("execution_time_ms", 0.0)),
+            "kernel_time_ms": float(timings.get("kernel_time_ms", 0.0)),
+            "wall_time_ms": wall_ms,
+            "block_dim": list(timings.get("block_dim", block_dim)),
+        })
+
+        if src != INPUT_NODE:
+            remaining[alias[src]] -= 1
+            if remaining[alias[src]] == 0 and alias[src] not in keep:
+                del values[alias[src]]
+
+    # Nodes that were served by an identical earlier node
+    for node_id, owner_id in alias.items():
+        if node_id != owner_id:
+            node_timings.append({"id": node_id, "reused": owner_id})
+
+    results = {out: values[alias[out]] for out in outputs}
+    return results, node_timings
+
+
+def process_filter_graph_request(payload: dict) -> dict:
+    """Decode once, execute the graph, and encode only the requested outputs."""
+    cuda_conf = payload["cuda_config"]
+    block_dim = parse_block_dim(cuda_conf["block_dim"])
+    grid_dim = tuple(cuda_conf["grid_dim"])
+    backend = resolve_backend(payload.get("backend", "auto"))
+    color_mode = check_color_mode(payload.get("color_mode", "grayscale"))
+    output = parse_output_options(payload.get("output"))
+
+    start = time.perf_counter()
+    timer = StageTimer()
+    with timer.stage("decode"):
+        img_np = decode_image_base64(payload["image_base64"], color_mode)
+    height, width = img_np.shape[:2]
+
+    results, node_timings = execute_filter_graph(
+        img_np, payload["nodes"], payload["outputs"], block_dim, grid_dim, backend, timer
+    )
+
+    encoded: Dict[str, str] = {}
+    encoded_bytes: Dict[str, int] = {}
+    encode_ms = 0.0
+    for node_id, img in results.items():
+        content, media_type, encoding = encode_result(img, output, timer)
+        encoded[node_id] = to_data_url(content, media_type)
+        encoded_bytes[node_id] = encoding["encoded_bytes"]
+        encode_ms += encoding["encode_ms"]
+
+    response = {
+        "status": "ok",
+        "outputs": encoded,
+        "output_format": output["format"],
+        "encoded_bytes": encoded_bytes,
+        "encode_ms": encode_ms,
+        "nodes": node_timings,
+        "image_width": width,
+        "image_height": height,
+        "channels": img_np.shape[2] if img_np.ndim == 3 else 1,
+        "block_dim": block_dim if block_dim == "auto" else list(block_dim),
+        "grid_dim": list(grid_dim),
+        "backend_used": backend,
+        "total_time_ms": (time.perf_counter() - start) * 1000.0,
+    }
+    stages = timer.as_dict()
+    if stages:
+        response["stage_timings_ms"] = stages
+    return response
@@ -1,13 +1,104 @@
 # filters/__init__.py
 # Central router for all convolution filters
 
-from .box_blur import box_blur_kernel, apply_box_blur_cuda
-from .gaussian import gaussian_kernel, apply_gaussian_cuda
-from .laplacian import laplacian_kernel, apply_laplacian_cuda
-from .prewitt import apply_prewitt_cuda
+from functools import partial
+from typing import Dict, Optional, Tuple, Union
 
+import numpy as np
 
-def get_filter_kernel(filter_type: str, mask_size: int) -> dict:
+from .box_blur import (
+    BOX_BLUR_CUDA_SRC, _ensure_box_blur_compiled,
+    box_blur_kernel, apply_box_blur_cuda, apply_box_blur_cpu, choose_box_blur_engine,
+)
+from .gaussian import GAUSSIAN_CUDA_SRC, _ensure_gaussian_compiled, gaussian_kernel, apply_gaussian_cuda, apply_gaussian_cpu
+from .laplacian import (
+    LAPLACIAN_CUDA_SRC, _ensure_laplacian_compiled,
+    laplacian_kernel, apply_laplacian_cuda, apply_laplacian_cpu, choose_laplacian_engine,
+)
+from .prewitt import PREWITT_CUDA_SRC, _ensure_prewitt_compiled, apply_prewitt_cuda, apply_prewitt_cpu, choose_prewitt_engine
+from .fft import FFT_BACKENDS, apply_fft_filter, prefers_fft
+from .custom import CUSTOM_CUDA_SRC, _ensure_custom_compiled, plan_custom_kernel, apply_custom_kernel
+
+# Execution backends: "auto" picks CUDA when a device is available, else CPU
+BACKENDS = ("auto", "cuda", "cpu")
+
+# CUDA module of each filter: (kernel source, lazy compile + load function).
+# Sources are compiled with arch sm_89 (see _ensure_*_compiled); warmup.py
+# precompiles them all at startup.
+CUDA_MODULES = {
+    "prewitt": (PREWITT_CUDA_SRC, _ensure_prewitt_compiled),
+    "laplacian": (LAPLACIAN_CUDA_SRC, _ensure_laplacian_compiled),
+    "gaussian": (GAUSSIAN_CUDA_SRC, _ensure_gaussian_compiled),
+    "box_blur": (BOX_BLUR_CUDA_SRC, _ensure_box_blur_compiled),
+    "custom": (CUSTOM_CUDA_SRC, _ensure_custom_compiled),
+}
+CUDA_ARCH = "sm_89"
+
+# Algorithm variants per filter; "auto" picks one from the mask size.
+# Every engine of a filter produces the same output (float-kernel engines
+# may differ by 1 on rare pixels from rounding).
+FILTER_ENGINES = {
+    "box_blur": ("direct", "running_sum", "fft"),
+    "gaussian": ("direct", "fft"),
+    "laplacian": ("direct", "separable", "fft"),
+    "prewitt": ("direct", "sat", "fft"),
+}
+
+
+def resolve_engine(
+    filter_type: str, mask_size: int, engine: str = "auto", backend: Optional[str] = None
+) -> str:
+    """
+    Normalize a requested engine for a filter ("auto" -> concrete engine).
+    
+    With a known backend, "auto" picks "fft" from the measured crossover
+    mask size for that backend (filters/fft_crossover.json).
+    
+    Raises:
+        ValueError: If the engine is not available for this filter
+    """
+    e = (engine or "auto").lower()
+    available = FILTER_ENGINES[filter_type]
+    
+    if e == "auto":
+        if backend is not None and prefers_fft(filter_type, mask_size, backend):
+            return "fft"
+        if filter_type == "box_blur":
+            return choose_box_blur_engine(mask_size)
+        if filter_type == "laplacian":
+            return choose_laplacian_engine(mask_size, backend)
+        if filter_type == "prewitt":
+            return choose_prewitt_engine(mask_size, backend)
+        return available[0]
+    
+    if e not in available:
+        raise ValueError(
+            f"Unknown engine '{engine}' for {filter_type}. Expected one of {['auto', *available]}"
+        )
+    return e
+
+
+def _with_engine(info: dict) -> dict:
+    """Route the fft engine to the shared host implementation on both backends."""
+    if info["engine"] == "fft":
+        info["cuda_function"] = info["cpu_function"] = partial(apply_fft_filter, info["type"])
+    return info
+
+
+def executed_backend(filter_info: dict, backend: str) -> str:
+    """
+    Backend that actually runs filter_info when `backend` is requested.
+    
+    The fft engine is a host (SciPy) implementation, so on CUDA it runs on the CPU.
+    """
+    if filter_info["engine"] == "fft" and backend not in FFT_BACKENDS:
+        return "cpu"
+    return backend
+
+
+def get_filter_kernel(
+    filter_type: str, mask_size: int, engine: str = "auto", backend: Optional[str] = None
+) -> dict:
     """
     Returns the necessary information to apply a convolution filter.
     
@@ -17,13 +108,18 @@ def get_filter_kernel(filter_type: str, mask_size: int) -> dict:
     Args:
         filter_type: Filter type ("box_blur", "gaussian", "laplacian", "prewitt")
         mask_size: Desired kernel size (must be odd for most filters)
+        engine: Algorithm variant (see FILTER_ENGINES), default "auto"
+        backend: Resolved backend, lets "auto" use the FFT crossover table
     
     Returns:
         dict with the following keys:
             - "type": normalized filter name
             - "kernel": numpy array for single-kernel filters (box_blur, gaussian, laplacian)
             - "kernel_x", "kernel_y": numpy arrays for Prewitt (two kernels)
+            - "cuda_function": complete CUDA implementation
+            - "cpu_function": vectorized NumPy/SciPy implementation (same output)
             - "mask_size_used": actual size used (may differ from requested)
+            - "engine": concrete engine ("auto" already resolved)
     
     Raises:
         ValueError: If filter_type is not recognized or mask_size is invalid
@@ -41,33 +137,39 @@ def get_filter_kernel(filter_type: str, mask_size: int) -> dict:
         if mask_size % 2 == 0:
             raise ValueError(f"Box Blur mask_size must be odd, got {mask_size}")
         
-        return {
+        return _with_engine({
             "type": "box_blur",
             "cuda_function": apply_box_blur_cuda,
+            "cpu_function": apply_box_blur_cpu,
             "mask_size_used": mask_size,
-        }
+            "engine": resolve_engine("box_blur", mask_size, engine, backend),
+        })
 
     if ft == "gaussian":
         # Gaussian uses separable CUDA implementation
         if mask_size % 2 == 0:
             raise ValueError(f"Gaussian mask_size must be odd, got {mask_size}")
         
-        return {
+        return _with_engine({
             "type": "gaussian",
             "cuda_function": apply_gaussian_cuda,
+            "cpu_function": apply_gaussian_cpu,
             "mask_size_used": mask_size,
-        }
+            "engine": resolve_engine("gaussian", mask_size, engine, backend),
+        })
 
     if ft == "laplacian":
         # Laplacian supports both 3x3 (classic) and NxN (LoG)
         if mask_size % 2 == 0:
             raise ValueError(f"Laplacian mask_size must be odd, got {mask_size}")
         
-        return {
+        return _with_engine({
             "type": "laplacian",
             "cuda_function": apply_laplacian_cuda,
+            "cpu_function": apply_laplacian_cpu,
             "mask_size_used": mask_size,
-        }
+            "engine": resolve_engine("laplacian", mask_size, engine, backend),
+        })
 
     if ft == "prewitt":
         # Prewitt uses complete separable CUDA implementation
@@ -75,10 +177,104 @@ def get_filter_kernel(filter_type: str, mask_size: int) -> dict:
         if mask_size % 2 == 0:
             raise ValueError(f"Prewitt mask_size must be odd, got {mask_size}")
         
-        return {
+        return _with_engine({
             "type": "prewitt",
             "cuda_function": apply_prewitt_cuda,
+            "cpu_function": apply_prewitt_cpu,
             "mask_size_used": mask_size,
-        }
+            "engine": resolve_engine("prewitt", mask_size, engine, backend),
+        })
 
     raise ValueError(f"Unknown filter type: {filter_type}")
+
+
+def resolve_backend(backend: str) -> str:
+    """
+    Normalize a requested backend name to "cuda" or "cpu".
+    
+    Raises:
+        ValueError: If backend is not one of BACKENDS
+    """
+    b = (backend or "auto").lower()
+    if b not in BACKENDS:
+        raise ValueError(f"Unknown backend: {backend}. Expected one of {list(BACKENDS)}")
+    
+    if b == "auto":
+        # With a worker pool, ask the workers instead of creating a context here
+        from worker_pool import get_worker_pool
+        pool = get_worker_pool()
+        if pool is not None:
+            return pool.default_backend
+
+        from cuda_kernels import is_cuda_available
+        return "cuda" if is_cuda_available() else "cpu"
+    return b
+
+
+def resolve_block_dim(
+    filter_info: dict,
+    image: np.ndarray,
+    block_dim: Union[Tuple[int, int], str],
+    gain: float = 8.0,
+    backend: str = "cuda",
+) -> Tuple[int, int]:
+    """
+    Turn block_dim "auto" into concrete dims; explicit dims pass through.
+    
+    On CUDA the autotuner returns the stored winner for this filter, mask size
+    and image-shape bucket (tuning it on this image the first time). The CPU
+    backend ignores block_dim, so nothing is tuned there.
+    """
+    if block_dim != "auto":
+        return tuple(block_dim)
+
+    from autotune import DEFAULT_BLOCK_DIM, get_autotuner
+    if backend == "cpu":
+        return DEFAULT_BLOCK_DIM
+    return get_autotuner().resolve(filter_info, image, gain, backend)
+
+
+def apply_filter(
+    filter_info: dict,
+    image: np.ndarray,
+    block_dim: Union[Tuple[int, int], str],
+    grid_dim: Tuple[int, int],
+    gain: float = 8.0,
+    backend: str = "cuda",
+) -> Tuple[np.ndarray, Dict[str, float]]:
+    """
+    Run the filter described by get_filter_kernel() on the given backend.
+    
+    Args:
+        filter_info: dict returned by get_filter_kernel()
+        image: Image (float32), shape (H, W) or (H, W, C)
+        block_dim: (blockX, blockY), or "auto" for the autotuned launch config;
+                   ignored by the CPU backend
+        grid_dim: Ignored, calculated automatically
+        gain: Edge enhancement factor (Prewitt only)
+        backend: "cuda" or "cpu" (use resolve_backend() for "auto")
+    
+    Returns:
+        (result_image, timings_dict); timings include "block_dim" when it was "auto"
+    """
+    # With a worker pool (CUDA_LAB_WORKERS > 0) the least-loaded worker runs it
+    from worker_pool import get_worker_pool
+    pool = get_worker_pool()
+    if pool is not None:
+        return pool.apply_filter(filter_info, image, block_dim, grid_dim, gain, backend)
+
+    if block_dim == "auto":
+        block_dim = resolve_block_dim(filter_info, image, block_dim, gain, backend)
+        result, timings = apply_filter(filter_info, image, block_dim, grid_dim, gain, backend)
+        timings["block_dim"] = list(block_dim)
+        return result, timings
+
+    key = "cpu_function" if backend == "cpu" else "cuda_function"
+    func = filter_info[key]
+    kwargs = {"mask_size": filter_info["mask_size_used"], "engine": filter_info.get("engine", "direct")}
+    if filter_info["type"] == "prewitt":
+        kwargs["gain"] = gain
+    
+    # Both backends take HxWxC directly (CUDA filters every channel plane in
+    # the same launches, one grid z-slice each)
+    return func(image, block_dim, grid_dim, **kwargs)
@@ -2,14 +2,19 @@
 # Box Blur Filter: Simple neighborhood average
 # Complete CUDA implementation with separable convolution
 
+import time
+
 import numpy as np
+from scipy import ndimage
 from typing import Tuple, Dict
 
 # Import shared CUDA initialization
 import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-from cuda_kernels import _initialize_cuda
+from cuda_kernels import _initialize_cuda, from_planes, timed_copy, to_planes
+from buffer_pool import get_device_pool, get_host_pool
+from kernel_specialization import get_kernel, register_specialization, render
 
 # CUDA code for separable Box Blur
 BOX_BLUR_CUDA_SRC = r"""
@@ -24,6 +29,9 @@ __global__ void box_horiz_u8_to_f(const unsigned char* __restrict__ src,
                                   float* __restrict__ tmp,
                                   int w, int h, int N)
 {
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    src += plane; tmp += plane;
+
     int x = blockIdx.x * blockDim.x + threadIdx.x;
     int y = blockIdx.y * blockDim.y + threadIdx.y;
     if (x >= w || y >= h) return;
@@ -44,6 +52,9 @@ __global__ void box_vert_f_to_u8(const float* __restrict__ tmp,
                                  unsigned char* __restrict__ dst,
                                  int w, int h, int N)
 {
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    tmp += plane; dst += plane;
+
     int x = blockIdx.x * blockDim.x + threadIdx.x;
     int y = blockIdx.y * blockDim.y + threadIdx.y;
     if (x >= w || y >= h) return;
@@ -64,9 +75,169 @@ __global__ void box_vert_f_to_u8(const float* __restrict__ tmp,
     dst[y * w + x] = (unsigned char)val;
 }
 
+// Running-sum horizontal pass: each thread slides the window over a segment
+// of `seg` pixels of one row, O(N / seg + 1) reads per pixel. Sums are exact
+// integers, so tmp holds the same values as box_horiz_u8_to_f.
+__global__ void box_horiz_running_u8_to_f(const unsigned char* __restrict__ src,
+                                          float* __restrict__ tmp,
+                                          int w, int h, int N, int seg)
+{
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    src += plane; tmp += plane;
+
+    int x0 = (blockIdx.x * blockDim.x + threadIdx.x) * seg;
+    int y  = blockIdx.y * blockDim.y + threadIdx.y;
+    if (x0 >= w || y >= h) return;
+
+    int r = N / 2;
+    const unsigned char* row = src + y * w;
+
+    int acc = 0;
+    for (int i = -r; i <= r; ++i){
+        acc += row[clampi(x0 + i, 0, w - 1)];
+    }
+
+    int x1 = min(x0 + seg, w);
+    for (int x = x0; x < x1; ++x){
+        tmp[y * w + x] = (float)acc;
+        acc += row[clampi(x + r + 1, 0, w - 1)] - row[clampi(x - r, 0, w - 1)];
+    }
+}
+
+// Running-sum vertical pass: each thread slides down a segment of `seg` rows
+// of one column (adjacent threads -> adjacent columns, coalesced). Same
+// normalization and rounding as box_vert_f_to_u8.
+__global__ void box_vert_running_f_to_u8(const float* __restrict__ tmp,
+                                         unsigned char* __restrict__ dst,
+                                         int w, int h, int N, int seg)
+{
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    tmp += plane; dst += plane;
+
+    int x  = blockIdx.x * blockDim.x + threadIdx.x;
+    int y0 = (blockIdx.y * blockDim.y + threadIdx.y) * seg;
+    if (x >= w || y0 >= h) return;
+
+    int r = N / 2;
+    float invN = 1.0f / (float)N;
+
+    int acc = 0;
+    for (int j = -r; j <= r; ++j){
+        acc += (int)tmp[clampi(y0 + j, 0, h - 1) * w + x];
+    }
+
+    int y1 = min(y0 + seg, h);
+    for (int y = y0; y < y1; ++y){
+        int val = (int)((float)acc * invN * invN + 0.5f);
+        val = val < 0 ? 0 : (val > 255 ? 255 : val);
+        dst[y * w + x] = (unsigned char)val;
+
+        acc += (int)tmp[clampi(y + r + 1, 0, h - 1) * w + x]
+             - (int)tmp[clampi(y - r, 0, h - 1) * w + x];
+    }
+}
+
 } // extern C
 """
 
+# Direct-engine passes with N baked in (same parameters as the generic
+# kernels; the N argument is ignored). The running-sum kernels already do
+# O(1) work per pixel and stay generic.
+BOX_BLUR_SPECIALIZED_SRC = r"""
+extern "C" {
+
+__device__ __forceinline__ int clampi(int v, int lo, int hi){
+    return v < lo ? lo : (v > hi ? hi : v);
+}
+
+__global__ void box_horiz_u8_to_f_n${N}(const unsigned char* __restrict__ src,
+                                        float* __restrict__ tmp,
+                                        int w, int h, int N_arg)
+{
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    src += plane; tmp += plane;
+
+    const int N = ${N};
+
+    int x = blockIdx.x * blockDim.x + threadIdx.x;
+    int y = blockIdx.y * blockDim.y + threadIdx.y;
+    if (x >= w || y >= h) return;
+
+    const int r = N / 2;
+    float acc = 0.f;
+
+    #pragma unroll
+    for (int i = -r; i <= r; ++i){
+        int xx = clampi(x + i, 0, w - 1);
+        acc += (float)src[y * w + xx];
+    }
+
+    tmp[y * w + x] = acc;
+}
+
+__global__ void box_vert_f_to_u8_n${N}(const float* __restrict__ tmp,
+                                       unsigned char* __restrict__ dst,
+                                       int w, int h, int N_arg)
+{
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    tmp += plane; dst += plane;
+
+    const int N = ${N};
+
+    int x = blockIdx.x * blockDim.x + threadIdx.x;
+    int y = blockIdx.y * blockDim.y + threadIdx.y;
+    if (x >= w || y >= h) return;
+
+    const int r = N / 2;
+    const float invN = 1.0f / (float)N;
+    float acc = 0.f;
+
+    #pragma unroll
+    for (int j = -r; j <= r; ++j){
+        int yy = clampi(y + j, 0, h - 1);
+        acc += tmp[yy * w + x];
+    }
+
+    int val = (int)(acc * invN * invN + 0.5f);
+    val = val < 0 ? 0 : (val > 255 ? 255 : val);
+
+    dst[y * w + x] = (unsigned char)val;
+}
+
+} // extern C
+"""
+
+# Box blur engines: "direct" loops over the N-wide window per pixel,
+# "running_sum" slides an integer window sum (O(1) per pixel).
+ENGINES = ("direct", "running_sum")
+
+# "auto" picks running_sum from this mask size up. Above the max, window sums
+# (up to 255 * N * N) no longer fit float32 exactly, so the direct path's own
+# float rounding could differ and "auto" keeps it.
+RUNNING_SUM_MIN_MASK = 15
+RUNNING_SUM_MAX_MASK = 255
+
+
+def choose_box_blur_engine(mask_size: int) -> str:
+    """Engine used by engine="auto" for a given mask size."""
+    if RUNNING_SUM_MIN_MASK <= mask_size <= RUNNING_SUM_MAX_MASK:
+        return "running_sum"
+    return "direct"
+
+
+def _running_segment(mask_size: int) -> int:
+    """Pixels per thread in the running-sum kernels (>= N keeps reads O(1) per pixel)."""
+    return max(32, mask_size)
+
+
+def generate_box_blur_specialization(N: int):
+    """Source of the direct-engine passes specialized for mask size N."""
+    return render(BOX_BLUR_SPECIALIZED_SRC, N=N), ("box_horiz_u8_to_f", "box_vert_f_to_u8")
+
+
+register_specialization("box_blur", generate_box_blur_specialization)
+
+
 # Compiled module (lazy)
 _box_blur_mod = None
 _box_blur_compiled = False
@@ -91,32 +262,40 @@ def apply_box_blur_cuda(
     grid_dim: Tuple[int, int],
     mask_size: int = 3,
     passes: int = 1,
+    engine: str = "direct",
     **kwargs
 ) -> Tuple[np.ndarray, Dict[str, float]]:
     """
     Apply Box Blur filter using separable CUDA convolution.
     
     Args:
-        image: Grayscale image (float32), shape (H, W)
+        image: Image (float32), shape (H, W) or (H, W, C); all channels are
+               filtered in the same launches (grid z = C)
         block_dim: (blockX, blockY)
         grid_dim: Ignored, calculated automatically
         mask_size: Kernel size N (default 3, must be odd)
         passes: Number of blur passes (default 1)
+        engine: "direct" (N reads per pixel) or "running_sum" (O(1) per pixel,
+                identical output)
     
     Returns:
         (result_image, timings_dict)
     """
     import pycuda.driver as cuda
     
+    wall_start = time.perf_counter()
     _ensure_box_blur_compiled()
     
-    if image.ndim != 2:
-        raise ValueError("Image must be 2D (grayscale)")
+    if image.ndim not in (2, 3):
+        raise ValueError("Image must be 2D (grayscale) or 3D (H, W, C)")
     
     if mask_size % 2 == 0:
         raise ValueError(f"mask_size must be odd, got {mask_size}")
     
-    h, w = image.shape
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown box_blur engine: {engine}. Expected one of {list(ENGINES)}")
+    
+    h, w = image.shape[:2]
     N = mask_size
     
     # Convert to uint8 if float32
@@ -125,8 +304,11 @@ def apply_box_blur_cuda(
     else:
         img_u8 = image.astype(np.uint8)
     
-    gray = np.ascontiguousarray(img_u8.reshape(-1))
-    Npix = w * h
+    # Channels as (C, H, W) planes, one grid z-slice per plane
+    planes = to_planes(img_u8)
+    C = planes.shape[0]
+    gray = planes.reshape(-1)
+    Npix = w * h * C
     bytesGray = Npix
     
     # Calculate correct grid
@@ -135,46 +317,141 @@ def apply_box_blur_cuda(
     gridY = (h + blockY - 1) // blockY
     
     block = (blockX, blockY, 1)
-    grid = (gridX, gridY, 1)
+    grid = (gridX, gridY, C)
     
-    # Allocate GPU memory
-    d_in = cuda.mem_alloc(bytesGray)
-    d_out = cuda.mem_alloc(bytesGray)
-    d_tmp = cuda.mem_alloc(Npix * 4)  # float buffer
+    # Running-sum grids: one thread per row segment / column segment
+    seg = _running_segment(N)
+    grid_h = ((((w + seg - 1) // seg) + blockX - 1) // blockX, gridY, C)
+    grid_v = (gridX, (((h + seg - 1) // seg) + blockY - 1) // blockY, C)
     
-    # Copy to GPU
-    cuda.memcpy_htod(d_in, gray)
+    # Lease GPU buffers from the shared pool (returned on exit, reused across requests)
+    with get_device_pool().leases() as dev, get_host_pool().leases() as host:
+        d_in = dev.alloc(bytesGray)
+        d_out = dev.alloc(bytesGray)
+        d_tmp = dev.alloc(Npix * 4)  # float buffer
+        
+        # Copy to GPU
+        upload_ms = timed_copy(cuda.memcpy_htod, d_in, gray)
+        
+        # Get functions
+        box_horiz = get_kernel("box_blur", N, "box_horiz_u8_to_f", _box_blur_mod)
+        box_vert = get_kernel("box_blur", N, "box_vert_f_to_u8", _box_blur_mod)
+        box_horiz_running = _box_blur_mod.get_function("box_horiz_running_u8_to_f")
+        box_vert_running = _box_blur_mod.get_function("box_vert_running_f_to_u8")
+        
+        # Measure time
+        start = cuda.Event()
+        stop = cuda.Event()
+        start.record()
+        
+        # Execute multiple passes if requested
+        for _ in range(passes):
+            if engine == "running_sum":
+                box_horiz_running(d_in, d_tmp, np.int32(w), np.int32(h), np.int32(N), np.int32(seg),
+                                  block=block, grid=grid_h)
+                box_vert_running(d_tmp, d_out, np.int32(w), np.int32(h), np.int32(N), np.int32(seg),
+                                 block=block, grid=grid_v)
+            else:
+                # Horizontal: uint8 -> float
+                box_horiz(d_in, d_tmp, np.int32(w), np.int32(h), np.int32(N), block=block, grid=grid)
+                
+                # Vertical: float -> uint8
+                box_vert(d_tmp, d_out, np.int32(w), np.int32(h), np.int32(N), block=block, grid=grid)
+            
+            # Swap buffers for next pass
+            d_in, d_out = d_out, d_in
+        
+        stop.record()
+        stop.synchronize()
+        elapsed_ms = start.time_till(stop)
+        
+        # Copy result (it's in d_in after swap) into pinned staging memory
+        out = host.alloc(bytesGray)[:bytesGray]
+        download_ms = timed_copy(cuda.memcpy_dtoh, out, d_in)
+        
+        result = from_planes(out.reshape(C, h, w), image.ndim).astype(np.float32)
     
-    # Get functions
-    box_horiz = _box_blur_mod.get_function("box_horiz_u8_to_f")
-    box_vert = _box_blur_mod.get_function("box_vert_f_to_u8")
+    timings = {
+        "execution_time_ms": (time.perf_counter() - wall_start) * 1000.0,
+        "kernel_time_ms": float(elapsed_ms),
+        "upload_ms": upload_ms,
+        "download_ms": download_ms,
+    }
     
-    # Measure time
-    start = cuda.Event()
-    stop = cuda.Event()
-    start.record()
+    return result, timings
+
+
+def _running_window_sum(a: np.ndarray, N: int, axis: int) -> np.ndarray:
+    """Clamp-to-edge N-wide window sums along axis from a prefix sum (O(1) per pixel)."""
+    r = N // 2
+    a = np.moveaxis(a, axis, 0)
+    padded = np.pad(a, [(r, r)] + [(0, 0)] * (a.ndim - 1), mode="edge")
     
-    # Execute multiple passes if requested
-    for _ in range(passes):
-        # Horizontal: uint8 -> float
-        box_horiz(d_in, d_tmp, np.int32(w), np.int32(h), np.int32(N), block=block, grid=grid)
-        
-        # Vertical: float -> uint8
-        box_vert(d_tmp, d_out, np.int32(w), np.int32(h), np.int32(N), block=block, grid=grid)
-        
-        # Swap buffers for next pass
-        d_in, d_out = d_out, d_in
+    prefix = np.zeros((padded.shape[0] + 1,) + padded.shape[1:], dtype=np.int64)
+    np.cumsum(padded, axis=0, out=prefix[1:])
+    
+    return np.moveaxis(prefix[N:] - prefix[:-N], 0, axis)
+
+
+def apply_box_blur_cpu(
+    image: np.ndarray,
+    block_dim: Tuple[int, int] = None,
+    grid_dim: Tuple[int, int] = None,
+    mask_size: int = 3,
+    passes: int = 1,
+    engine: str = "direct",
+    **kwargs
+) -> Tuple[np.ndarray, Dict[str, float]]:
+    """
+    Apply Box Blur filter on the CPU with separable NumPy/SciPy passes.
     
-    stop.record()
-    stop.synchronize()
-    elapsed_ms = start.time_till(stop)
+    Mirrors apply_box_blur_cuda: clamp-to-edge borders, exact integer
+    window sums and the same float32 normalization (acc * invN * invN + 0.5).
     
-    # Copy result (it's in d_in after swap)
-    out = np.empty(bytesGray, dtype=np.uint8)
-    cuda.memcpy_dtoh(out, d_in)
+    Args:
+        image: Image (float32), shape (H, W) or (H, W, C); channels are
+               filtered independently in the same vectorized pass
+        block_dim: Ignored (kept for signature compatibility)
+        grid_dim: Ignored (kept for signature compatibility)
+        mask_size: Kernel size N (default 3, must be odd)
+        passes: Number of blur passes (default 1)
+        engine: "direct" (window correlation) or "running_sum" (prefix sums,
+                O(1) per pixel); both give exact integer sums
+    
+    Returns:
+        (result_image, timings_dict)
+    """
+    if image.ndim not in (2, 3):
+        raise ValueError("Image must be 2D (grayscale) or 3D (H, W, C)")
+    
+    if mask_size % 2 == 0:
+        raise ValueError(f"mask_size must be odd, got {mask_size}")
+    
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown box_blur engine: {engine}. Expected one of {list(ENGINES)}")
+    
+    start = time.perf_counter()
+    
+    N = mask_size
+    ones = np.ones(N, dtype=np.float64)
+    invN = np.float32(1.0) / np.float32(N)
+    img_u8 = np.clip(image, 0, 255).astype(np.uint8)
+    
+    for _ in range(passes):
+        if engine == "running_sum":
+            tmp = _running_window_sum(img_u8, N, axis=1)
+            acc = _running_window_sum(tmp, N, axis=0).astype(np.float32)
+        else:
+            # Window sums of uint8 values are exact in float64
+            tmp = ndimage.correlate1d(img_u8.astype(np.float64), ones, axis=1, mode="nearest")
+            acc = ndimage.correlate1d(tmp, ones, axis=0, mode="nearest").astype(np.float32)
+        
+        val = (acc * invN * invN + np.float32(0.5)).astype(np.int32)
+        img_u8 = np.clip(val, 0, 255).astype(np.uint8)
     
-    result = out.reshape(h, w).astype(np.float32)
+    result = img_u8.astype(np.float32)
     
+    elapsed_ms = (time.perf_counter() - start) * 1000.0
     timings = {
         "execution_time_ms": float(elapsed_ms),
         "kernel_time_ms": float(elapsed_ms),
@@ -0,0 +1,421 @@
+# filters/custom.py
+# User-supplied NxN kernels: SVD rank detection picks between one row+column
+# pass (rank 1), a sum of a few such passes (low rank) and the dense loop.
+
+import time
+
+import numpy as np
+from scipy import ndimage
+from typing import Dict, Tuple
+
+# Import shared CUDA initialization
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+from cuda_kernels import _initialize_cuda, from_planes, timed_copy, to_planes
+from buffer_pool import get_device_pool, get_host_pool
+
+CUSTOM_MAX_MASK = 101
+DEFAULT_MAX_RANK = 3
+DEFAULT_RANK_TOLERANCE = 1e-5
+
+# How the float response becomes a uint8 pixel
+POSTPROCESS_MODES = ("clip", "abs")
+
+CUSTOM_CUDA_SRC = r"""
+extern "C" {
+
+__device__ __forceinline__ int clampi(int v, int lo, int hi){
+    return v < lo ? lo : (v > hi ? hi : v);
+}
+
+__device__ __forceinline__ size_t IDX(int x, int y, int w){
+    return (size_t)y * w + x;
+}
+
+// Dense NxN correlation (O(N^2) per pixel)
+__global__ void custom_dense_u8_to_f(const unsigned char* __restrict__ gray,
+                                     const float* __restrict__ K, int N,
+                                     float* __restrict__ acc,
+                                     int w, int h)
+{
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    gray += plane; acc += plane;
+
+    int x = blockIdx.x * blockDim.x + threadIdx.x;
+    int y = blockIdx.y * blockDim.y + threadIdx.y;
+    if (x >= w || y >= h) return;
+
+    int r = N / 2;
+    float s = 0.f;
+
+    for (int ky = -r; ky <= r; ++ky){
+        int yy = clampi(y + ky, 0, h - 1);
+        int krow = (ky + r) * N;
+        for (int kx = -r; kx <= r; ++kx){
+            int xx = clampi(x + kx, 0, w - 1);
+            s += (float)gray[IDX(xx, yy, w)] * K[krow + (kx + r)];
+        }
+    }
+
+    acc[IDX(x, y, w)] = s;
+}
+
+// Row pass of one rank-1 term: tmp = gray (*) k along X
+__global__ void custom_rows_u8_to_f(const unsigned char* __restrict__ gray,
+                                    const float* __restrict__ k, int N,
+                                    float* __restrict__ tmp,
+                                    int w, int h)
+{
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    gray += plane; tmp += plane;
+
+    int x = blockIdx.x * blockDim.x + threadIdx.x;
+    int y = blockIdx.y * blockDim.y + threadIdx.y;
+    if (x >= w || y >= h) return;
+
+    int r = N / 2;
+    float s = 0.f;
+
+    for (int i = -r; i <= r; ++i){
+        s += (float)gray[IDX(clampi(x + i, 0, w - 1), y, w)] * k[i + r];
+    }
+
+    tmp[IDX(x, y, w)] = s;
+}
+
+// Column pass of one rank-1 term: acc = tmp (*) k along Y, or acc += ... for
+// the second and later terms of a low-rank kernel
+__global__ void custom_cols_f_acc(const float* __restrict__ tmp,
+                                  const float* __restrict__ k, int N,
+                                  float* __restrict__ acc,
+                                  int w, int h, int accumulate)
+{
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    tmp += plane; acc += plane;
+
+    int x = blockIdx.x * blockDim.x + threadIdx.x;
+    int y = blockIdx.y * blockDim.y + threadIdx.y;
+    if (x >= w || y >= h) return;
+
+    int r = N / 2;
+    float s = 0.f;
+
+    for (int j = -r; j <= r; ++j){
+        s += tmp[IDX(x, clampi(y + j, 0, h - 1), w)] * k[j + r];
+    }
+
+    size_t i = IDX(x, y, w);
+    acc[i] = accumulate ? acc[i] + s : s;
+}
+
+// mode 0: clamp to [0,255]; mode 1: abs() first (edge kernels)
+__global__ void custom_f_to_u8(const float* __restrict__ acc,
+                               unsigned char* __restrict__ out,
+                               int w, int h, int mode)
+{
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    acc += plane; out += plane;
+
+    int x = blockIdx.x * blockDim.x + threadIdx.x;
+    int y = blockIdx.y * blockDim.y + threadIdx.y;
+    if (x >= w || y >= h) return;
+
+    float v = acc[IDX(x, y, w)];
+    if (mode == 1 && v < 0.f) v = -v;
+    v = fmaxf(0.0f, fminf(255.0f, v));
+
+    out[IDX(x, y, w)] = (unsigned char)(v + 0.5f);
+}
+
+} // extern C
+"""
+
+# Compiled module (lazy)
+_custom_mod = None
+_custom_compiled = False
+
+def _ensure_custom_compiled():
+    """Compile custom-kernel kernels if not already compiled."""
+    global _custom_mod, _custom_compiled
+    if not _custom_compiled:
+        # Initialize CUDA first (shared context)
+        _initialize_cuda()
+        from cuda_kernels import compile_cuda_kernel_to_ptx
+        import pycuda.driver as drv
+        ptx_code = compile_cuda_kernel_to_ptx(CUSTOM_CUDA_SRC, arch="sm_89")
+        _custom_mod = drv.module_from_buffer(ptx_code.encode())
+        _custom_compiled = True
+
+
+def plan_custom_kernel(
+    kernel,
+    max_rank: int = DEFAULT_MAX_RANK,
+    tolerance: float = DEFAULT_RANK_TOLERANCE,
+) -> dict:
+    """
+    Validate a user kernel and choose how to run it.
+
+    The numerical rank comes from the SVD K = sum_i s_i * u_i v_i^T, counting
+    singular values above tolerance * s_1. A rank-r kernel runs as r row
+    passes (v_i) each followed by a column pass (u_i), 2rN taps per pixel,
+    when r <= max_rank and that beats the N^2 taps of the dense loop.
+
+    Args:
+        kernel: NxN nested list or array (N odd, applied as correlation)
+        max_rank: Most rank-1 terms worth running as separate passes
+        tolerance: Relative singular value cutoff
+
+    Returns:
+        dict with "path" ("separable", "low_rank" or "direct"), "reason",
+        "rank", "mask_size", "kernel", "terms" [(column, row) float32 pairs],
+        "singular_values" and "reconstruction_error" (max abs, separable paths)
+
+    Raises:
+        ValueError: If the kernel is not a finite odd NxN matrix
+    """
+    try:
+        K = np.asarray(kernel, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise ValueError("kernel must be an NxN matrix of numbers")
+
+    if K.ndim != 2 or K.shape[0] != K.shape[1]:
+        raise ValueError(f"kernel must be a square NxN matrix, got shape {list(K.shape)}")
+
+    N = K.shape[0]
+    if N % 2 == 0 or not 1 <= N <= CUSTOM_MAX_MASK:
+        raise ValueError(f"kernel size must be odd and at most {CUSTOM_MAX_MASK}, got {N}")
+
+    if not np.all(np.isfinite(K)):
+        raise ValueError("kernel contains NaN or infinite values")
+
+    if max_rank < 0:
+        raise ValueError(f"max_rank must be >= 0, got {max_rank}")
+
+    U, S, Vt = np.linalg.svd(K)
+    rank = int(np.sum(S > tolerance * S[0])) if S[0] > 0 else 0
+    dense_taps = N * N
+    sep_taps = 2 * rank * N
+
+    plan = {
+        "mask_size": N,
+        "kernel": K.astype(np.float32),
+        "rank": rank,
+        "singular_values": [float(s) for s in S[:max(rank, 1) + 1]],
+        "terms": [],
+        "reconstruction_error": 0.0,
+    }
+
+    if rank == 0:
+        plan["path"] = "direct"
+        plan["reason"] = "all-zero kernel"
+        return plan
+
+    if rank > max_rank:
+        plan["path"] = "direct"
+        plan["reason"] = f"rank {rank} is above max_rank {max_rank}"
+        return plan
+
+    if sep_taps >= dense_taps:
+        plan["path"] = "direct"
+        plan["reason"] = f"rank {rank}: {sep_taps} taps in separable passes vs {dense_taps} dense"
+        return plan
+
+    # Split each singular value evenly between the column and row factors
+    terms = []
+    for i in range(rank):
+        scale = np.sqrt(S[i])
+        terms.append(((U[:, i] * scale).astype(np.float32), (Vt[i] * scale).astype(np.float32)))
+
+    approx = sum(np.outer(c.astype(np.float64), r.astype(np.float64)) for c, r in terms)
+    plan["terms"] = terms
+    plan["reconstruction_error"] = float(np.abs(approx - K).max())
+
+    if rank == 1:
+        plan["path"] = "separable"
+        plan["reason"] = (
+            f"rank 1: one row pass + one column pass, {sep_taps} taps vs {dense_taps} dense"
+        )
+    else:
+        plan["path"] = "low_rank"
+        plan["reason"] = (
+            f"rank {rank}: {rank} row/column pass pairs, {sep_taps} taps vs {dense_taps} dense"
+        )
+    return plan
+
+
+def _check_postprocess(postprocess: str) -> str:
+    if postprocess not in POSTPROCESS_MODES:
+        raise ValueError(f"Unknown postprocess: {postprocess}. Expected one of {list(POSTPROCESS_MODES)}")
+    return postprocess
+
+
+def apply_custom_cuda(
+    image: np.ndarray,
+    plan: dict,
+    block_dim: Tuple[int, int],
+    postprocess: str = "clip",
+) -> Tuple[np.ndarray, Dict[str, float]]:
+    """
+    Run a planned custom kernel with CUDA.
+
+    Args:
+        image: Image (float32), shape (H, W) or (H, W, C); all channels are
+               filtered in the same launches (grid z = C)
+        plan: dict returned by plan_custom_kernel()
+        block_dim: (blockX, blockY)
+        postprocess: "clip" (clamp to [0,255]) or "abs" (abs, then clamp)
+
+    Returns:
+        (result_image, timings_dict)
+    """
+    import pycuda.driver as cuda
+
+    wall_start = time.perf_counter()
+    _ensure_custom_compiled()
+
+    if image.ndim not in (2, 3):
+        raise ValueError("Image must be 2D (grayscale) or 3D (H, W, C)")
+
+    mode = POSTPROCESS_MODES.index(_check_postprocess(postprocess))
+
+    h, w = image.shape[:2]
+    N = plan["mask_size"]
+    # Channels as (C, H, W) planes, one grid z-slice per plane
+    planes = to_planes(np.clip(image, 0, 255).astype(np.uint8))
+    C = planes.shape[0]
+    gray = planes.reshape(-1)
+    Npix = w * h * C
+
+    blockX, blockY = block_dim
+    block = (blockX, blockY, 1)
+    grid = ((w + blockX - 1) // blockX, (h + blockY - 1) // blockY, C)
+
+    with get_device_pool().leases() as dev, get_host_pool().leases() as host:
+        d_gray = dev.alloc(Npix)
+        d_acc = dev.alloc(Npix * 4)
+        d_out = dev.alloc(Npix)
+
+        upload_ms = timed_copy(cuda.memcpy_htod, d_gray, gray)
+
+        dense = _custom_mod.get_function("custom_dense_u8_to_f")
+        rows = _custom_mod.get_function("custom_rows_u8_to_f")
+        cols = _custom_mod.get_function("custom_cols_f_acc")
+        to_u8 = _custom_mod.get_function("custom_f_to_u8")
+
+        if plan["path"] == "direct":
+            d_K = dev.alloc(N * N * 4)
+            upload_ms += timed_copy(cuda.memcpy_htod, d_K, np.ascontiguousarray(plan["kernel"]))
+        else:
+            d_tmp = dev.alloc(Npix * 4)
+            d_terms = []
+            for col, row in plan["terms"]:
+                d_col = dev.alloc(N * 4)
+                d_row = dev.alloc(N * 4)
+                upload_ms += timed_copy(cuda.memcpy_htod, d_col, col)
+                upload_ms += timed_copy(cuda.memcpy_htod, d_row, row)
+                d_terms.append((d_col, d_row))
+
+        start = cuda.Event()
+        stop = cuda.Event()
+        start.record()
+
+        if plan["path"] == "direct":
+            dense(d_gray, d_K, np.int32(N), d_acc, np.int32(w), np.int32(h), block=block, grid=grid)
+        else:
+            for i, (d_col, d_row) in enumerate(d_terms):
+                rows(d_gray, d_row, np.int32(N), d_tmp, np.int32(w), np.int32(h), block=block, grid=grid)
+                cols(d_tmp, d_col, np.int32(N), d_acc, np.int32(w), np.int32(h), np.int32(i > 0),
+                     block=block, grid=grid)
+        to_u8(d_acc, d_out, np.int32(w), np.int32(h), np.int32(mode), block=block, grid=grid)
+
+        stop.record()
+        stop.synchronize()
+        elapsed_ms = start.time_till(stop)
+
+        out = host.alloc(Npix)[:Npix]
+        download_ms = timed_copy(cuda.memcpy_dtoh, out, d_out)
+
+        result = from_planes(out.reshape(C, h, w), image.ndim).astype(np.float32)
+
+    timings = {
+        "execution_time_ms": (time.perf_counter() - wall_start) * 1000.0,
+        "kernel_time_ms": float(elapsed_ms),
+        "upload_ms": upload_ms,
+        "download_ms": download_ms,
+    }
+
+    return result, timings
+
+
+def apply_custom_cpu(
+    image: np.ndarray,
+    plan: dict,
+    block_dim: Tuple[int, int] = None,
+    postprocess: str = "clip",
+) -> Tuple[np.ndarray, Dict[str, float]]:
+    """
+    Run a planned custom kernel on the CPU with the same passes as the CUDA path.
+
+    Args:
+        image: Image (float32), shape (H, W) or (H, W, C)
+        plan: dict returned by plan_custom_kernel()
+        block_dim: Ignored (kept for signature compatibility)
+        postprocess: "clip" or "abs"
+
+    Returns:
+        (result_image, timings_dict)
+    """
+    if image.ndim not in (2, 3):
+        raise ValueError("Image must be 2D (grayscale) or 3D (H, W, C)")
+
+    _check_postprocess(postprocess)
+
+    start = time.perf_counter()
+
+    gray = np.clip(image, 0, 255).astype(np.uint8).astype(np.float32)
+
+    if plan["path"] == "direct":
+        K = plan["kernel"][(...,) + (None,) * (gray.ndim - 2)]
+        acc = ndimage.correlate(gray, K, mode="nearest")
+    else:
+        acc = np.zeros_like(gray)
+        for col, row in plan["terms"]:
+            tmp = ndimage.correlate1d(gray, row, axis=1, mode="nearest")
+            acc += ndimage.correlate1d(tmp, col, axis=0, mode="nearest")
+
+    if postprocess == "abs":
+        acc = np.abs(acc)
+    v = np.clip(acc, np.float32(0.0), np.float32(255.0)) + np.float32(0.5)
+    result = v.astype(np.uint8).astype(np.float32)
+
+    elapsed_ms = (time.perf_counter() - start) * 1000.0
+    timings = {
+        "execution_time_ms": float(elapsed_ms),
+        "kernel_time_ms": float(elapsed_ms),
+    }
+
+    return result, timings
+
+
+def apply_custom_kernel(
+    plan: dict,
+    image: np.ndarray,
+    block_dim: Tuple[int, int],
+    backend: str = "cuda",
+    postprocess: str = "clip",
+) -> Tuple[np.ndarray, Dict[str, float]]:
+    """
+    Run a planned custom kernel on the given backend.
+
+    Like filters.apply_filter(), this goes to the worker pool when one is
+    configured, so CUDA only ever runs in a process that owns its context.
+    """
+    from worker_pool import get_worker_pool
+    pool = get_worker_pool()
+    if pool is not None:
+        return pool.apply_custom_kernel(plan, image, block_dim, backend, postprocess)
+
+    if backend == "cpu":
+        return apply_custom_cpu(image, plan, block_dim, postprocess)
+    return apply_custom_cuda(image, plan, block_dim, postprocess)
@@ -0,0 +1,45 @@
+# filters/engine_crossover.py
+# Measured mask sizes from which an alternative engine (e.g. Prewitt "sat")
+# beats "direct", per backend. Timings cover the whole filter call, so
+# setup passes such as the SAT build are included. Regenerate with
+# benchmarks/engine_crossover.py.
+
+import json
+import os
+import threading
+from typing import Optional
+
+ENGINE_CROSSOVER_PATH = os.path.join(os.path.dirname(__file__), "engine_crossover.json")
+
+_table: Optional[dict] = None
+_table_lock = threading.Lock()
+
+
+def load_engine_crossover(path: str = ENGINE_CROSSOVER_PATH) -> dict:
+    """Crossover table {backend: {filter_type: {engine: min mask size or None}}}, loaded once."""
+    global _table
+    with _table_lock:
+        if _table is None:
+            try:
+                with open(path) as f:
+                    _table = json.load(f).get("crossover", {})
+            except (OSError, ValueError):
+                _table = {}
+        return _table
+
+
+def set_engine_crossover(table: Optional[dict]):
+    """Replace the loaded table (None reloads it from ENGINE_CROSSOVER_PATH)."""
+    global _table
+    with _table_lock:
+        _table = table
+
+
+def engine_min_mask(filter_type: str, engine: str, backend: Optional[str], default: Optional[int]) -> Optional[int]:
+    """
+    Smallest mask size from which `engine` should replace "direct" on backend.
+
+    Returns the table entry (None = never) when there is one, else default.
+    """
+    entries = load_engine_crossover().get(backend or "", {}).get(filter_type, {})
+    return entries[engine] if engine in entries else default
@@ -0,0 +1,200 @@
+# filters/fft.py
+# FFT (overlap-add) engine shared by every filter that can be written as
+# correlations with fixed NxN kernels. Runs on the host with SciPy, so the
+# cost barely grows with the mask size (51, 101, ...).
+
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy import signal
+
+from .box_blur import box_blur_kernel
+from .gaussian import make_gauss_1d
+from .laplacian import LAPLACIAN_3X3_KERNEL, make_log_kernel
+from .prewitt import combine_to_gray, prewitt_sign_weights
+
+# Measured mask sizes from which "fft" beats the best other engine, per
+# backend and filter (null = never). Regenerate with benchmarks/fft_crossover.py.
+FFT_CROSSOVER_PATH = os.path.join(os.path.dirname(__file__), "fft_crossover.json")
+
+# Backends where the fft engine runs natively. On CUDA it would run this
+# host implementation, so "auto" never picks it there (and results report
+# backend_used "cpu" when it is requested explicitly).
+FFT_BACKENDS = ("cpu",)
+
+# kernels(N) -> list of 2D kernels to correlate with
+KernelProvider = Callable[[int], List[np.ndarray]]
+# finalize(responses, N, gain) -> float32 image with the direct engine's quantization
+Finalizer = Callable[[List[np.ndarray], int, float], np.ndarray]
+
+FFT_FILTERS: Dict[str, Tuple[KernelProvider, Finalizer]] = {}
+
+
+def register_fft_filter(filter_type: str, kernels: KernelProvider, finalize: Finalizer):
+    """Make a filter available to the fft engine."""
+    FFT_FILTERS[filter_type] = (kernels, finalize)
+
+
+def fft_correlate(image: np.ndarray, kernel: np.ndarray) -> np.ndarray:
+    """
+    Correlate an (H, W) or (H, W, C) image with a 2D kernel via overlap-add FFT.
+
+    The image is edge-padded by the kernel radius first, so borders match the
+    clampi() handling of the CUDA kernels (scipy mode="nearest").
+
+    Returns:
+        float64 array with the image's shape
+    """
+    ry, rx = kernel.shape[0] // 2, kernel.shape[1] // 2
+    extra = image.ndim - 2
+    padded = np.pad(image.astype(np.float64), [(ry, ry), (rx, rx)] + [(0, 0)] * extra, mode="edge")
+
+    # Convolution with the flipped kernel == correlation; size-1 axes keep channels apart
+    k = kernel[::-1, ::-1].astype(np.float64).reshape(kernel.shape + (1,) * extra)
+    return signal.oaconvolve(padded, k, mode="valid", axes=(0, 1))
+
+
+# ---------- kernel providers ----------
+
+def _box_kernels(N: int) -> List[np.ndarray]:
+    # Unnormalized, so responses round back to the exact integer window sums
+    return [box_blur_kernel(N).astype(np.float64) * (N * N)]
+
+
+def _box_finalize(responses: List[np.ndarray], N: int, gain: float) -> np.ndarray:
+    acc = np.rint(responses[0]).astype(np.float32)
+    invN = np.float32(1.0) / np.float32(N)
+    val = (acc * invN * invN + np.float32(0.5)).astype(np.int32)
+    return np.clip(val, 0, 255).astype(np.uint8).astype(np.float32)
+
+
+def _gaussian_kernels(N: int) -> List[np.ndarray]:
+    # Same 1D weights as gauss_horiz_f / gauss_vert_f
+    k1d = make_gauss_1d(N).astype(np.float64)
+    return [np.outer(k1d, k1d)]
+
+
+def _gaussian_finalize(responses: List[np.ndarray], N: int, gain: float) -> np.ndarray:
+    out = np.clip(responses[0].astype(np.float32), 0.0, 255.0) + np.float32(0.5)
+    return out.astype(np.uint8).astype(np.float32)
+
+
+def _laplacian_kernels(N: int) -> List[np.ndarray]:
+    if N == 3:
+        return [LAPLACIAN_3X3_KERNEL.astype(np.float64)]
+    return [make_log_kernel(N).astype(np.float64)]
+
+
+def _laplacian_finalize(responses: List[np.ndarray], N: int, gain: float) -> np.ndarray:
+    if N == 3:
+        # Integer kernel: round back to the exact sums, then abs/clamp
+        return np.minimum(np.abs(np.rint(responses[0])), 255).astype(np.float32)
+    v = np.minimum(np.abs(responses[0].astype(np.float32)), np.float32(255.0)) + np.float32(0.5)
+    return v.astype(np.uint8).astype(np.float32)
+
+
+def _prewitt_kernels(N: int) -> List[np.ndarray]:
+    ones = np.ones(N, dtype=np.float64)
+    sign = prewitt_sign_weights(N).astype(np.float64)
+    return [np.outer(ones, sign), np.outer(sign, ones)]  # gx, gy
+
+
+def _prewitt_finalize(responses: List[np.ndarray], N: int, gain: float) -> np.ndarray:
+    gx, gy = (np.rint(r) for r in responses)
+    return combine_to_gray(gx, gy, N, gain)
+
+
+register_fft_filter("box_blur", _box_kernels, _box_finalize)
+register_fft_filter("gaussian", _gaussian_kernels, _gaussian_finalize)
+register_fft_filter("laplacian", _laplacian_kernels, _laplacian_finalize)
+register_fft_filter("prewitt", _prewitt_kernels, _prewitt_finalize)
+
+
+def apply_fft_filter(
+    filter_type: str,
+    image: np.ndarray,
+    block_dim: Tuple[int, int] = None,
+    grid_dim: Tuple[int, int] = None,
+    mask_size: int = 3,
+    gain: float = 8.0,
+    **kwargs
+) -> Tuple[np.ndarray, Dict[str, float]]:
+    """
+    Apply a registered filter with the FFT engine.
+
+    Integer-kernel filters (box_blur, Laplacian 3x3, Prewitt) round the FFT
+    responses back to exact sums and match the direct engines bit for bit;
+    float-kernel filters (Gaussian, LoG) can differ by 1 on rare pixels.
+
+    Args:
+        filter_type: Key of FFT_FILTERS
+        image: Image (float32), shape (H, W) or (H, W, C)
+        block_dim: Ignored (kept for signature compatibility)
+        grid_dim: Ignored (kept for signature compatibility)
+        mask_size: Mask size NxN (must be odd)
+        gain: Edge enhancement factor (Prewitt only)
+
+    Returns:
+        (result_image, timings_dict)
+    """
+    if filter_type not in FFT_FILTERS:
+        raise ValueError(f"Filter {filter_type} has no FFT kernel provider")
+
+    if image.ndim not in (2, 3):
+        raise ValueError("Image must be 2D (grayscale) or 3D (H, W, C)")
+
+    if mask_size % 2 == 0:
+        raise ValueError(f"mask_size must be odd, got {mask_size}")
+
+    start = time.perf_counter()
+
+    kernels, finalize = FFT_FILTERS[filter_type]
+    img_u8 = np.clip(image, 0, 255).astype(np.uint8)
+    responses = [fft_correlate(img_u8, k) for k in kernels(mask_size)]
+    result = finalize(responses, mask_size, gain)
+
+    elapsed_ms = (time.perf_counter() - start) * 1000.0
+    timings = {
+        "execution_time_ms": float(elapsed_ms),
+        "kernel_time_ms": float(elapsed_ms),
+    }
+
+    return result, timings
+
+
+# ---------- crossover table ----------
+
+_crossover: Optional[dict] = None
+_crossover_lock = threading.Lock()
+
+
+def load_crossover_table(path: str = FFT_CROSSOVER_PATH) -> dict:
+    """Crossover table {backend: {filter_type: min mask size or None}}, loaded once."""
+    global _crossover
+    with _crossover_lock:
+        if _crossover is None:
+            try:
+                with open(path) as f:
+                    _crossover = json.load(f).get("crossover", {})
+            except (OSError, ValueError):
+                _crossover = {}
+        return _crossover
+
+
+def set_crossover_table(table: Optional[dict]):
+    """Replace the loaded table (None reloads it from FFT_CROSSOVER_PATH)."""
+    global _crossover
+    with _crossover_lock:
+        _crossover = table
+
+
+def prefers_fft(filter_type: str, mask_size: int, backend: str) -> bool:
+    """True if the measured crossover for this backend and filter is at or below mask_size."""
+    if backend not in FFT_BACKENDS:
+        return False
+    threshold = load_crossover_table().get(backend, {}).get(filter_type)
+    return threshold is not None and mask_size >= threshold
@@ -2,14 +2,19 @@
 # Gaussian Filter: Smoothing with gaussian distribution
 # Complete CUDA implementation with separable convolution
 
+import time
+
 import numpy as np
+from scipy import ndimage
 from typing import Tuple, Dict
 
 # Import shared CUDA initialization
 import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-from cuda_kernels import _initialize_cuda
+from cuda_kernels import _initialize_cuda, from_planes, timed_copy, to_planes
+from buffer_pool import get_device_pool, get_host_pool
+from kernel_specialization import float_array, get_kernel, register_specialization, render
 
 # CUDA code for separable Gaussian filter
 GAUSSIAN_CUDA_SRC = r"""
@@ -24,6 +29,9 @@ __global__ void u8_to_f(const unsigned char* __restrict__ in_u8,
                         float* __restrict__ out_f,
                         int w, int h)
 {
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    in_u8 += plane; out_f += plane;
+
     int x = blockIdx.x * blockDim.x + threadIdx.x;
     int y = blockIdx.y * blockDim.y + threadIdx.y;
     if (x >= w || y >= h) return;
@@ -36,6 +44,9 @@ __global__ void gauss_horiz_f(const float* __restrict__ in,
                               int w, int h,
                               const float* __restrict__ k1d, int N)
 {
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    in += plane; tmp += plane;
+
     int x = blockIdx.x * blockDim.x + threadIdx.x;
     int y = blockIdx.y * blockDim.y + threadIdx.y;
     if (x >= w || y >= h) return;
@@ -57,6 +68,9 @@ __global__ void gauss_vert_f(const float* __restrict__ tmp,
                              int w, int h,
                              const float* __restrict__ k1d, int N)
 {
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    tmp += plane; out += plane;
+
     int x = blockIdx.x * blockDim.x + threadIdx.x;
     int y = blockIdx.y * blockDim.y + threadIdx.y;
     if (x >= w || y >= h) return;
@@ -80,6 +94,9 @@ __global__ void f_to_u8(const float* __restrict__ in_f,
                         unsigned char* __restrict__ out_u8,
                         int w, int h)
 {
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    in_f += plane; out_u8 += plane;
+
     int x = blockIdx.x * blockDim.x + threadIdx.x;
     int y = blockIdx.y * blockDim.y + threadIdx.y;
     if (x >= w || y >= h) return;
@@ -95,6 +112,71 @@ __global__ void f_to_u8(const float* __restrict__ in_f,
 } // extern C
 """
 
+# gauss_horiz_f / gauss_vert_f with N and make_gauss_1d(N) baked in
+# (same parameters as the generic kernels; k1d and N arguments are ignored)
+GAUSSIAN_SPECIALIZED_SRC = r"""
+extern "C" {
+
+__device__ __forceinline__ int clampi(int v, int lo, int hi){
+    return v < lo ? lo : (v > hi ? hi : v);
+}
+
+__global__ void gauss_horiz_f_n${N}(const float* __restrict__ in,
+                                    float* __restrict__ tmp,
+                                    int w, int h,
+                                    const float* __restrict__ k1d_arg, int N_arg)
+{
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    in += plane; tmp += plane;
+
+    const int N = ${N};
+    const float k1d[${N}] = ${K1D};
+
+    int x = blockIdx.x * blockDim.x + threadIdx.x;
+    int y = blockIdx.y * blockDim.y + threadIdx.y;
+    if (x >= w || y >= h) return;
+
+    const int r = N / 2;
+    float acc = 0.f;
+    int row_offset = y * w;
+
+    #pragma unroll
+    for(int i = -r; i <= r; ++i){
+        int xx = clampi(x + i, 0, w - 1);
+        acc += in[row_offset + xx] * k1d[i + r];
+    }
+    tmp[row_offset + x] = acc;
+}
+
+__global__ void gauss_vert_f_n${N}(const float* __restrict__ tmp,
+                                   float* __restrict__ out,
+                                   int w, int h,
+                                   const float* __restrict__ k1d_arg, int N_arg)
+{
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    tmp += plane; out += plane;
+
+    const int N = ${N};
+    const float k1d[${N}] = ${K1D};
+
+    int x = blockIdx.x * blockDim.x + threadIdx.x;
+    int y = blockIdx.y * blockDim.y + threadIdx.y;
+    if (x >= w || y >= h) return;
+
+    const int r = N / 2;
+    float acc = 0.f;
+
+    #pragma unroll
+    for(int j = -r; j <= r; ++j){
+        int yy = clampi(y + j, 0, h - 1);
+        acc += tmp[yy * w + x] * k1d[j + r];
+    }
+    out[y * w + x] = acc;
+}
+
+} // extern C
+"""
+
 # Compiled module (lazy)
 _gaussian_mod = None
 _gaussian_compiled = False
@@ -140,6 +222,15 @@ def make_gauss_1d(N: int, sigma: float = None) -> np.ndarray:
     return k.astype(np.float32)
 
 
+def generate_gaussian_specialization(N: int):
+    """Source of the separable passes specialized for mask size N (default sigma)."""
+    source = render(GAUSSIAN_SPECIALIZED_SRC, N=N, K1D=float_array(make_gauss_1d(N)))
+    return source, ("gauss_horiz_f", "gauss_vert_f")
+
+
+register_specialization("gaussian", generate_gaussian_specialization)
+
+
 def apply_gaussian_cuda(
     image: np.ndarray,
     block_dim: Tuple[int, int],
@@ -152,7 +243,8 @@ def apply_gaussian_cuda(
     Apply Gaussian filter using separable CUDA convolution.
     
     Args:
-        image: Grayscale image (float32), shape (H, W)
+        image: Image (float32), shape (H, W) or (H, W, C); all channels are
+               filtered in the same launches (grid z = C)
         block_dim: (blockX, blockY)
         grid_dim: Ignored, calculated automatically
         mask_size: Kernel size N (default 3, must be odd)
@@ -163,15 +255,16 @@ def apply_gaussian_cuda(
     """
     import pycuda.driver as cuda
     
+    wall_start = time.perf_counter()
     _ensure_gaussian_compiled()
     
-    if image.ndim != 2:
-        raise ValueError("Image must be 2D (grayscale)")
+    if image.ndim not in (2, 3):
+        raise ValueError("Image must be 2D (grayscale) or 3D (H, W, C)")
     
     if mask_size % 2 == 0:
         raise ValueError(f"mask_size must be odd, got {mask_size}")
     
-    h, w = image.shape
+    h, w = image.shape[:2]
     N = mask_size
     
     # Convert to uint8 if float32
@@ -180,8 +273,11 @@ def apply_gaussian_cuda(
     else:
         img_u8 = image.astype(np.uint8)
     
-    gray = np.ascontiguousarray(img_u8.reshape(-1))
-    Npix = w * h
+    # Channels as (C, H, W) planes, one grid z-slice per plane
+    planes = to_planes(img_u8)
+    C = planes.shape[0]
+    gray = planes.reshape(-1)
+    Npix = w * h * C
     bytesGray = Npix
     
     # Calculate correct grid
@@ -190,50 +286,110 @@ def apply_gaussian_cuda(
     gridY = (h + blockY - 1) // blockY
     
     block = (blockX, blockY, 1)
-    grid = (gridX, gridY, 1)
+    grid = (gridX, gridY, C)
     
     # Build 1D Gaussian kernel
     k1d = make_gauss_1d(N, sigma)
     
-    # Allocate GPU memory
-    d_u8 = cuda.mem_alloc(bytesGray)
-    d_in = cuda.mem_alloc(Npix * 4)
-    d_tmp = cuda.mem_alloc(Npix * 4)
-    d_out = cuda.mem_alloc(Npix * 4)
-    d_k1d = cuda.mem_alloc(N * 4)
-    d_result = cuda.mem_alloc(bytesGray)
-    
-    # Copy to GPU
-    cuda.memcpy_htod(d_u8, gray)
-    cuda.memcpy_htod(d_k1d, k1d)
-    
-    # Get functions
-    u8_to_f = _gaussian_mod.get_function("u8_to_f")
-    gauss_horiz = _gaussian_mod.get_function("gauss_horiz_f")
-    gauss_vert = _gaussian_mod.get_function("gauss_vert_f")
-    f_to_u8 = _gaussian_mod.get_function("f_to_u8")
-    
-    # Measure time
-    start = cuda.Event()
-    stop = cuda.Event()
-    start.record()
-    
-    # Execute kernels: u8->float, horiz, vert, float->u8
-    u8_to_f(d_u8, d_in, np.int32(w), np.int32(h), block=block, grid=grid)
-    gauss_horiz(d_in, d_tmp, np.int32(w), np.int32(h), d_k1d, np.int32(N), block=block, grid=grid)
-    gauss_vert(d_tmp, d_out, np.int32(w), np.int32(h), d_k1d, np.int32(N), block=block, grid=grid)
-    f_to_u8(d_out, d_result, np.int32(w), np.int32(h), block=block, grid=grid)
-    
-    stop.record()
-    stop.synchronize()
-    elapsed_ms = start.time_till(stop)
-    
-    # Copy result
-    out = np.empty(bytesGray, dtype=np.uint8)
-    cuda.memcpy_dtoh(out, d_result)
-    
-    result = out.reshape(h, w).astype(np.float32)
+    # Lease GPU buffers from the shared pool (returned on exit, reused across requests)
+    with get_device_pool().leases() as dev, get_host_pool().leases() as host:
+        d_u8 = dev.alloc(bytesGray)
+        d_in = dev.alloc(Npix * 4)
+        d_tmp = dev.alloc(Npix * 4)
+        d_out = dev.alloc(Npix * 4)
+        d_k1d = dev.alloc(N * 4)
+        d_result = dev.alloc(bytesGray)
+        
+        # Copy to GPU
+        upload_ms = timed_copy(cuda.memcpy_htod, d_u8, gray)
+        upload_ms += timed_copy(cuda.memcpy_htod, d_k1d, k1d)
+        
+        # Get functions (baked-weight variants only match the default sigma)
+        u8_to_f = _gaussian_mod.get_function("u8_to_f")
+        if sigma is None:
+            gauss_horiz = get_kernel("gaussian", N, "gauss_horiz_f", _gaussian_mod)
+            gauss_vert = get_kernel("gaussian", N, "gauss_vert_f", _gaussian_mod)
+        else:
+            gauss_horiz = _gaussian_mod.get_function("gauss_horiz_f")
+            gauss_vert = _gaussian_mod.get_function("gauss_vert_f")
+        f_to_u8 = _gaussian_mod.get_function("f_to_u8")
+        
+        # Measure time
+        start = cuda.Event()
+        stop = cuda.Event()
+        start.record()
+        
+        # Execute kernels: u8->float, horiz, vert, float->u8
+        u8_to_f(d_u8, d_in, np.int32(w), np.int32(h), block=block, grid=grid)
+        gauss_horiz(d_in, d_tmp, np.int32(w), np.int32(h), d_k1d, np.int32(N), block=block, grid=grid)
+        gauss_vert(d_tmp, d_out, np.int32(w), np.int32(h), d_k1d, np.int32(N), block=block, grid=grid)
+        f_to_u8(d_out, d_result, np.int32(w), np.int32(h), block=block, grid=grid)
+        
+        stop.record()
+        stop.synchronize()
+        elapsed_ms = start.time_till(stop)
+        
+        # Copy result into pinned staging memory
+        out = host.alloc(bytesGray)[:bytesGray]
+        download_ms = timed_copy(cuda.memcpy_dtoh, out, d_result)
+        
+        result = from_planes(out.reshape(C, h, w), image.ndim).astype(np.float32)
+    
+    timings = {
+        "execution_time_ms": (time.perf_counter() - wall_start) * 1000.0,
+        "kernel_time_ms": float(elapsed_ms),
+        "upload_ms": upload_ms,
+        "download_ms": download_ms,
+    }
+    
+    return result, timings
+
+
+def apply_gaussian_cpu(
+    image: np.ndarray,
+    block_dim: Tuple[int, int] = None,
+    grid_dim: Tuple[int, int] = None,
+    mask_size: int = 3,
+    sigma: float = None,
+    **kwargs
+) -> Tuple[np.ndarray, Dict[str, float]]:
+    """
+    Apply Gaussian filter on the CPU with separable NumPy/SciPy passes.
+    
+    Mirrors apply_gaussian_cuda: clamp-to-edge borders, horizontal then
+    vertical 1D pass with make_gauss_1d, and uint8 rounding (v + 0.5).
+    
+    Args:
+        image: Image (float32), shape (H, W) or (H, W, C); channels are
+               filtered independently in the same vectorized pass
+        block_dim: Ignored (kept for signature compatibility)
+        grid_dim: Ignored (kept for signature compatibility)
+        mask_size: Kernel size N (default 3, must be odd)
+        sigma: Standard deviation (default None = mask_size/6)
+    
+    Returns:
+        (result_image, timings_dict)
+    """
+    if image.ndim not in (2, 3):
+        raise ValueError("Image must be 2D (grayscale) or 3D (H, W, C)")
+    
+    if mask_size % 2 == 0:
+        raise ValueError(f"mask_size must be odd, got {mask_size}")
+    
+    start = time.perf_counter()
+    
+    # Same uint8 input quantization as the CUDA path
+    img_f = np.clip(image, 0, 255).astype(np.uint8).astype(np.float32)
+    k1d = make_gauss_1d(mask_size, sigma)
+    
+    # mode="nearest" replicates clampi() border handling
+    tmp = ndimage.correlate1d(img_f, k1d, axis=1, mode="nearest")
+    out = ndimage.correlate1d(tmp, k1d, axis=0, mode="nearest")
+    
+    out = np.clip(out, 0.0, 255.0) + np.float32(0.5)
+    result = out.astype(np.uint8).astype(np.float32)
     
+    elapsed_ms = (time.perf_counter() - start) * 1000.0
     timings = {
         "execution_time_ms": float(elapsed_ms),
         "kernel_time_ms": float(elapsed_ms),
@@ -2,14 +2,20 @@
 # Laplacian Filter: Edge detector based on second derivative
 # Complete CUDA implementation supporting variable kernel sizes
 
+import time
+
 import numpy as np
-from typing import Tuple, Dict
+from scipy import ndimage
+from typing import Dict, Optional, Tuple
 
 # Import shared CUDA initialization
 import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-from cuda_kernels import _initialize_cuda
+from cuda_kernels import _initialize_cuda, from_planes, timed_copy, to_planes
+from buffer_pool import get_device_pool, get_host_pool
+from kernel_specialization import float_array, float_literal, get_kernel, register_specialization, render
+from .engine_crossover import engine_min_mask
 
 # CUDA code for Laplacian and Laplacian of Gaussian (LoG)
 LAPLACIAN_CUDA_SRC = r"""
@@ -32,6 +38,9 @@ __global__ void laplacian3x3_u8_to_u8(const unsigned char* __restrict__ gray,
                                        unsigned char* __restrict__ out,
                                        int w, int h)
 {
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    gray += plane; out += plane;
+
     int x = blockIdx.x * blockDim.x + threadIdx.x;
     int y = blockIdx.y * blockDim.y + threadIdx.y;
     if (x >= w || y >= h) return;
@@ -63,6 +72,9 @@ __global__ void conv_log_u8_to_f(const unsigned char* __restrict__ gray,
                                  float* __restrict__ out,
                                  int w, int h)
 {
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    gray += plane; out += plane;
+
     int x = blockIdx.x * blockDim.x + threadIdx.x;
     int y = blockIdx.y * blockDim.y + threadIdx.y;
     if (x >= w || y >= h) return;
@@ -87,6 +99,9 @@ __global__ void f_abs_to_u8(const float* __restrict__ in,
                              unsigned char* __restrict__ out,
                              int w, int h)
 {
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    in += plane; out += plane;
+
     int x = blockIdx.x * blockDim.x + threadIdx.x;
     int y = blockIdx.y * blockDim.y + threadIdx.y;
     if (x >= w || y >= h) return;
@@ -98,9 +113,215 @@ __global__ void f_abs_to_u8(const float* __restrict__ in,
     out[IDX(x, y, w)] = (unsigned char)(v + 0.5f);
 }
 
+// ---------- Separable LoG engine ----------
+// K = A (x) G + G (x) A - corr * 1 (x) 1, see separable_log_factors().
+// W holds G[0..N) followed by A[0..N).
+
+// Column passes: VG = gray * G, VA = gray * A, VB = gray * 1 (box sum)
+__global__ void log_sep_vert_u8_to_f(const unsigned char* __restrict__ gray,
+                                     const float* __restrict__ W, int N,
+                                     float* __restrict__ VG,
+                                     float* __restrict__ VA,
+                                     float* __restrict__ VB,
+                                     int w, int h)
+{
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    gray += plane; VG += plane; VA += plane; VB += plane;
+
+    int x = blockIdx.x * blockDim.x + threadIdx.x;
+    int y = blockIdx.y * blockDim.y + threadIdx.y;
+    if (x >= w || y >= h) return;
+
+    int r = N / 2;
+    float g = 0.f, a = 0.f, b = 0.f;
+
+    for (int k = -r; k <= r; ++k){
+        float p = (float)gray[IDX(x, clampi(y + k, 0, h - 1), w)];
+        g += p * W[k + r];
+        a += p * W[N + k + r];
+        b += p;
+    }
+
+    size_t i = IDX(x, y, w);
+    VG[i] = g;
+    VA[i] = a;
+    VB[i] = b;
+}
+
+// Row passes + combine: acc = VG * A + VA * G - corr * (VB * 1), then abs -> uint8
+__global__ void log_sep_horiz_to_u8(const float* __restrict__ VG,
+                                    const float* __restrict__ VA,
+                                    const float* __restrict__ VB,
+                                    const float* __restrict__ W, int N, float corr,
+                                    unsigned char* __restrict__ out,
+                                    int w, int h)
+{
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    VG += plane; VA += plane; VB += plane; out += plane;
+
+    int x = blockIdx.x * blockDim.x + threadIdx.x;
+    int y = blockIdx.y * blockDim.y + threadIdx.y;
+    if (x >= w || y >= h) return;
+
+    int r = N / 2;
+    size_t row = (size_t)y * w;
+    float ga = 0.f, ag = 0.f, bb = 0.f;
+
+    for (int k = -r; k <= r; ++k){
+        size_t i = row + clampi(x + k, 0, w - 1);
+        ga += VG[i] * W[N + k + r];
+        ag += VA[i] * W[k + r];
+        bb += VB[i];
+    }
+
+    float v = ga + ag - corr * bb;
+    if (v < 0.f) v = -v;
+    if (v > 255.f) v = 255.f;
+
+    out[IDX(x, y, w)] = (unsigned char)(v + 0.5f);
+}
+
 } // extern C
 """
 
+# LoG kernels with N, make_log_kernel(N) and separable_log_factors(N) baked in
+# (same parameters as the generic kernels; K / W / N / corr arguments are ignored)
+LAPLACIAN_SPECIALIZED_SRC = r"""
+extern "C" {
+
+__device__ __forceinline__ int clampi(int v, int lo, int hi){
+    return v < lo ? lo : (v > hi ? hi : v);
+}
+
+__device__ __forceinline__ size_t IDX(int x, int y, int w){
+    return (size_t)y * w + x;
+}
+
+__global__ void conv_log_u8_to_f_n${N}(const unsigned char* __restrict__ gray,
+                                       const float* __restrict__ K_arg, int N_arg,
+                                       float* __restrict__ out,
+                                       int w, int h)
+{
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    gray += plane; out += plane;
+
+    const int N = ${N};
+    const float K[${N} * ${N}] = ${K};
+
+    int x = blockIdx.x * blockDim.x + threadIdx.x;
+    int y = blockIdx.y * blockDim.y + threadIdx.y;
+    if (x >= w || y >= h) return;
+
+    const int r = N / 2;
+    float acc = 0.f;
+
+    #pragma unroll
+    for (int ky = -r; ky <= r; ++ky){
+        int yy = clampi(y + ky, 0, h - 1);
+        int krow = (ky + r) * N;
+        #pragma unroll
+        for (int kx = -r; kx <= r; ++kx){
+            int xx = clampi(x + kx, 0, w - 1);
+            acc += (float)gray[IDX(xx, yy, w)] * K[krow + (kx + r)];
+        }
+    }
+
+    out[IDX(x, y, w)] = acc;
+}
+
+__global__ void log_sep_vert_u8_to_f_n${N}(const unsigned char* __restrict__ gray,
+                                           const float* __restrict__ W_arg, int N_arg,
+                                           float* __restrict__ VG,
+                                           float* __restrict__ VA,
+                                           float* __restrict__ VB,
+                                           int w, int h)
+{
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    gray += plane; VG += plane; VA += plane; VB += plane;
+
+    const int N = ${N};
+    const float W[2 * ${N}] = ${W};
+
+    int x = blockIdx.x * blockDim.x + threadIdx.x;
+    int y = blockIdx.y * blockDim.y + threadIdx.y;
+    if (x >= w || y >= h) return;
+
+    const int r = N / 2;
+    float g = 0.f, a = 0.f, b = 0.f;
+
+    #pragma unroll
+    for (int k = -r; k <= r; ++k){
+        float p = (float)gray[IDX(x, clampi(y + k, 0, h - 1), w)];
+        g += p * W[k + r];
+        a += p * W[N + k + r];
+        b += p;
+    }
+
+    size_t i = IDX(x, y, w);
+    VG[i] = g;
+    VA[i] = a;
+    VB[i] = b;
+}
+
+__global__ void log_sep_horiz_to_u8_n${N}(const float* __restrict__ VG,
+                                          const float* __restrict__ VA,
+                                          const float* __restrict__ VB,
+                                          const float* __restrict__ W_arg, int N_arg, float corr_arg,
+                                          unsigned char* __restrict__ out,
+                                          int w, int h)
+{
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    VG += plane; VA += plane; VB += plane; out += plane;
+
+    const int N = ${N};
+    const float W[2 * ${N}] = ${W};
+    const float corr = ${CORR};
+
+    int x = blockIdx.x * blockDim.x + threadIdx.x;
+    int y = blockIdx.y * blockDim.y + threadIdx.y;
+    if (x >= w || y >= h) return;
+
+    const int r = N / 2;
+    size_t row = (size_t)y * w;
+    float ga = 0.f, ag = 0.f, bb = 0.f;
+
+    #pragma unroll
+    for (int k = -r; k <= r; ++k){
+        size_t i = row + clampi(x + k, 0, w - 1);
+        ga += VG[i] * W[N + k + r];
+        ag += VA[i] * W[k + r];
+        bb += VB[i];
+    }
+
+    float v = ga + ag - corr * bb;
+    if (v < 0.f) v = -v;
+    if (v > 255.f) v = 255.f;
+
+    out[IDX(x, y, w)] = (unsigned char)(v + 0.5f);
+}
+
+} // extern C
+"""
+
+# LoG engines (mask_size > 3): "direct" = dense NxN loop (O(N^2) per pixel),
+# "separable" = sum of separable products (O(N) per pixel). mask_size 3 is
+# always the classic integer Laplacian.
+ENGINES = ("direct", "separable")
+
+# "auto" picks separable from the measured crossover in
+# filters/engine_crossover.json, or from LOG_SEPARABLE_MIN_MASK for backends
+# the table does not cover
+LOG_SEPARABLE_MIN_MASK = 7
+
+
+def choose_laplacian_engine(mask_size: int, backend: Optional[str] = None) -> str:
+    """Engine used by engine="auto" for a given mask size and backend."""
+    min_mask = engine_min_mask("laplacian", "separable", backend, LOG_SEPARABLE_MIN_MASK)
+    if mask_size > 3 and min_mask is not None and mask_size >= min_mask:
+        return "separable"
+    return "direct"
+
+
 # Compiled module (lazy)
 _laplacian_mod = None
 _laplacian_compiled = False
@@ -153,38 +374,106 @@ def make_log_kernel(N: int) -> np.ndarray:
     return K.astype(np.float32)
 
 
+def separable_log_factors(N: int) -> Tuple[np.ndarray, np.ndarray, float]:
+    """
+    Split make_log_kernel(N) into separable terms.
+    
+    With g(t) = exp(-t^2 / (2*sigma^2)) and A(t) = -((t^2 - sigma^2)/sigma^4) * g(t),
+    the LoG is A(x)g(y) + g(x)A(y), and make_log_kernel also subtracts its
+    mean, so K[y, x] = A[x]*G[y] + G[x]*A[y] - corr.
+    
+    Args:
+        N: Kernel size (must be odd)
+    
+    Returns:
+        (G, A, corr): float32 1D factors and the mean correction
+    """
+    c = N // 2
+    sigma = N / 6.0
+    s2 = sigma * sigma
+    s4 = s2 * s2
+    
+    t = np.arange(-c, c + 1, dtype=np.float64)
+    G = np.exp(-(t * t) / (2.0 * s2))
+    A = -((t * t - s2) / s4) * G
+    
+    # Same mean correction as make_log_kernel
+    corr = float((np.outer(G, A) + np.outer(A, G)).sum()) / float(N * N)
+    return G.astype(np.float32), A.astype(np.float32), corr
+
+
+def separable_log_error(N: int) -> float:
+    """Max abs difference between the separable reconstruction and make_log_kernel(N)."""
+    G, A, corr = separable_log_factors(N)
+    G64 = G.astype(np.float64)
+    A64 = A.astype(np.float64)
+    K_sep = np.outer(G64, A64) + np.outer(A64, G64) - corr
+    return float(np.abs(K_sep - make_log_kernel(N).astype(np.float64)).max())
+
+
+def generate_laplacian_specialization(N: int):
+    """Source of the LoG kernels (direct and separable) specialized for mask size N."""
+    if N == 3:
+        return None  # laplacian3x3_u8_to_u8 is already a fixed 3x3 kernel
+    G, A, corr = separable_log_factors(N)
+    source = render(
+        LAPLACIAN_SPECIALIZED_SRC,
+        N=N,
+        K=float_array(make_log_kernel(N)),
+        W=float_array(np.concatenate([G, A])),
+        CORR=float_literal(corr),
+    )
+    return source, ("conv_log_u8_to_f", "log_sep_vert_u8_to_f", "log_sep_horiz_to_u8")
+
+
+register_specialization("laplacian", generate_laplacian_specialization)
+
+
+def _check_engine(engine: str, N: int):
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown laplacian engine: {engine}. Expected one of {list(ENGINES)}")
+    if engine == "separable" and N == 3:
+        raise ValueError("The separable engine applies to LoG masks (mask_size > 3)")
+
+
 def apply_laplacian_cuda(
     image: np.ndarray,
     block_dim: Tuple[int, int],
     grid_dim: Tuple[int, int],
     mask_size: int = 3,
+    engine: str = "direct",
     **kwargs
 ) -> Tuple[np.ndarray, Dict[str, float]]:
     """
     Apply Laplacian or LoG filter using CUDA.
     
     Args:
-        image: Grayscale image (float32), shape (H, W)
+        image: Image (float32), shape (H, W) or (H, W, C); all channels are
+               filtered in the same launches (grid z = C)
         block_dim: (blockX, blockY)
         grid_dim: Ignored, calculated automatically
         mask_size: Kernel size NxN (default 3, must be odd)
                    3 = classic 3x3 Laplacian
                    >3 = Laplacian of Gaussian (LoG)
+        engine: LoG path, "direct" (NxN loop) or "separable" (row/column passes)
     
     Returns:
         (result_image, timings_dict)
     """
     import pycuda.driver as cuda
     
+    wall_start = time.perf_counter()
     _ensure_laplacian_compiled()
     
-    if image.ndim != 2:
-        raise ValueError("Image must be 2D (grayscale)")
+    if image.ndim not in (2, 3):
+        raise ValueError("Image must be 2D (grayscale) or 3D (H, W, C)")
     
     if mask_size % 2 == 0:
         raise ValueError(f"mask_size must be odd, got {mask_size}")
     
-    h, w = image.shape
+    _check_engine(engine, mask_size)
+    
+    h, w = image.shape[:2]
     N = mask_size
     use_log = (N != 3)
     
@@ -194,8 +483,11 @@ def apply_laplacian_cuda(
     else:
         img_u8 = image.astype(np.uint8)
     
-    gray = np.ascontiguousarray(img_u8.reshape(-1))
-    Npix = w * h
+    # Channels as (C, H, W) planes, one grid z-slice per plane
+    planes = to_planes(img_u8)
+    C = planes.shape[0]
+    gray = planes.reshape(-1)
+    Npix = w * h * C
     bytesGray = Npix
     
     # Calculate correct grid
@@ -204,49 +496,154 @@ def apply_laplacian_cuda(
     gridY = (h + blockY - 1) // blockY
     
     block = (blockX, blockY, 1)
-    grid = (gridX, gridY, 1)
+    grid = (gridX, gridY, C)
+    
+    # Lease GPU buffers from the shared pool (returned on exit, reused across requests)
+    with get_device_pool().leases() as dev, get_host_pool().leases() as host:
+        d_gray = dev.alloc(bytesGray)
+        d_out = dev.alloc(bytesGray)
+        
+        # Copy to GPU
+        upload_ms = timed_copy(cuda.memcpy_htod, d_gray, gray)
+        
+        # Get functions
+        laplacian3x3 = _laplacian_mod.get_function("laplacian3x3_u8_to_u8")
+        conv_log = get_kernel("laplacian", N, "conv_log_u8_to_f", _laplacian_mod)
+        f_abs_to_u8 = _laplacian_mod.get_function("f_abs_to_u8")
+        sep_vert = get_kernel("laplacian", N, "log_sep_vert_u8_to_f", _laplacian_mod)
+        sep_horiz = get_kernel("laplacian", N, "log_sep_horiz_to_u8", _laplacian_mod)
+        
+        # Measure time
+        start = cuda.Event()
+        stop = cuda.Event()
+        start.record()
+        
+        if not use_log:
+            # Classic 3x3 Laplacian
+            laplacian3x3(d_gray, d_out, np.int32(w), np.int32(h), block=block, grid=grid)
+        elif engine == "separable":
+            # LoG as three separable products: column passes, then row passes + combine
+            G, A, corr = separable_log_factors(N)
+            h_W = np.concatenate([G, A]).astype(np.float32)
+            d_W = dev.alloc(2 * N * 4)
+            d_VG = dev.alloc(Npix * 4)
+            d_VA = dev.alloc(Npix * 4)
+            d_VB = dev.alloc(Npix * 4)
+            
+            upload_ms += timed_copy(cuda.memcpy_htod, d_W, h_W)
+            
+            sep_vert(d_gray, d_W, np.int32(N), d_VG, d_VA, d_VB,
+                     np.int32(w), np.int32(h), block=block, grid=grid)
+            sep_horiz(d_VG, d_VA, d_VB, d_W, np.int32(N), np.float32(corr), d_out,
+                      np.int32(w), np.int32(h), block=block, grid=grid)
+        else:
+            # LoG NxN: build kernel, lease temp buffer, run convolution + abs
+            h_K = make_log_kernel(N)
+            d_K = dev.alloc(N * N * 4)
+            d_tmpF = dev.alloc(Npix * 4)
+            
+            upload_ms += timed_copy(cuda.memcpy_htod, d_K, h_K)
+            
+            conv_log(d_gray, d_K, np.int32(N), d_tmpF, np.int32(w), np.int32(h), block=block, grid=grid)
+            f_abs_to_u8(d_tmpF, d_out, np.int32(w), np.int32(h), block=block, grid=grid)
+        
+        stop.record()
+        stop.synchronize()
+        elapsed_ms = start.time_till(stop)
+        
+        # Copy result into pinned staging memory
+        out = host.alloc(bytesGray)[:bytesGray]
+        download_ms = timed_copy(cuda.memcpy_dtoh, out, d_out)
+        
+        result = from_planes(out.reshape(C, h, w), image.ndim).astype(np.float32)
+    
+    timings = {
+        "execution_time_ms": (time.perf_counter() - wall_start) * 1000.0,
+        "kernel_time_ms": float(elapsed_ms),
+        "upload_ms": upload_ms,
+        "download_ms": download_ms,
+    }
+    
+    return result, timings
+
+
+# 8-neighbor kernel used by laplacian3x3_u8_to_u8
+LAPLACIAN_3X3_KERNEL = np.array(
+    [
+        [-1, -1, -1],
+        [-1,  8, -1],
+        [-1, -1, -1],
+    ],
+    dtype=np.int32,
+)
+
+
+def apply_laplacian_cpu(
+    image: np.ndarray,
+    block_dim: Tuple[int, int] = None,
+    grid_dim: Tuple[int, int] = None,
+    mask_size: int = 3,
+    engine: str = "direct",
+    **kwargs
+) -> Tuple[np.ndarray, Dict[str, float]]:
+    """
+    Apply Laplacian or LoG filter on the CPU with vectorized NumPy/SciPy.
+    
+    Mirrors apply_laplacian_cuda: clamp-to-edge borders, integer 3x3
+    Laplacian with abs/clamp, and NxN LoG followed by abs + uint8 rounding.
     
-    # Allocate GPU memory
-    d_gray = cuda.mem_alloc(bytesGray)
-    d_out = cuda.mem_alloc(bytesGray)
+    Args:
+        image: Image (float32), shape (H, W) or (H, W, C); channels are
+               filtered independently in the same vectorized pass
+        block_dim: Ignored (kept for signature compatibility)
+        grid_dim: Ignored (kept for signature compatibility)
+        mask_size: Kernel size NxN (default 3, must be odd)
+        engine: LoG path, "direct" or "separable"
     
-    # Copy to GPU
-    cuda.memcpy_htod(d_gray, gray)
+    Returns:
+        (result_image, timings_dict)
+    """
+    if image.ndim not in (2, 3):
+        raise ValueError("Image must be 2D (grayscale) or 3D (H, W, C)")
     
-    # Get functions
-    laplacian3x3 = _laplacian_mod.get_function("laplacian3x3_u8_to_u8")
-    conv_log = _laplacian_mod.get_function("conv_log_u8_to_f")
-    f_abs_to_u8 = _laplacian_mod.get_function("f_abs_to_u8")
+    if mask_size % 2 == 0:
+        raise ValueError(f"mask_size must be odd, got {mask_size}")
     
-    # Measure time
-    start = cuda.Event()
-    stop = cuda.Event()
-    start.record()
+    _check_engine(engine, mask_size)
     
-    if not use_log:
-        # Classic 3x3 Laplacian
-        laplacian3x3(d_gray, d_out, np.int32(w), np.int32(h), block=block, grid=grid)
-    else:
-        # LoG NxN: build kernel, allocate temp buffer, run convolution + abs
-        h_K = make_log_kernel(N)
-        d_K = cuda.mem_alloc(N * N * 4)
-        d_tmpF = cuda.mem_alloc(Npix * 4)
-        
-        cuda.memcpy_htod(d_K, h_K)
-        
-        conv_log(d_gray, d_K, np.int32(N), d_tmpF, np.int32(w), np.int32(h), block=block, grid=grid)
-        f_abs_to_u8(d_tmpF, d_out, np.int32(w), np.int32(h), block=block, grid=grid)
+    start = time.perf_counter()
     
-    stop.record()
-    stop.synchronize()
-    elapsed_ms = start.time_till(stop)
+    N = mask_size
+    img_u8 = np.clip(image, 0, 255).astype(np.uint8)
     
-    # Copy result
-    out = np.empty(bytesGray, dtype=np.uint8)
-    cuda.memcpy_dtoh(out, d_out)
+    # Trailing channel axis: a size-1 kernel axis keeps channels independent
+    extra_axes = (None,) * (img_u8.ndim - 2)
     
-    result = out.reshape(h, w).astype(np.float32)
+    if N == 3:
+        # Integer arithmetic, same as the CUDA kernel
+        acc = ndimage.correlate(
+            img_u8.astype(np.int32), LAPLACIAN_3X3_KERNEL[(...,) + extra_axes], mode="nearest"
+        )
+        result = np.minimum(np.abs(acc), 255).astype(np.float32)
+    elif engine == "separable":
+        # Same passes and float32 intermediates as log_sep_vert / log_sep_horiz
+        G, A, corr = separable_log_factors(N)
+        gray = img_u8.astype(np.float32)
+        VG = ndimage.correlate1d(gray, G, axis=0, mode="nearest")
+        VA = ndimage.correlate1d(gray, A, axis=0, mode="nearest")
+        VB = ndimage.correlate1d(gray, np.ones(N, dtype=np.float32), axis=0, mode="nearest")
+        acc = (ndimage.correlate1d(VG, A, axis=1, mode="nearest")
+               + ndimage.correlate1d(VA, G, axis=1, mode="nearest")
+               - np.float32(corr) * ndimage.correlate1d(VB, np.ones(N, dtype=np.float32), axis=1, mode="nearest"))
+        v = np.minimum(np.abs(acc), np.float32(255.0)) + np.float32(0.5)
+        result = v.astype(np.uint8).astype(np.float32)
+    else:
+        K = make_log_kernel(N)
+        acc = ndimage.correlate(img_u8.astype(np.float32), K[(...,) + extra_axes], mode="nearest")
+        v = np.minimum(np.abs(acc), np.float32(255.0)) + np.float32(0.5)
+        result = v.astype(np.uint8).astype(np.float32)
     
+    elapsed_ms = (time.perf_counter() - start) * 1000.0
     timings = {
         "execution_time_ms": float(elapsed_ms),
         "kernel_time_ms": float(elapsed_ms),
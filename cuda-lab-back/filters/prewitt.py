@@ -2,14 +2,20 @@
 # Prewitt Filter: Edge detector based on first derivative
 # Complete implementation with separable CUDA
 
+import time
+
 import numpy as np
-from typing import Tuple, Dict
+from scipy import ndimage
+from typing import Dict, Optional, Tuple
 
 # Import shared CUDA initialization
 import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-from cuda_kernels import _initialize_cuda
+from cuda_kernels import _initialize_cuda, from_planes, timed_copy, to_planes
+from buffer_pool import get_device_pool, get_host_pool
+from kernel_specialization import get_kernel, register_specialization, render
+from .engine_crossover import engine_min_mask
 
 # CUDA code for separable Prewitt
 PREWITT_CUDA_SRC = r"""
@@ -28,6 +34,9 @@ __global__ void box_vert_u8_to_f(const unsigned char* __restrict__ gray,
                                  float* __restrict__ V,
                                  int w, int h, int N)
 {
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    gray += plane; V += plane;
+
     int x = blockIdx.x * blockDim.x + threadIdx.x;
     int y = blockIdx.y * blockDim.y + threadIdx.y;
     if (x >= w || y >= h) return;
@@ -48,6 +57,9 @@ __global__ void prewitt_x_from_V(const float* __restrict__ V,
                                  float* __restrict__ gx,
                                  int w, int h, int N)
 {
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    V += plane; gx += plane;
+
     int x = blockIdx.x * blockDim.x + threadIdx.x;
     int y = blockIdx.y * blockDim.y + threadIdx.y;
     if (x >= w || y >= h) return;
@@ -69,6 +81,9 @@ __global__ void box_horiz_u8_to_f(const unsigned char* __restrict__ gray,
                                   float* __restrict__ H,
                                   int w, int h, int N)
 {
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    gray += plane; H += plane;
+
     int x = blockIdx.x * blockDim.x + threadIdx.x;
     int y = blockIdx.y * blockDim.y + threadIdx.y;
     if (x >= w || y >= h) return;
@@ -89,6 +104,9 @@ __global__ void prewitt_y_from_H(const float* __restrict__ H,
                                  float* __restrict__ gy,
                                  int w, int h, int N)
 {
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    H += plane; gy += plane;
+
     int x = blockIdx.x * blockDim.x + threadIdx.x;
     int y = blockIdx.y * blockDim.y + threadIdx.y;
     if (x >= w || y >= h) return;
@@ -111,6 +129,9 @@ __global__ void combine_mag_to_gray(const float* __restrict__ gx,
                                     unsigned char* __restrict__ gray_out,
                                     int w, int h, int N, float gain)
 {
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    gx += plane; gy += plane; gray_out += plane;
+
     int x = blockIdx.x * blockDim.x + threadIdx.x;
     int y = blockIdx.y * blockDim.y + threadIdx.y;
     if (x >= w || y >= h) return;
@@ -125,9 +146,326 @@ __global__ void combine_mag_to_gray(const float* __restrict__ gx,
     gray_out[IDX(x,y,w)] = u;
 }
 
+// ---------- Summed-area-table engine ----------
+// S is the 64-bit integral image of the gray image edge-padded by r = N/2 on
+// every side (clamp borders), with a zero first row and column:
+// (h + N) rows x (w + N) columns, one such table per channel plane.
+
+// Row prefix sums of the padded image, one block of SAT_SCAN_THREADS per
+// padded row. The block walks the row in SAT_SCAN_THREADS-wide tiles: each
+// thread loads one pixel (coalesced), the tile is scanned in shared memory
+// (Hillis-Steele, log2(SAT_SCAN_THREADS) steps), and the running carry of the
+// previous tiles is added on the (coalesced) store.
+#define SAT_SCAN_THREADS 256
+
+__global__ void sat_rows_u8(const unsigned char* __restrict__ gray,
+                            long long* __restrict__ S,
+                            int w, int h, int N)
+{
+    __shared__ long long tile[SAT_SCAN_THREADS];
+
+    gray += (size_t)blockIdx.z * w * h;  // channel plane
+    S += (size_t)blockIdx.z * (w + N) * (h + N);
+
+    int Y = blockIdx.x;  // padded row, grid.x = h + 2r (no early exit: barriers below)
+    int t = threadIdx.x;
+    int r = N / 2;
+    int Wp = w + 2 * r;
+    int sw = w + N;
+
+    const unsigned char* row = gray + (size_t)clampi(Y - r, 0, h - 1) * w;
+    long long* srow = S + (size_t)(Y + 1) * sw;
+
+    if (t == 0) srow[0] = 0;
+    if (Y == 0){
+        for (int X = t; X < sw; X += SAT_SCAN_THREADS) S[X] = 0;
+    }
+
+    long long carry = 0;
+    for (int base = 0; base < Wp; base += SAT_SCAN_THREADS){
+        int X = base + t;
+        tile[t] = (X < Wp) ? (long long)row[clampi(X - r, 0, w - 1)] : 0;
+        __syncthreads();
+
+        for (int offset = 1; offset < SAT_SCAN_THREADS; offset <<= 1){
+            long long v = (t >= offset) ? tile[t - offset] : 0;
+            __syncthreads();
+            tile[t] += v;
+            __syncthreads();
+        }
+
+        if (X < Wp) srow[X + 1] = carry + tile[t];
+        carry += tile[SAT_SCAN_THREADS - 1];
+        __syncthreads();  // everyone has read the tile before the next one overwrites it
+    }
+}
+
+// Column prefix sums in place, one thread per column (coalesced)
+__global__ void sat_cols(long long* __restrict__ S, int w, int h, int N)
+{
+    S += (size_t)blockIdx.z * (w + N) * (h + N);  // channel plane
+
+    int X = blockIdx.x * blockDim.x + threadIdx.x;
+    int sw = w + N;
+    if (X >= sw) return;
+
+    long long acc = 0;
+    for (int Y = 1; Y < h + N; ++Y){
+        acc += S[(size_t)Y * sw + X];
+        S[(size_t)Y * sw + X] = acc;
+    }
+}
+
+// Sum of padded rows [y0, y1) x cols [x0, x1)
+__device__ __forceinline__ long long sat_rect(const long long* __restrict__ S, int sw,
+                                              int y0, int y1, int x0, int x1){
+    return S[(size_t)y1 * sw + x1] - S[(size_t)y0 * sw + x1]
+         - S[(size_t)y1 * sw + x0] + S[(size_t)y0 * sw + x0];
+}
+
+// gx / gy as differences of box sums (16 reads per pixel for any N), then
+// the same magnitude, scaling and rounding as combine_mag_to_gray
+__global__ void prewitt_sat_to_gray(const long long* __restrict__ S,
+                                    unsigned char* __restrict__ gray_out,
+                                    int w, int h, int N, float gain)
+{
+    S += (size_t)blockIdx.z * (w + N) * (h + N);  // channel plane
+    gray_out += (size_t)blockIdx.z * w * h;
+
+    int x = blockIdx.x * blockDim.x + threadIdx.x;
+    int y = blockIdx.y * blockDim.y + threadIdx.y;
+    if (x >= w || y >= h) return;
+
+    int r = N / 2;
+    int sw = w + N;
+
+    // Pixel (x, y) is (x + r, y + r) in padded coordinates
+    long long gx = sat_rect(S, sw, y, y + N, x + r + 1, x + N) - sat_rect(S, sw, y, y + N, x, x + r);
+    long long gy = sat_rect(S, sw, y + r + 1, y + N, x, x + N) - sat_rect(S, sw, y, y + r, x, x + N);
+
+    float mag = fabsf((float)gx) + fabsf((float)gy);
+    float v = (mag * gain) / (float)(N * (long long)N);
+
+    if (v < 0.f) v = 0.f;
+    else if (v > 255.f) v = 255.f;
+
+    gray_out[IDX(x,y,w)] = (unsigned char)(v + 0.5f);
+}
+
 } // extern C
 """
 
+# Per-pixel kernels of both engines with N baked in (same parameters as the
+# generic kernels; the N argument is ignored). The SAT scans stay generic.
+PREWITT_SPECIALIZED_SRC = r"""
+extern "C" {
+
+__device__ __forceinline__ int clampi(int v, int lo, int hi){
+    return v < lo ? lo : (v > hi ? hi : v);
+}
+
+__device__ __forceinline__ size_t IDX(int x, int y, int w){
+    return (size_t)y * w + x;
+}
+
+__global__ void box_vert_u8_to_f_n${N}(const unsigned char* __restrict__ gray,
+                                       float* __restrict__ V,
+                                       int w, int h, int N_arg)
+{
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    gray += plane; V += plane;
+
+    const int N = ${N};
+
+    int x = blockIdx.x * blockDim.x + threadIdx.x;
+    int y = blockIdx.y * blockDim.y + threadIdx.y;
+    if (x >= w || y >= h) return;
+
+    const int r = N / 2;
+    float acc = 0.f;
+
+    #pragma unroll
+    for (int j = -r; j <= r; ++j){
+        int yy = clampi(y + j, 0, h - 1);
+        acc += gray[IDX(x,yy,w)];
+    }
+
+    V[IDX(x,y,w)] = acc;
+}
+
+__global__ void prewitt_x_from_V_n${N}(const float* __restrict__ V,
+                                       float* __restrict__ gx,
+                                       int w, int h, int N_arg)
+{
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    V += plane; gx += plane;
+
+    const int N = ${N};
+
+    int x = blockIdx.x * blockDim.x + threadIdx.x;
+    int y = blockIdx.y * blockDim.y + threadIdx.y;
+    if (x >= w || y >= h) return;
+
+    const int r = N / 2;
+    float acc = 0.f;
+
+    #pragma unroll
+    for (int i = -r; i <= r; ++i){
+        int xx = clampi(x + i, 0, w - 1);
+        int sx = (i < 0 ? -1 : (i > 0 ? +1 : 0));
+        acc += V[IDX(xx,y,w)] * (float)sx;
+    }
+
+    gx[IDX(x,y,w)] = acc;
+}
+
+__global__ void box_horiz_u8_to_f_n${N}(const unsigned char* __restrict__ gray,
+                                        float* __restrict__ H,
+                                        int w, int h, int N_arg)
+{
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    gray += plane; H += plane;
+
+    const int N = ${N};
+
+    int x = blockIdx.x * blockDim.x + threadIdx.x;
+    int y = blockIdx.y * blockDim.y + threadIdx.y;
+    if (x >= w || y >= h) return;
+
+    const int r = N / 2;
+    float acc = 0.f;
+
+    #pragma unroll
+    for (int i = -r; i <= r; ++i){
+        int xx = clampi(x + i, 0, w - 1);
+        acc += gray[IDX(xx,y,w)];
+    }
+
+    H[IDX(x,y,w)] = acc;
+}
+
+__global__ void prewitt_y_from_H_n${N}(const float* __restrict__ H,
+                                       float* __restrict__ gy,
+                                       int w, int h, int N_arg)
+{
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    H += plane; gy += plane;
+
+    const int N = ${N};
+
+    int x = blockIdx.x * blockDim.x + threadIdx.x;
+    int y = blockIdx.y * blockDim.y + threadIdx.y;
+    if (x >= w || y >= h) return;
+
+    const int r = N / 2;
+    float acc = 0.f;
+
+    #pragma unroll
+    for (int j = -r; j <= r; ++j){
+        int yy = clampi(y + j, 0, h - 1);
+        int sy = (j < 0 ? -1 : (j > 0 ? +1 : 0));
+        acc += H[IDX(x,yy,w)] * (float)sy;
+    }
+
+    gy[IDX(x,y,w)] = acc;
+}
+
+__global__ void combine_mag_to_gray_n${N}(const float* __restrict__ gx,
+                                          const float* __restrict__ gy,
+                                          unsigned char* __restrict__ gray_out,
+                                          int w, int h, int N_arg, float gain)
+{
+    const size_t plane = (size_t)blockIdx.z * w * h;  // channel plane
+    gx += plane; gy += plane; gray_out += plane;
+
+    const int N = ${N};
+
+    int x = blockIdx.x * blockDim.x + threadIdx.x;
+    int y = blockIdx.y * blockDim.y + threadIdx.y;
+    if (x >= w || y >= h) return;
+
+    float mag = fabsf(gx[IDX(x,y,w)]) + fabsf(gy[IDX(x,y,w)]);
+    float v = (mag * gain) / (float)(N * (long long)N);
+
+    if (v < 0.f) v = 0.f;
+    else if (v > 255.f) v = 255.f;
+
+    unsigned char u = (unsigned char)(v + 0.5f);
+    gray_out[IDX(x,y,w)] = u;
+}
+
+__device__ __forceinline__ long long sat_rect(const long long* __restrict__ S, int sw,
+                                              int y0, int y1, int x0, int x1){
+    return S[(size_t)y1 * sw + x1] - S[(size_t)y0 * sw + x1]
+         - S[(size_t)y1 * sw + x0] + S[(size_t)y0 * sw + x0];
+}
+
+__global__ void prewitt_sat_to_gray_n${N}(const long long* __restrict__ S,
+                                          unsigned char* __restrict__ gray_out,
+                                          int w, int h, int N_arg, float gain)
+{
+    const int N = ${N};
+
+    S += (size_t)blockIdx.z * (w + N) * (h + N);  // channel plane
+    gray_out += (size_t)blockIdx.z * w * h;
+
+    int x = blockIdx.x * blockDim.x + threadIdx.x;
+    int y = blockIdx.y * blockDim.y + threadIdx.y;
+    if (x >= w || y >= h) return;
+
+    const int r = N / 2;
+    int sw = w + N;
+
+    long long gx = sat_rect(S, sw, y, y + N, x + r + 1, x + N) - sat_rect(S, sw, y, y + N, x, x + r);
+    long long gy = sat_rect(S, sw, y + r + 1, y + N, x, x + N) - sat_rect(S, sw, y, y + r, x, x + N);
+
+    float mag = fabsf((float)gx) + fabsf((float)gy);
+    float v = (mag * gain) / (float)(N * (long long)N);
+
+    if (v < 0.f) v = 0.f;
+    else if (v > 255.f) v = 255.f;
+
+    gray_out[IDX(x,y,w)] = (unsigned char)(v + 0.5f);
+}
+
+} // extern C
+"""
+
+# Prewitt engines: "direct" = box sums + signed N-tap passes (O(N) per pixel),
+# "sat" = one 64-bit summed-area table, O(1) per pixel for any N.
+ENGINES = ("direct", "sat")
+
+# "auto" picks sat from the measured crossover in filters/engine_crossover.json
+# (timed with the SAT build included), or from SAT_MIN_MASK for backends the
+# table does not cover. Above the max, the direct path's float sums are no
+# longer exact integers, so auto keeps it there.
+SAT_MIN_MASK = 9
+SAT_MAX_MASK = 255
+
+# Block size of the sat_rows_u8 scan (the #define in PREWITT_CUDA_SRC)
+SAT_SCAN_THREADS = 256
+
+
+def choose_prewitt_engine(mask_size: int, backend: Optional[str] = None) -> str:
+    """Engine used by engine="auto" for a given mask size and backend."""
+    min_mask = engine_min_mask("prewitt", "sat", backend, SAT_MIN_MASK)
+    if min_mask is not None and min_mask <= mask_size <= SAT_MAX_MASK:
+        return "sat"
+    return "direct"
+
+
+def generate_prewitt_specialization(N: int):
+    """Source of the per-pixel Prewitt kernels (direct and sat) specialized for mask size N."""
+    names = (
+        "box_vert_u8_to_f", "prewitt_x_from_V", "box_horiz_u8_to_f", "prewitt_y_from_H",
+        "combine_mag_to_gray", "prewitt_sat_to_gray",
+    )
+    return render(PREWITT_SPECIALIZED_SRC, N=N), names
+
+
+register_specialization("prewitt", generate_prewitt_specialization)
+
+
 # Compiled module (lazy)
 _prewitt_mod = None
 _prewitt_compiled = False
@@ -150,32 +488,41 @@ def apply_prewitt_cuda(
     block_dim: Tuple[int, int],
     grid_dim: Tuple[int, int],
     gain: float = 8.0,
-    mask_size: int = 3
+    mask_size: int = 3,
+    engine: str = "direct",
+    **kwargs
 ) -> Tuple[np.ndarray, Dict[str, float]]:
     """
     Apply Prewitt filter using separable CUDA approach.
     
     Args:
-        image: Grayscale image (float32), shape (H, W)
+        image: Image (float32), shape (H, W) or (H, W, C); all channels are
+               filtered in the same launches (grid z = C)
         block_dim: (blockX, blockY)
         grid_dim: Ignored, calculated automatically
         gain: Edge enhancement factor (default 8.0)
         mask_size: Mask size NxN (default 3, must be odd)
+        engine: "direct" (separable passes, 4 float buffers) or "sat"
+                (one int64 integral image, O(1) per pixel, same output)
     
     Returns:
         (result_image, timings_dict)
     """
     import pycuda.driver as cuda
     
+    wall_start = time.perf_counter()
     _ensure_prewitt_compiled()
     
-    if image.ndim != 2:
-        raise ValueError("Image must be 2D (grayscale)")
+    if image.ndim not in (2, 3):
+        raise ValueError("Image must be 2D (grayscale) or 3D (H, W, C)")
     
     if mask_size % 2 == 0:
         raise ValueError(f"mask_size must be odd, got {mask_size}")
     
-    h, w = image.shape
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown prewitt engine: {engine}. Expected one of {list(ENGINES)}")
+    
+    h, w = image.shape[:2]
     N = mask_size
     
     # Convert to uint8 if float32
@@ -184,8 +531,11 @@ def apply_prewitt_cuda(
     else:
         img_u8 = image.astype(np.uint8)
     
-    gray = np.ascontiguousarray(img_u8.reshape(-1))
-    Npix = w * h
+    # Channels as (C, H, W) planes, one grid z-slice per plane
+    planes = to_planes(img_u8)
+    C = planes.shape[0]
+    gray = planes.reshape(-1)
+    Npix = w * h * C
     bytesGray = Npix
     
     # Calculate correct grid
@@ -194,48 +544,224 @@ def apply_prewitt_cuda(
     gridY = (h + blockY - 1) // blockY
     
     block = (blockX, blockY, 1)
-    grid = (gridX, gridY, 1)
-    
-    # Allocate GPU memory
-    d_gray = cuda.mem_alloc(bytesGray)
-    d_V = cuda.mem_alloc(Npix * 4)
-    d_H = cuda.mem_alloc(Npix * 4)
-    d_gx = cuda.mem_alloc(Npix * 4)
-    d_gy = cuda.mem_alloc(Npix * 4)
-    d_out = cuda.mem_alloc(bytesGray)
-    
-    # Copy to GPU
-    cuda.memcpy_htod(d_gray, gray)
-    
-    # Get functions
-    boxV = _prewitt_mod.get_function("box_vert_u8_to_f")
-    gxF = _prewitt_mod.get_function("prewitt_x_from_V")
-    boxH = _prewitt_mod.get_function("box_horiz_u8_to_f")
-    gyF = _prewitt_mod.get_function("prewitt_y_from_H")
-    comb = _prewitt_mod.get_function("combine_mag_to_gray")
-    
-    # Measure time
-    start = cuda.Event()
-    stop = cuda.Event()
-    start.record()
-    
-    # Execute kernels
-    boxV(d_gray, d_V, np.int32(w), np.int32(h), np.int32(N), block=block, grid=grid)
-    gxF(d_V, d_gx, np.int32(w), np.int32(h), np.int32(N), block=block, grid=grid)
-    boxH(d_gray, d_H, np.int32(w), np.int32(h), np.int32(N), block=block, grid=grid)
-    gyF(d_H, d_gy, np.int32(w), np.int32(h), np.int32(N), block=block, grid=grid)
-    comb(d_gx, d_gy, d_out, np.int32(w), np.int32(h), np.int32(N), np.float32(gain), block=block, grid=grid)
-    
-    stop.record()
-    stop.synchronize()
-    elapsed_ms = start.time_till(stop)
-    
-    # Copy result
-    out = np.empty(bytesGray, dtype=np.uint8)
-    cuda.memcpy_dtoh(out, d_out)
-    
-    result = out.reshape(h, w).astype(np.float32)
+    grid = (gridX, gridY, C)
+    
+    if engine == "sat":
+        result, timings = _apply_prewitt_sat_cuda(gray, w, h, C, N, gain, block, grid, wall_start)
+        return from_planes(result, image.ndim), timings
+    
+    # Lease GPU buffers from the shared pool (returned on exit, reused across requests)
+    with get_device_pool().leases() as dev, get_host_pool().leases() as host:
+        d_gray = dev.alloc(bytesGray)
+        d_V = dev.alloc(Npix * 4)
+        d_H = dev.alloc(Npix * 4)
+        d_gx = dev.alloc(Npix * 4)
+        d_gy = dev.alloc(Npix * 4)
+        d_out = dev.alloc(bytesGray)
+        
+        # Copy to GPU
+        upload_ms = timed_copy(cuda.memcpy_htod, d_gray, gray)
+        
+        # Get functions
+        boxV = get_kernel("prewitt", N, "box_vert_u8_to_f", _prewitt_mod)
+        gxF = get_kernel("prewitt", N, "prewitt_x_from_V", _prewitt_mod)
+        boxH = get_kernel("prewitt", N, "box_horiz_u8_to_f", _prewitt_mod)
+        gyF = get_kernel("prewitt", N, "prewitt_y_from_H", _prewitt_mod)
+        comb = get_kernel("prewitt", N, "combine_mag_to_gray", _prewitt_mod)
+        
+        # Measure time
+        start = cuda.Event()
+        stop = cuda.Event()
+        start.record()
+        
+        # Execute kernels
+        boxV(d_gray, d_V, np.int32(w), np.int32(h), np.int32(N), block=block, grid=grid)
+        gxF(d_V, d_gx, np.int32(w), np.int32(h), np.int32(N), block=block, grid=grid)
+        boxH(d_gray, d_H, np.int32(w), np.int32(h), np.int32(N), block=block, grid=grid)
+        gyF(d_H, d_gy, np.int32(w), np.int32(h), np.int32(N), block=block, grid=grid)
+        comb(d_gx, d_gy, d_out, np.int32(w), np.int32(h), np.int32(N), np.float32(gain), block=block, grid=grid)
+        
+        stop.record()
+        stop.synchronize()
+        elapsed_ms = start.time_till(stop)
+        
+        # Copy result into pinned staging memory
+        out = host.alloc(bytesGray)[:bytesGray]
+        download_ms = timed_copy(cuda.memcpy_dtoh, out, d_out)
+        
+        result = from_planes(out.reshape(C, h, w), image.ndim).astype(np.float32)
+    
+    timings = {
+        "execution_time_ms": (time.perf_counter() - wall_start) * 1000.0,
+        "kernel_time_ms": float(elapsed_ms),
+        "upload_ms": upload_ms,
+        "download_ms": download_ms,
+    }
+    
+    return result, timings
+
+
+def _apply_prewitt_sat_cuda(
+    gray: np.ndarray,
+    w: int,
+    h: int,
+    C: int,
+    N: int,
+    gain: float,
+    block: Tuple[int, int, int],
+    grid: Tuple[int, int, int],
+    wall_start: float,
+) -> Tuple[np.ndarray, Dict[str, float]]:
+    """
+    Summed-area-table engine: gray, one int64 table and out instead of 4 float buffers.
+    
+    gray holds C planes of h x w; returns them as a (C, h, w) float32 array.
+    """
+    import pycuda.driver as cuda
+    
+    bytesGray = w * h * C
+    sat_bytes = (h + N) * (w + N) * 8 * C
+    
+    # Row scan: one SAT_SCAN_THREADS block per padded row. Column scan: one
+    # thread per column (coalesced). One z-slice per plane.
+    threads = block[0] * block[1]
+    grid_rows = (h + N - 1, 1, C)
+    grid_cols = ((w + N + threads - 1) // threads, 1, C)
+    
+    with get_device_pool().leases() as dev, get_host_pool().leases() as host:
+        d_gray = dev.alloc(bytesGray)
+        d_S = dev.alloc(sat_bytes)
+        d_out = dev.alloc(bytesGray)
+        
+        upload_ms = timed_copy(cuda.memcpy_htod, d_gray, gray)
+        
+        satRows = _prewitt_mod.get_function("sat_rows_u8")
+        satCols = _prewitt_mod.get_function("sat_cols")
+        comb = get_kernel("prewitt", N, "prewitt_sat_to_gray", _prewitt_mod)
+        
+        start = cuda.Event()
+        stop = cuda.Event()
+        start.record()
+        
+        satRows(d_gray, d_S, np.int32(w), np.int32(h), np.int32(N), block=(SAT_SCAN_THREADS, 1, 1), grid=grid_rows)
+        satCols(d_S, np.int32(w), np.int32(h), np.int32(N), block=(threads, 1, 1), grid=grid_cols)
+        comb(d_S, d_out, np.int32(w), np.int32(h), np.int32(N), np.float32(gain), block=block, grid=grid)
+        
+        stop.record()
+        stop.synchronize()
+        elapsed_ms = start.time_till(stop)
+        
+        out = host.alloc(bytesGray)[:bytesGray]
+        download_ms = timed_copy(cuda.memcpy_dtoh, out, d_out)
+        
+        result = out.reshape(C, h, w).astype(np.float32)
+    
+    timings = {
+        "execution_time_ms": (time.perf_counter() - wall_start) * 1000.0,
+        "kernel_time_ms": float(elapsed_ms),
+        "upload_ms": upload_ms,
+        "download_ms": download_ms,
+    }
+    
+    return result, timings
+
+
+def prewitt_sign_weights(N: int) -> np.ndarray:
+    """
+    Signed 1D Prewitt weights [-1, ..., -1, 0, +1, ..., +1] of size N.
+    """
+    r = N // 2
+    return np.concatenate([-np.ones(r), [0.0], np.ones(r)])
+
+
+def combine_to_gray(gx: np.ndarray, gy: np.ndarray, N: int, gain: float) -> np.ndarray:
+    """Host version of combine_mag_to_gray for integer-valued gx / gy."""
+    mag = (np.abs(gx) + np.abs(gy)).astype(np.float32)
+    v = (mag * np.float32(gain)) / np.float32(N * N)
+    v = np.clip(v, np.float32(0.0), np.float32(255.0)) + np.float32(0.5)
+    return v.astype(np.uint8).astype(np.float32)
+
+
+def _prewitt_sat_gradients(gray: np.ndarray, N: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    gx, gy from one int64 integral image of the edge-padded image
+    (same layout as the sat_rows_u8 / sat_cols kernels).
+    """
+    h, w = gray.shape[:2]
+    r = N // 2
+    pad = [(r, r), (r, r)] + [(0, 0)] * (gray.ndim - 2)
+    padded = np.pad(gray, pad, mode="edge").astype(np.int64)
+    
+    S = np.zeros((h + N, w + N) + gray.shape[2:], dtype=np.int64)
+    np.cumsum(padded, axis=0, out=S[1:, 1:])
+    np.cumsum(S[1:, 1:], axis=1, out=S[1:, 1:])
+    
+    def rect(y0, y1, x0, x1):
+        # Padded rows [y + y0, y + y1) x cols [x + x0, x + x1) for every pixel
+        return (S[y1:y1 + h, x1:x1 + w] - S[y0:y0 + h, x1:x1 + w]
+                - S[y1:y1 + h, x0:x0 + w] + S[y0:y0 + h, x0:x0 + w])
+    
+    gx = rect(0, N, r + 1, N) - rect(0, N, 0, r)
+    gy = rect(r + 1, N, 0, N) - rect(0, r, 0, N)
+    return gx, gy
+
+
+def apply_prewitt_cpu(
+    image: np.ndarray,
+    block_dim: Tuple[int, int] = None,
+    grid_dim: Tuple[int, int] = None,
+    gain: float = 8.0,
+    mask_size: int = 3,
+    engine: str = "direct",
+    **kwargs
+) -> Tuple[np.ndarray, Dict[str, float]]:
+    """
+    Apply Prewitt filter on the CPU with separable NumPy/SciPy passes.
+    
+    Mirrors apply_prewitt_cuda: box sums + signed N-tap passes with
+    clamp-to-edge borders, |gx| + |gy| scaled by gain / (N*N) and rounded
+    to uint8 exactly like combine_mag_to_gray.
+    
+    Args:
+        image: Image (float32), shape (H, W) or (H, W, C); channels are
+               filtered independently in the same vectorized pass
+        block_dim: Ignored (kept for signature compatibility)
+        grid_dim: Ignored (kept for signature compatibility)
+        gain: Edge enhancement factor (default 8.0)
+        mask_size: Mask size NxN (default 3, must be odd)
+        engine: "direct" or "sat" (integral image), same output
+    
+    Returns:
+        (result_image, timings_dict)
+    """
+    if image.ndim not in (2, 3):
+        raise ValueError("Image must be 2D (grayscale) or 3D (H, W, C)")
+    
+    if mask_size % 2 == 0:
+        raise ValueError(f"mask_size must be odd, got {mask_size}")
+    
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown prewitt engine: {engine}. Expected one of {list(ENGINES)}")
+    
+    start = time.perf_counter()
+    
+    N = mask_size
+    if engine == "sat":
+        gx, gy = _prewitt_sat_gradients(np.clip(image, 0, 255).astype(np.uint8), N)
+    else:
+        gray = np.clip(image, 0, 255).astype(np.uint8).astype(np.float64)
+        ones = np.ones(N, dtype=np.float64)
+        sign = prewitt_sign_weights(N)
+        
+        # Integer-valued sums, exact in float64 (same values as the float32 kernels)
+        V = ndimage.correlate1d(gray, ones, axis=0, mode="nearest")
+        gx = ndimage.correlate1d(V, sign, axis=1, mode="nearest")
+        H = ndimage.correlate1d(gray, ones, axis=1, mode="nearest")
+        gy = ndimage.correlate1d(H, sign, axis=0, mode="nearest")
+    
+    result = combine_to_gray(gx, gy, N, gain)
     
+    elapsed_ms = (time.perf_counter() - start) * 1000.0
     timings = {
         "execution_time_ms": float(elapsed_ms),
         "kernel_time_ms": float(elapsed_ms),
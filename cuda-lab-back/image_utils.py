@@ -2,11 +2,90 @@
 
 import base64
 import io
-from typing import Tuple
+from typing import Optional, Tuple, Union
 
 import numpy as np
 from PIL import Image
 
+from metrics import count_decoded_bytes, count_encoded_bytes
+
+# "grayscale" -> float32 (H, W); "rgb" -> float32 (H, W, 3), channels filtered independently
+COLOR_MODES = ("grayscale", "rgb")
+_PIL_MODES = {"grayscale": "L", "rgb": "RGB"}
+
+# Response encodings. png: lossless, compress_level 0-9 trades size for time
+# (Pillow default 6); bmp: uncompressed lossless, the fastest to encode;
+# jpeg / webp: lossy, quality 1-100; npy: raw uint8 array
+OUTPUT_FORMATS = ("png", "bmp", "jpeg", "webp", "npy")
+DEFAULT_QUALITY = {"jpeg": 90, "webp": 80}
+MEDIA_TYPES = {
+    "png": "image/png",
+    "bmp": "image/bmp",
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+    "npy": "application/x-npy",
+}
+
+
+def check_color_mode(color_mode: str) -> str:
+    """
+    Normalize a requested color mode.
+
+    Raises:
+        ValueError: If color_mode is not one of COLOR_MODES
+    """
+    mode = (color_mode or "grayscale").lower()
+    if mode not in COLOR_MODES:
+        raise ValueError(f"Unknown color_mode: {color_mode}. Expected one of {list(COLOR_MODES)}")
+    return mode
+
+
+def parse_output_options(output: Union[str, dict, None] = None) -> dict:
+    """
+    Normalize the requested response encoding.
+
+    Args:
+        output: A format name ("png", "bmp", "jpeg", "webp", "npy") or a dict
+            with "format" plus optional "compress_level" (png) and "quality"
+            (jpeg / webp); None means default PNG
+
+    Returns:
+        {"format", "compress_level", "quality"}; options that do not apply
+        to the format are None
+
+    Raises:
+        ValueError: If the format or one of its options is invalid
+    """
+    if output is None:
+        output = {}
+    elif isinstance(output, str):
+        output = {"format": output}
+
+    fmt = (output.get("format") or "png").lower()
+    if fmt == "jpg":
+        fmt = "jpeg"
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format: {fmt}. Expected one of {list(OUTPUT_FORMATS)}")
+
+    options = {"format": fmt, "compress_level": None, "quality": None}
+    if fmt == "png" and output.get("compress_level") is not None:
+        level = int(output["compress_level"])
+        if not 0 <= level <= 9:
+            raise ValueError(f"compress_level must be between 0 and 9, got {level}")
+        options["compress_level"] = level
+    elif fmt in DEFAULT_QUALITY:
+        quality = output.get("quality")
+        quality = DEFAULT_QUALITY[fmt] if quality is None else int(quality)
+        if not 1 <= quality <= 100:
+            raise ValueError(f"quality must be between 1 and 100, got {quality}")
+        options["quality"] = quality
+    return options
+
+
+def output_cache_tag(options: dict) -> str:
+    """Compact string of the encoding options, for result cache keys."""
+    return ":".join(str(options[k]) for k in ("format", "compress_level", "quality"))
+
 
 def _strip_data_url_prefix(image_base64: str) -> str:
     """
@@ -17,10 +96,64 @@ def _strip_data_url_prefix(image_base64: str) -> str:
     return image_base64
 
 
-def decode_image_base64(image_base64: str) -> np.ndarray:
+def decode_image_bytes(img_bytes: bytes, color_mode: str = "grayscale") -> np.ndarray:
+    """
+    Receives raw encoded image bytes (PNG, JPEG, ...) and returns a NumPy array
+    (float32) of shape (H, W) in grayscale, or (H, W, 3) with color_mode="rgb".
+    """
+    if not img_bytes:
+        raise ValueError("Image body is empty")
+
+    pil_mode = _PIL_MODES[check_color_mode(color_mode)]
+
+    try:
+        img = Image.open(io.BytesIO(img_bytes))
+        fmt = (img.format or "image").lower()
+        img = img.convert(pil_mode)  # L = grayscale
+    except Exception:
+        raise ValueError("Invalid or unsupported image data")
+    count_decoded_bytes(len(img_bytes), fmt)
+
+    img_np = np.array(img).astype(np.float32)
+    return img_np
+
+
+def peek_image_shape_base64(image_base64: str, prefix_chars: int = 8192) -> Optional[Tuple[int, int]]:
+    """
+    Returns (H, W) read from the image header without decoding pixels, or
+    None if it cannot be parsed. Only the first prefix_chars characters are
+    base64-decoded, which is enough to reach the header of PNG and most JPEG files.
+    """
+    b64_data = _strip_data_url_prefix(image_base64 or "")[:prefix_chars]
+    b64_data = b64_data[:len(b64_data) // 4 * 4]
+    try:
+        with Image.open(io.BytesIO(base64.b64decode(b64_data))) as img:
+            width, height = img.size
+    except Exception:
+        return None
+    return height, width
+
+
+def decode_image_npy(npy_bytes: bytes) -> np.ndarray:
+    """
+    Receives a serialized .npy array, (H, W) or interleaved (H, W, C),
+    and returns it as float32.
+    """
+    try:
+        arr = np.load(io.BytesIO(npy_bytes), allow_pickle=False)
+    except Exception:
+        raise ValueError("Invalid NPY data")
+
+    if arr.ndim not in (2, 3):
+        raise ValueError("Expected a 2D (H, W) or 3D (H, W, C) array")
+    count_decoded_bytes(len(npy_bytes), "npy")
+    return arr.astype(np.float32)
+
+
+def decode_base64_bytes(image_base64: str) -> bytes:
     """
     Receives a base64 image string (possibly with data URL prefix)
-    and returns a NumPy array in grayscale (float32) of shape (H, W).
+    and returns the encoded image bytes, without decoding the image itself.
     """
     if not image_base64:
         raise ValueError("image_base64 is empty")
@@ -28,33 +161,108 @@ def decode_image_base64(image_base64: str) -> np.ndarray:
     b64_data = _strip_data_url_prefix(image_base64)
 
     try:
-        img_bytes = base64.b64decode(b64_data)
+        return base64.b64decode(b64_data)
     except Exception:
         raise ValueError("Invalid base64 image string")
 
-    img = Image.open(io.BytesIO(img_bytes)).convert("L")  # L = grayscale
-    img_np = np.array(img).astype(np.float32)
-    return img_np
 
+def decode_image_base64(image_base64: str, color_mode: str = "grayscale") -> np.ndarray:
+    """
+    Receives a base64 image string (possibly with data URL prefix)
+    and returns a NumPy array (float32) of shape (H, W), or (H, W, 3) for "rgb".
+    """
+    return decode_image_bytes(decode_base64_bytes(image_base64), color_mode)
 
-def encode_image_base64(img_np: np.ndarray) -> str:
+
+def resize_image(img_np: np.ndarray, width: int, height: int) -> np.ndarray:
     """
-    Receives a np.ndarray (H, W), normalizes/clips it to [0, 255] uint8,
-    converts it to PNG in memory, and returns 'data:image/png;base64,...'.
+    Area-average (H, W) or (H, W, 3|4) values in [0, 255] to (height, width);
+    returns float32 like the filters.
     """
-    if img_np.ndim != 2:
-        raise ValueError("Expected 2D array for grayscale image")
+    img = Image.fromarray(np.clip(img_np, 0, 255).astype(np.uint8))
+    return np.asarray(img.resize((width, height), Image.Resampling.BOX), dtype=np.float32)
+
+
+def _encode_pil(img_np: np.ndarray, fmt: str, **params) -> bytes:
+    """Clip to [0, 255] uint8 and save as an L / RGB / RGBA image with Pillow."""
+    if img_np.ndim == 2:
+        pil_mode = "L"
+    elif img_np.ndim == 3 and img_np.shape[2] in (3, 4):
+        pil_mode = "RGB" if img_np.shape[2] == 3 else "RGBA"
+    else:
+        raise ValueError(f"Cannot encode array of shape {img_np.shape} as {fmt}")
+    if pil_mode == "RGBA" and fmt == "JPEG":
+        raise ValueError("JPEG cannot encode 4-channel images")
 
     # Clip and convert to uint8
     img_clipped = np.clip(img_np, 0, 255).astype(np.uint8)
 
-    img = Image.fromarray(img_clipped, mode="L")
+    img = Image.fromarray(img_clipped, mode=pil_mode)
+
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt, **params)
+    count_encoded_bytes(buffer.tell(), fmt.lower())
+    return buffer.getvalue()
+
+
+def encode_image_png(img_np: np.ndarray, compress_level: Optional[int] = None) -> bytes:
+    """
+    Receives a np.ndarray (H, W) or (H, W, 3|4), clips it to [0, 255] uint8
+    and returns raw PNG bytes (grayscale, RGB or RGBA).
+    compress_level 0-9 (None = Pillow default); 1 is several times faster than 6.
+    """
+    params = {} if compress_level is None else {"compress_level": compress_level}
+    return _encode_pil(img_np, "PNG", **params)
+
+
+def encode_image_npy(img_np: np.ndarray) -> bytes:
+    """
+    Receives a np.ndarray (H, W) or (H, W, C) and returns it as raw uint8 .npy bytes.
+
+    Always uint8: every filter rounds and clamps to [0, 255] in its last
+    pass (on both backends), so a float32 array would only repeat the same
+    integer values at four times the size.
+    """
+    if img_np.ndim not in (2, 3):
+        raise ValueError("Expected a 2D (H, W) or 3D (H, W, C) array")
+
+    arr = np.clip(img_np, 0, 255).astype(np.uint8)
 
     buffer = io.BytesIO()
-    img.save(buffer, format="PNG")
-    buffer.seek(0)
+    np.save(buffer, arr, allow_pickle=False)
+    count_encoded_bytes(buffer.tell(), "npy")
+    return buffer.getvalue()
 
-    b64_bytes = base64.b64encode(buffer.read())
-    b64_str = b64_bytes.decode("utf-8")
 
-    return f"data:image/png;base64,{b64_str}"
+def encode_image(img_np: np.ndarray, options: Optional[dict] = None) -> Tuple[bytes, str]:
+    """
+    Encode a result with parse_output_options() options.
+
+    Returns:
+        (encoded_bytes, media_type)
+    """
+    options = options or parse_output_options()
+    fmt = options["format"]
+    if fmt == "png":
+        content = encode_image_png(img_np, options["compress_level"])
+    elif fmt == "bmp":
+        content = _encode_pil(img_np, "BMP")
+    elif fmt == "jpeg":
+        content = _encode_pil(img_np, "JPEG", quality=options["quality"])
+    elif fmt == "webp":
+        content = _encode_pil(img_np, "WEBP", quality=options["quality"])
+    else:
+        content = encode_image_npy(img_np)
+    return content, MEDIA_TYPES[fmt]
+
+
+def to_data_url(content: bytes, media_type: str) -> str:
+    return f"data:{media_type};base64,{base64.b64encode(content).decode('utf-8')}"
+
+
+def encode_image_base64(img_np: np.ndarray, options: Optional[dict] = None) -> str:
+    """
+    Receives a np.ndarray (H, W) or (H, W, C), encodes it (PNG by default, see
+    parse_output_options()) and returns a data URL, e.g. 'data:image/png;base64,...'.
+    """
+    return to_data_url(*encode_image(img_np, options))
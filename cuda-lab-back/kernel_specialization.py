@@ -0,0 +1,203 @@
+# cuda-lab-back/kernel_specialization.py
+"""
+Mask-size-specialized CUDA kernel variants.
+
+The generic kernels take N (and, for Gaussian / LoG, the weights) as runtime
+arguments, so their loops cannot be unrolled and every tap re-reads a weight
+from global memory. For the common mask sizes (SPECIALIZED_MASK_SIZES) each
+filter registers a source generator that emits copies of its kernels with
+N and the weights baked in as compile-time constants:
+
+- kernel `name` becomes `name_n{N}` with the same parameter list, so launch
+  code only swaps the function object (the N / weight arguments are ignored);
+- the body is the generic one with `const int N = {N};` and constant weight
+  arrays, so results are bit-identical to the generic kernel.
+
+SpecializationCache maps (filter_type, N) to the compiled functions, and
+compiles each variant once on first use. Other sizes, unregistered
+kernels and failed compiles fall back to the generic module. The compiler
+is injectable: any callable source -> object with get_function(name) works,
+so source generation and cache logic run without a GPU.
+
+Configuration (environment variables):
+    CUDA_LAB_SPECIALIZE  "0" always uses the generic kernels (default on)
+"""
+
+import os
+import threading
+from string import Template
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+
+SPECIALIZED_MASK_SIZES = (3, 5, 7, 9, 21)
+
+# generate(N) -> (CUDA source, generic names of the kernels it specializes),
+# or None when the filter has nothing to specialize at that size
+Generator = Callable[[int], Optional[Tuple[str, Tuple[str, ...]]]]
+
+SPECIALIZATIONS: Dict[str, Generator] = {}
+
+
+def register_specialization(filter_type: str, generate: Generator):
+    """Make a filter's kernels specializable by mask size."""
+    SPECIALIZATIONS[filter_type] = generate
+
+
+def specialization_enabled() -> bool:
+    return os.environ.get("CUDA_LAB_SPECIALIZE", "1") != "0"
+
+
+# ---------- source generation helpers ----------
+
+def specialized_name(name: str, N: int) -> str:
+    """Name of the N-specialized copy of kernel `name`."""
+    return f"{name}_n{N}"
+
+
+def float_literal(value: float) -> str:
+    """Exact CUDA float literal of a float32 value (shortest round-trip repr)."""
+    return f"{float(np.float32(value))!r}f"
+
+
+def float_array(values: Iterable[float], per_line: int = 8) -> str:
+    """Brace initializer of float32 literals, e.g. {0.25f, 0.5f, 0.25f}."""
+    literals = [float_literal(v) for v in np.asarray(values, dtype=np.float32).ravel()]
+    lines = [", ".join(literals[i:i + per_line]) for i in range(0, len(literals), per_line)]
+    if len(lines) <= 1:
+        return "{" + "".join(lines) + "}"
+    return "{\n        " + ",\n        ".join(lines) + "\n    }"
+
+
+def render(template: str, **values) -> str:
+    """Fill a $-placeholder kernel template (CUDA braces need no escaping)."""
+    return Template(template).substitute({k: str(v) for k, v in values.items()})
+
+
+# ---------- specialization cache ----------
+
+def compile_module(source: str):
+    """Default compiler: nvcc -> PTX (memo + disk cache) -> loaded CUDA module."""
+    from cuda_kernels import _initialize_cuda, compile_cuda_kernel_to_ptx
+    _initialize_cuda()
+    import pycuda.driver as drv
+    ptx_code = compile_cuda_kernel_to_ptx(source, arch="sm_89")
+    return drv.module_from_buffer(ptx_code.encode())
+
+
+class SpecializationCache:
+    """Thread-safe map (filter_type, N) -> {generic kernel name: specialized function}."""
+
+    def __init__(
+        self,
+        compiler: Optional[Callable[[str], Any]] = None,
+        sizes: Iterable[int] = SPECIALIZED_MASK_SIZES,
+        registry: Optional[Dict[str, Generator]] = None,
+    ):
+        self.compiler = compiler or compile_module
+        self.sizes = frozenset(sizes)
+        self.registry = SPECIALIZATIONS if registry is None else registry
+        self._lock = threading.Lock()
+        # None marks "no variant" (nothing to specialize or compile failed)
+        self._entries: Dict[Tuple[str, int], Optional[Dict[str, Any]]] = {}
+        self._pending: Dict[Tuple[str, int], threading.Event] = {}
+        self._stats = {"hits": 0, "compiles": 0, "fallbacks": 0, "errors": 0}
+        self.last_error: Optional[str] = None
+
+    def lookup(self, filter_type: str, N: int) -> Optional[Dict[str, Any]]:
+        """Specialized functions for (filter_type, N), compiling them on first use; None = use generic."""
+        if N not in self.sizes or filter_type not in self.registry:
+            with self._lock:
+                self._stats["fallbacks"] += 1
+            return None
+
+        key = (filter_type, N)
+        with self._lock:
+            if key in self._entries:
+                entry = self._entries[key]
+                self._stats["hits" if entry is not None else "fallbacks"] += 1
+                return entry
+            # The first caller compiles; later callers for the same key wait for it
+            pending = self._pending.get(key)
+            compiling = pending is None
+            if compiling:
+                pending = self._pending[key] = threading.Event()
+
+        if not compiling:
+            pending.wait()
+            with self._lock:
+                entry = self._entries.get(key)
+                self._stats["hits" if entry is not None else "fallbacks"] += 1
+                return entry
+
+        # nvcc takes seconds: compile outside the lock so other keys keep hitting
+        entry = None
+        compiled = False
+        error = None
+        try:
+            generated = self.registry[filter_type](N)
+            if generated is not None:
+                source, names = generated
+                try:
+                    module = self.compiler(source)
+                    entry = {name: module.get_function(specialized_name(name, N)) for name in names}
+                    compiled = True
+                except Exception as e:
+                    # The generic kernels still produce the same output
+                    error = f"{filter_type} N={N}: {e}"
+        finally:
+            with self._lock:
+                if compiled:
+                    self._stats["compiles"] += 1
+                if error is not None:
+                    self._stats["errors"] += 1
+                    self.last_error = error
+                if entry is None:
+                    self._stats["fallbacks"] += 1
+                self._entries[key] = entry
+                del self._pending[key]
+            pending.set()
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, "variants": sum(1 for e in self._entries.values() if e is not None)}
+
+
+_cache: Optional[SpecializationCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_specialization_cache() -> SpecializationCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SpecializationCache()
+        return _cache
+
+
+def get_kernel(filter_type: str, N: int, name: str, generic_module):
+    """
+    Kernel `name` for a launch with mask size N.
+
+    Returns the N-specialized variant when one exists (same parameters, same
+    output), else generic_module.get_function(name).
+    """
+    if specialization_enabled():
+        variants = get_specialization_cache().lookup(filter_type, N)
+        if variants is not None and name in variants:
+            return variants[name]
+    return generic_module.get_function(name)
+
+
+def specialization_sources() -> Iterator[Tuple[str, int, str]]:
+    """(filter_type, N, source) of every registered variant, for precompilation."""
+    for filter_type, generate in SPECIALIZATIONS.items():
+        for N in SPECIALIZED_MASK_SIZES:
+            generated = generate(N)
+            if generated is not None:
+                yield filter_type, N, generated[0]
@@ -0,0 +1,275 @@
+# cuda-lab-back/metrics.py
+"""
+Prometheus text-format metrics for GET /metrics.
+
+Hot-path recording is lock-cheap: every thread writes into its own shard
+(a dict guarded by a lock that only the scraper ever contends for), and a
+histogram observation is one bisect plus two additions. Shards are merged
+only when /metrics is scraped. Gauges and cache counters that other modules
+already keep (compute worker queue, worker pool, PTX and result caches) are
+read at scrape time, so they cost nothing per request.
+
+Histograms are labeled by endpoint or stage, filter and a mask_size bucket
+(see mask_size_bucket()) to keep the label cardinality small.
+"""
+
+import threading
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Seconds; covers a cached 3x3 hit up to a large LoG on the CPU backend
+LATENCY_BUCKETS_S = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+# Upper edges of the mask_size label buckets; larger masks fall into "65+"
+MASK_SIZE_BUCKETS = (3, 7, 15, 31, 63)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# name -> (type, help, histogram buckets)
+_METRICS: Dict[str, Tuple[str, str, Optional[Tuple[float, ...]]]] = {
+    "cuda_lab_request_duration_seconds": (
+        "histogram", "Request latency by endpoint, filter and mask size bucket", LATENCY_BUCKETS_S,
+    ),
+    "cuda_lab_stage_duration_seconds": (
+        "histogram", "Per-stage latency (decode, upload, kernel, download, encode, ...)", LATENCY_BUCKETS_S,
+    ),
+    "cuda_lab_decoded_bytes_total": ("counter", "Encoded image bytes decoded from requests", None),
+    "cuda_lab_encoded_bytes_total": ("counter", "Image bytes encoded into responses", None),
+}
+
+
+def mask_size_bucket(mask_size: Optional[int]) -> str:
+    """Label value for a mask size: "3", "5-7", "9-15", "17-31", "33-63" or "65+"."""
+    if mask_size is None:
+        return "none"
+    low = MASK_SIZE_BUCKETS[0]
+    for edge in MASK_SIZE_BUCKETS:
+        if mask_size <= edge:
+            return str(edge) if low == edge else f"{low}-{edge}"
+        low = edge + 2
+    return f"{low}+"
+
+
+class _Shard:
+    """One thread's counters and histograms (per-bucket counts, not cumulative)."""
+
+    __slots__ = ("lock", "counters", "histograms")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], List[float]] = {}
+
+
+class MetricsRegistry:
+    """Process-wide counters and histograms, sharded per thread."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: List[_Shard] = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = _Shard()
+            self._local.shard = shard
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def inc(self, name: str, value: float = 1.0, labels: Labels = ()):
+        shard = self._shard()
+        key = (name, labels)
+        with shard.lock:
+            shard.counters[key] = shard.counters.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, labels: Labels = ()):
+        buckets = _METRICS[name][2]
+        index = bisect_left(buckets, value)  # first bucket with value <= edge; len() = +Inf
+        shard = self._shard()
+        key = (name, labels)
+        with shard.lock:
+            hist = shard.histograms.get(key)
+            if hist is None:
+                # [count per bucket..., +Inf count, sum]
+                hist = shard.histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+            hist[index] += 1
+            hist[-1] += value
+
+    def snapshot(self) -> Tuple[Dict[Tuple[str, Labels], float], Dict[Tuple[str, Labels], List[float]]]:
+        """Merged (counters, histograms) across all thread shards."""
+        with self._shards_lock:
+            shards = list(self._shards)
+        counters: Dict[Tuple[str, Labels], float] = {}
+        histograms: Dict[Tuple[str, Labels], List[float]] = {}
+        for shard in shards:
+            with shard.lock:
+                shard_counters = list(shard.counters.items())
+                shard_histograms = [(k, list(v)) for k, v in shard.histograms.items()]
+            for key, value in shard_counters:
+                counters[key] = counters.get(key, 0.0) + value
+            for key, hist in shard_histograms:
+                total = histograms.get(key)
+                if total is None:
+                    histograms[key] = hist
+                else:
+                    for i, v in enumerate(hist):
+                        total[i] += v
+        return counters, histograms
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics() -> MetricsRegistry:
+    return _registry
+
+
+# ---------- recording helpers ----------
+
+def record_request(endpoint: str, result: dict, seconds: float, filter_used: Optional[str] = None):
+    """
+    Observe one finished request (or one /convolve-batch item).
+
+    Labels come from the response: filter_used (overridden by the argument,
+    e.g. "custom" or "graph"), mask_size_used and, when stage timing is
+    enabled, every entry of stage_timings_ms except "total".
+    """
+    filter_label = filter_used or str(result.get("filter_used", "none"))
+    mask_label = mask_size_bucket(result.get("mask_size_used"))
+    _registry.observe(
+        "cuda_lab_request_duration_seconds", seconds,
+        (("endpoint", endpoint), ("filter", filter_label), ("mask_size", mask_label)),
+    )
+    stages = result.get("stage_timings_ms")
+    if stages:
+        for stage, ms in stages.items():
+            if stage != "total":
+                _registry.observe(
+                    "cuda_lab_stage_duration_seconds", ms / 1000.0,
+                    (("stage", stage), ("filter", filter_label), ("mask_size", mask_label)),
+                )
+
+
+def count_decoded_bytes(n: int, fmt: str):
+    _registry.inc("cuda_lab_decoded_bytes_total", n, (("format", fmt),))
+
+
+def count_encoded_bytes(n: int, fmt: str):
+    _registry.inc("cuda_lab_encoded_bytes_total", n, (("format", fmt),))
+
+
+# ---------- exposition ----------
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    parts = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+def _process_samples() -> List[Tuple[str, str, str, List[Tuple[Labels, float]]]]:
+    """Gauges and counters read from the other modules' stats at scrape time."""
+    from compute_worker import get_compute_worker
+    from kernel_specialization import get_specialization_cache
+    from ptx_cache import get_ptx_cache_stats
+    from result_cache import get_result_cache
+    from warmup import get_warmup_state
+    from worker_pool import get_worker_pool
+
+    worker = get_compute_worker().stats()
+    samples = [
+        ("cuda_lab_queue_depth", "gauge", "Jobs waiting in the compute worker queue",
+         [((), worker["queue_depth"])]),
+        ("cuda_lab_queue_max", "gauge", "Compute worker queue capacity", [((), worker["queue_max"])]),
+        ("cuda_lab_in_flight", "gauge", "Jobs running on the compute worker", [((), worker["in_flight"])]),
+        ("cuda_lab_jobs_total", "counter", "Compute worker jobs by outcome",
+         [((("outcome", k),), worker[k]) for k in ("completed", "failed", "rejected")]),
+        ("cuda_lab_queue_wait_seconds_total", "counter", "Total time jobs waited for the worker",
+         [((), worker["wait_ms_total"] / 1000.0)]),
+        ("cuda_lab_batched_jobs_total", "counter", "Jobs that shared a grouped launch with others",
+         [((), worker["batched_jobs"])]),
+    ]
+
+    pool = get_worker_pool()
+    if pool is not None:
+        workers = pool.health()
+        samples.append(("cuda_lab_pool_in_flight", "gauge", "Jobs in flight per pool worker",
+                        [((("worker", str(w["index"])),), w["in_flight"]) for w in workers]))
+        samples.append(("cuda_lab_pool_restarts_total", "counter", "Pool worker restarts",
+                        [((("worker", str(w["index"])),), w["restarts"]) for w in workers]))
+
+    warmup = get_warmup_state()
+    samples.append(("cuda_lab_ready", "gauge", "1 once the startup warm-up has finished",
+                    [((), 1 if warmup.ready else 0)]))
+    if warmup.duration_ms is not None:
+        samples.append(("cuda_lab_warmup_seconds", "gauge", "Duration of the startup warm-up",
+                        [((), warmup.duration_ms / 1000.0)]))
+
+    ptx = get_ptx_cache_stats()
+    samples.append(("cuda_lab_ptx_cache_requests_total", "counter", "PTX (compile) cache lookups by result",
+                    [((("result", "hit"),), ptx["hits"]), ((("result", "miss"),), ptx["misses"])]))
+
+    spec = get_specialization_cache().stats()
+    samples.append(("cuda_lab_kernel_specialization_lookups_total", "counter",
+                    "Mask-size-specialized kernel lookups by result",
+                    [((("result", "hit"),), spec["hits"]), ((("result", "compile"),), spec["compiles"]),
+                     ((("result", "fallback"),), spec["fallbacks"])]))
+    samples.append(("cuda_lab_kernel_specialization_errors_total", "counter",
+                    "Specialized variants that failed to compile (generic kernels used)",
+                    [((), spec["errors"])]))
+    samples.append(("cuda_lab_kernel_specialization_variants", "gauge", "Loaded specialized kernel variants",
+                    [((), spec["variants"])]))
+
+    cache = get_result_cache()
+    result = cache.stats() if cache is not None else {"hits": 0, "misses": 0, "evictions": 0, "bytes": 0}
+    samples.append(("cuda_lab_result_cache_requests_total", "counter", "Result cache lookups by result",
+                    [((("result", "hit"),), result["hits"]), ((("result", "miss"),), result["misses"])]))
+    samples.append(("cuda_lab_result_cache_evictions_total", "counter", "Result cache evictions",
+                    [((), result["evictions"])]))
+    samples.append(("cuda_lab_result_cache_bytes", "gauge", "Bytes held by the result cache",
+                    [((), result["bytes"])]))
+    return samples
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    counters, histograms = _registry.snapshot()
+    lines: List[str] = []
+
+    for name, (kind, help_text, buckets) in _METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "histogram":
+            for (metric, labels), hist in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for edge, count in zip(buckets + (float("inf"),), hist[:-1]):
+                    cumulative += count
+                    le = "+Inf" if edge == float("inf") else repr(edge)
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(hist[-1])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        else:
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    for name, kind, help_text, values in _process_samples():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in values:
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    return "\n".join(lines) + "\n"
@@ -1,12 +1,20 @@
 """
 Progressive convolution service - processes image in chunks and yields intermediate results
 for real-time visualization of pixel-by-pixel processing.
+
+Each chunk is filtered together with a halo of mask_size // 2 rows above and
+below it, so rows at chunk edges come out exactly as in the full-image result.
+Intermediate events only carry the newly finished row band (plus its offset);
+the full image is encoded once, in the final event. With preview_width the
+bands are area-downscaled to that width first, so intermediate events cost
+(preview_width / width)^2 of the bytes and encode time.
 """
 import numpy as np
-from filters import get_filter_kernel
-from image_utils import encode_image_base64
+from filters import get_filter_kernel, apply_filter
+from image_utils import encode_image_base64, resize_image
+from stage_timing import StageTimer
 import time
-from typing import Generator, Tuple
+from typing import Generator, Optional, Tuple
 
 
 def process_progressive_convolution(
@@ -16,99 +24,148 @@ def process_progressive_convolution(
     gain: float,
     block_dim: Tuple[int, int],
     grid_dim: Tuple[int, int],
-    chunk_size: int = 32  # Process in chunks of rows
+    chunk_size: int = 32,  # Process in chunks of rows
+    backend: str = "cuda",
+    delay_ms: float = 0.0,
+    engine: str = "auto",
+    timer: Optional[StageTimer] = None,
+    preview_width: int = 0,
 ) -> Generator[dict, None, None]:
     """
     Process convolution progressively, yielding intermediate results.
-    
+
     Args:
-        img_np: Input grayscale image
+        img_np: Input image, (H, W) grayscale or (H, W, C) color
         filter_type: Type of filter to apply
         mask_size: Size of convolution mask
         gain: Gain parameter (for Prewitt)
-        block_dim: CUDA block dimensions
+        block_dim: CUDA block dimensions, or "auto" (autotuned per band shape)
         grid_dim: CUDA grid dimensions
         chunk_size: Number of rows to process per chunk
-    
+        backend: "cuda" or "cpu" (already resolved by the caller)
+        delay_ms: Optional pause between chunks to pace the animation (default 0)
+        engine: Filter engine (see filters.FILTER_ENGINES), default "auto"
+        timer: Stage timer of the request (e.g. already holding "decode");
+               the final event carries its stage_timings_ms
+        preview_width: If > 0 and smaller than the image, intermediate bands
+               are downscaled to this width (0 = full-resolution bands)
+
     Yields:
-        dict with progress info and partial result image
+        dict with progress info and the finished row band
+        (band_image_base64 + row_offset); the final event carries the full image.
+        In preview mode events also carry preview_width / preview_height and
+        the band's preview_row_offset / preview_band_rows (a band that maps to
+        zero preview rows is sent without band_image_base64)
     """
-    height, width = img_np.shape
-    filter_info = get_filter_kernel(filter_type, mask_size)
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size must be >= 1, got {chunk_size}")
+    if preview_width < 0:
+        raise ValueError(f"preview_width must be >= 0, got {preview_width}")
+
+    if timer is None:
+        timer = StageTimer()
+
+    height, width = img_np.shape[:2]
+    filter_info = get_filter_kernel(filter_type, mask_size, engine, backend)
     filter_used = filter_info["type"]
     mask_size_used = filter_info["mask_size_used"]
-    
-    # Initialize result image (start with gray/black)
+
+    # Rows of context each output row needs above/below it
+    halo = mask_size_used // 2
+
+    # Preview canvas size; row r of the image maps to preview row r * ph // height
+    preview = 0 < preview_width < width
+    if preview:
+        preview_height = max(1, round(height * preview_width / width))
+
+    # Assembled result, sent once in the final event
     result_np = np.zeros_like(img_np, dtype=np.float32)
-    
+
     # Calculate total chunks
     total_chunks = (height + chunk_size - 1) // chunk_size
-    
+
     start_time = time.time()
-    
+
     # Process image in horizontal chunks (row by row simulation)
     for chunk_idx in range(total_chunks):
         chunk_start = chunk_idx * chunk_size
         chunk_end = min(chunk_start + chunk_size, height)
-        
-        # Extract chunk to process
-        chunk_img = img_np[chunk_start:chunk_end, :]
-        
+
+        # Extract chunk plus halo; image borders are still clamped by the filter
+        halo_start = max(0, chunk_start - halo)
+        halo_end = min(height, chunk_end + halo)
+        chunk_img = img_np[halo_start:halo_end, :]
+
         # Process this chunk with the full filter
-        if filter_used == "prewitt":
-            prewitt_func = filter_info["cuda_function"]
-            chunk_result, _ = prewitt_func(chunk_img, block_dim, grid_dim, gain=gain, mask_size=mask_size_used)
-        elif filter_used == "laplacian":
-            laplacian_func = filter_info["cuda_function"]
-            chunk_result, _ = laplacian_func(chunk_img, block_dim, grid_dim, mask_size=mask_size_used)
-        elif filter_used == "gaussian":
-            gaussian_func = filter_info["cuda_function"]
-            chunk_result, _ = gaussian_func(chunk_img, block_dim, grid_dim, mask_size=mask_size_used)
-        elif filter_used == "box_blur":
-            box_blur_func = filter_info["cuda_function"]
-            chunk_result, _ = box_blur_func(chunk_img, block_dim, grid_dim, mask_size=mask_size_used)
-        else:
-            # Fallback
-            from cuda_kernels import convolve_gpu_single
-            chunk_result, _ = convolve_gpu_single(chunk_img, filter_info["kernel"], block_dim, grid_dim)
-        
-        # Update result with processed chunk
-        result_np[chunk_start:chunk_end, :] = chunk_result
-        
+        chunk_result, timings = apply_filter(
+            filter_info, chunk_img, block_dim, grid_dim, gain=gain, backend=backend
+        )
+        timer.add_filter(timings)
+
+        # Keep only the rows that belong to this chunk
+        band = chunk_result[chunk_start - halo_start:chunk_end - halo_start, :]
+        result_np[chunk_start:chunk_end, :] = band
+
         # Calculate progress
         progress = ((chunk_idx + 1) / total_chunks) * 100
         elapsed_ms = (time.time() - start_time) * 1000
-        
-        # Encode current state of the image
-        result_b64 = encode_image_base64(result_np)
-        
-        # Yield progress update
-        yield {
+
+        # Yield progress update with only the new band
+        update = {
             "progress": progress,
             "chunk": chunk_idx + 1,
             "total_chunks": total_chunks,
             "rows_processed": chunk_end,
             "total_rows": height,
+            "image_width": width,
             "elapsed_ms": elapsed_ms,
-            "result_image_base64": result_b64,
+            "row_offset": chunk_start,
+            "band_rows": chunk_end - chunk_start,
             "filter_used": filter_used,
             "mask_size_used": mask_size_used,
         }
-        
-        # Small delay to make visualization visible (adjustable)
-        time.sleep(0.05)  # 50ms delay between chunks for smooth animation
-    
+
+        if preview:
+            p_start = chunk_start * preview_height // height
+            p_end = chunk_end * preview_height // height
+            update.update({
+                "preview_width": preview_width,
+                "preview_height": preview_height,
+                "preview_row_offset": p_start,
+                "preview_band_rows": p_end - p_start,
+            })
+            if p_end > p_start:
+                with timer.stage("encode"):
+                    small = resize_image(band, preview_width, p_end - p_start)
+                    update["band_image_base64"] = encode_image_base64(small)
+        else:
+            with timer.stage("encode"):
+                update["band_image_base64"] = encode_image_base64(band)
+
+        yield update
+
+        # Optional pacing for the visualization (no cost by default)
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000.0)
+
     # Final yield with completion status
+    with timer.stage("encode"):
+        result_b64 = encode_image_base64(result_np)
     total_time = (time.time() - start_time) * 1000
-    yield {
+    final = {
         "progress": 100,
         "chunk": total_chunks,
         "total_chunks": total_chunks,
         "rows_processed": height,
         "total_rows": height,
+        "image_width": width,
         "elapsed_ms": total_time,
-        "result_image_base64": encode_image_base64(result_np),
+        "result_image_base64": result_b64,
         "filter_used": filter_used,
         "mask_size_used": mask_size_used,
         "completed": True,
     }
+    stages = timer.as_dict()
+    if stages:
+        final["stage_timings_ms"] = stages
+    yield final
@@ -0,0 +1,189 @@
+# cuda-lab-back/ptx_cache.py
+"""
+Persistent, content-addressed on-disk cache for PTX produced by nvcc.
+
+Entries are keyed by sha256(kernel source, arch, nvcc version), so every
+uvicorn worker (and every restart) reuses the same compiled PTX instead of
+running nvcc again. Writes are atomic (temp file + os.replace) which makes
+the cache safe to share between processes, and the directory is kept under
+a byte budget by evicting the least recently used entries.
+
+Configuration (environment variables):
+    CUDA_LAB_PTX_CACHE            "0" disables the cache (default enabled)
+    CUDA_LAB_PTX_CACHE_DIR        cache directory (default ~/.cache/cuda-lab/ptx)
+    CUDA_LAB_PTX_CACHE_MAX_BYTES  size budget in bytes (default 64 MiB)
+"""
+
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from typing import Dict, Optional
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "cuda-lab", "ptx")
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+_PTX_SUFFIX = ".ptx"
+
+
+class PtxCache:
+    """On-disk PTX cache with atomic writes and size-bounded LRU eviction."""
+
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0, "errors": 0}
+
+    @staticmethod
+    def make_key(kernel_source: str, arch: str, nvcc_version: str) -> str:
+        """Content address for a (source, arch, compiler) triple."""
+        h = hashlib.sha256()
+        for part in (kernel_source, arch, nvcc_version):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + _PTX_SUFFIX)
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            self._stats[name] += n
+
+    def get(self, key: str) -> Optional[str]:
+        """Return cached PTX for key, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                ptx = f.read()
+        except FileNotFoundError:
+            self._count("misses")
+            return None
+        except OSError:
+            self._count("errors")
+            self._count("misses")
+            return None
+
+        # Refresh mtime so eviction is least-recently-used, not oldest-written
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+        self._count("hits")
+        return ptx
+
+    def put(self, key: str, ptx: str):
+        """Store PTX atomically, then enforce the size budget."""
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    f.write(ptx)
+                # Readers only ever see a complete file
+                os.replace(tmp_path, self._path(key))
+            except BaseException:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+                raise
+        except OSError:
+            # A read-only or full cache dir must never break compilation
+            self._count("errors")
+            return
+
+        self._count("writes")
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits max_bytes."""
+        entries = []
+        total = 0
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+
+        for name in names:
+            if not name.endswith(_PTX_SUFFIX):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue  # removed concurrently by another process
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+        if total <= self.max_bytes:
+            return
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+                self._count("evictions")
+            except OSError:
+                pass
+            total -= size
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss/write/eviction/error counters for this process."""
+        with self._lock:
+            return dict(self._stats)
+
+
+# ---------- Module-level cache and nvcc version ----------
+
+_cache: Optional[PtxCache] = None
+_cache_lock = threading.Lock()
+_nvcc_versions: Dict[str, str] = {}
+
+
+def get_ptx_cache() -> Optional[PtxCache]:
+    """Return the process-wide cache, or None if disabled via CUDA_LAB_PTX_CACHE=0."""
+    global _cache
+    if os.environ.get("CUDA_LAB_PTX_CACHE", "1") == "0":
+        return None
+
+    with _cache_lock:
+        if _cache is None:
+            _cache = PtxCache(
+                os.environ.get("CUDA_LAB_PTX_CACHE_DIR", DEFAULT_CACHE_DIR),
+                int(os.environ.get("CUDA_LAB_PTX_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)),
+            )
+        return _cache
+
+
+def get_ptx_cache_stats() -> Dict[str, int]:
+    """Stats of the process-wide cache (all zeros if disabled)."""
+    cache = get_ptx_cache()
+    if cache is None:
+        return {"hits": 0, "misses": 0, "writes": 0, "evictions": 0, "errors": 0}
+    return cache.stats()
+
+
+def get_nvcc_version(nvcc: str = "nvcc") -> str:
+    """
+    Return the `nvcc --version` banner, cached per resolved nvcc path.
+
+    The resolved path is part of the memo key so that a different nvcc on
+    PATH (another toolkit, or a stub in tests) gets its own cache entries.
+    """
+    resolved = shutil.which(nvcc) or nvcc
+    version = _nvcc_versions.get(resolved)
+    if version is None:
+        try:
+            result = subprocess.run([resolved, "--version"], capture_output=True, text=True)
+            version = result.stdout.strip() or result.stderr.strip()
+        except OSError:
+            version = "unknown"
+        _nvcc_versions[resolved] = version
+    return version
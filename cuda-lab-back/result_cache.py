@@ -0,0 +1,109 @@
+# cuda-lab-back/result_cache.py
+"""
+In-process, content-addressed cache of /convolve responses.
+
+Keys are sha256(image bytes + normalized filter parameters), so resending
+the same image with the same filter, mask_size, color_mode, output encoding,
+resolved engine and backend (and gain, for Prewitt) returns the already
+encoded result without decode, compute or encode. Engine and backend are
+part of the key because the response reports them (engine_used,
+backend_used) and FFT / CPU results may differ by +-1 from direct CUDA.
+Launch parameters (block_dim, grid_dim) do not change the output and are
+not part of the key. Entries are evicted least-recently-used once the
+cache exceeds its byte budget.
+
+Configuration (environment variables):
+    CUDA_LAB_RESULT_CACHE_MAX_BYTES  byte budget (default 256 MiB, 0 disables)
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Rough per-entry cost of the dict/metadata besides the encoded image
+_ENTRY_OVERHEAD_BYTES = 512
+
+
+class ResultCache:
+    """Thread-safe LRU cache of response dicts, bounded by total bytes."""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (response, size)
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def make_key(image_bytes: bytes, filter_type: str, mask_size: int, gain: float,
+                 color_mode: str = "grayscale", output: str = "", engine: str = "",
+                 backend: str = "") -> str:
+        """Hash of the image bytes plus the parameters that affect the response (incl. its encoding)."""
+        h = hashlib.sha256(image_bytes)
+        h.update(
+            f"|{filter_type}|{int(mask_size)}|{float(gain)!r}|{color_mode}|{output}|{engine}|{backend}".encode("utf-8")
+        )
+        return h.hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[0]
+
+    def put(self, key: str, response: dict):
+        size = len(response.get("result_image_base64", "")) + _ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return  # would evict everything else for a single entry
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+
+            self._entries[key] = (response, size)
+            self._bytes += size
+
+            while self._bytes > self.max_bytes:
+                _, (_, old_size) = self._entries.popitem(last=False)
+                self._bytes -= old_size
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                **self._stats,
+            }
+
+
+_cache: Optional[ResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    """Process-wide cache, or None when CUDA_LAB_RESULT_CACHE_MAX_BYTES=0."""
+    global _cache
+    max_bytes = int(os.environ.get("CUDA_LAB_RESULT_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+    if max_bytes <= 0:
+        return None
+
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache(max_bytes)
+        return _cache
@@ -0,0 +1,116 @@
+# cuda-lab-back/stage_timing.py
+"""
+Per-stage wall-time breakdown of a request.
+
+Stages, all measured with time.perf_counter (monotonic):
+    decode    - base64 + image decode
+    upload    - host -> device copies (0 on the CPU backend)
+    kernel    - CUDA-event time of the kernels (the whole filter on CPU)
+    download  - device -> host copies
+    other     - rest of the filter call: compile, allocation, quantization
+    encode    - image encode + base64
+    total     - whole request
+
+Filters report upload_ms / download_ms next to kernel_time_ms, and
+execution_time_ms is the wall time of the filter call.
+
+Configuration (environment variables):
+    CUDA_LAB_STAGE_TIMING   "0" drops stage_timings_ms from responses (default on)
+    CUDA_LAB_SERVER_TIMING  "1" also sends a Server-Timing header (default off)
+"""
+
+import os
+import time
+from typing import Dict, Optional
+
+# Filter timing keys that add up across channels and tiles
+TIMING_KEYS = ("execution_time_ms", "kernel_time_ms", "upload_ms", "download_ms")
+
+
+def stage_timing_enabled() -> bool:
+    return os.environ.get("CUDA_LAB_STAGE_TIMING", "1") != "0"
+
+
+def server_timing_enabled() -> bool:
+    return stage_timing_enabled() and os.environ.get("CUDA_LAB_SERVER_TIMING", "0") == "1"
+
+
+def add_timings(total: Dict[str, float], timings: Dict[str, float]) -> Dict[str, float]:
+    """Accumulate one filter call's timings into total (per channel / per tile)."""
+    for key in TIMING_KEYS:
+        total[key] = total.get(key, 0.0) + float(timings.get(key, 0.0))
+    return total
+
+
+class _Stage:
+    __slots__ = ("timer", "name", "start")
+
+    def __init__(self, timer: "StageTimer", name: str):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.add(self.name, (time.perf_counter() - self.start) * 1000.0)
+        return False
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class StageTimer:
+    """Collects stage durations for one request; a disabled timer is a no-op."""
+
+    __slots__ = ("enabled", "stages", "_start")
+
+    def __init__(self, enabled: Optional[bool] = None):
+        self.enabled = stage_timing_enabled() if enabled is None else enabled
+        self.stages: Dict[str, float] = {}
+        self._start = time.perf_counter()
+
+    def stage(self, name: str):
+        """Context manager timing one stage (repeated stages add up)."""
+        return _Stage(self, name) if self.enabled else _NULL_STAGE
+
+    def add(self, name: str, ms: float):
+        if self.enabled:
+            self.stages[name] = self.stages.get(name, 0.0) + ms
+
+    def add_filter(self, timings: Dict[str, float]):
+        """Split a filter call's timings into upload / kernel / download / other."""
+        if not self.enabled:
+            return
+        upload = float(timings.get("upload_ms", 0.0))
+        kernel = float(timings.get("kernel_time_ms", 0.0))
+        download = float(timings.get("download_ms", 0.0))
+        execution = float(timings.get("execution_time_ms", 0.0))
+        self.add("upload", upload)
+        self.add("kernel", kernel)
+        self.add("download", download)
+        self.add("other", max(execution - upload - kernel - download, 0.0))
+
+    def as_dict(self) -> Dict[str, float]:
+        """Stage durations in ms plus "total"; empty when disabled."""
+        if not self.enabled:
+            return {}
+        stages = dict(self.stages)
+        stages["total"] = (time.perf_counter() - self._start) * 1000.0
+        return stages
+
+
+def server_timing_header(stages: Dict[str, float]) -> str:
+    """Server-Timing header value, e.g. 'decode;dur=1.204, kernel;dur=0.311'."""
+    return ", ".join(f"{name};dur={ms:.3f}" for name, ms in stages.items())
@@ -0,0 +1,10 @@
+# tests/conftest.py
+# Makes the backend modules importable from the tests (they live one level up)
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Manual scripts that talk to a running server, not pytest tests
+collect_ignore = ["test_valid_request.py", "test_image_generator.py", "prewitt_standalone.py"]
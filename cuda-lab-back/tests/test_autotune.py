@@ -0,0 +1,123 @@
+# tests/test_autotune.py
+# Autotuner winner selection, persistence and reuse with a fake timer (no GPU needed)
+
+import json
+
+import numpy as np
+import pytest
+
+from autotune import (
+    DEFAULT_BLOCK_DIM, MAX_CANDIDATES, MAX_REPEATS,
+    AutotuneStore, Autotuner, parse_block_dim, shape_bucket, tune_key,
+)
+
+BOX_BLUR_5 = {"type": "box_blur", "mask_size_used": 5, "engine": "direct"}
+FFT_21 = {"type": "box_blur", "mask_size_used": 21, "engine": "fft"}
+
+
+class FakeTimer:
+    """Reports a fixed time per block_dim and records every call."""
+
+    def __init__(self, times_ms):
+        self.times_ms = times_ms
+        self.calls = []
+
+    def __call__(self, filter_info, image, block_dim, gain, backend):
+        self.calls.append(tuple(block_dim))
+        return self.times_ms.get(tuple(block_dim), 10.0)
+
+
+@pytest.fixture
+def image():
+    return np.zeros((600, 800), dtype=np.float32)
+
+
+def test_resolve_picks_fastest_candidate(tmp_path, image):
+    timer = FakeTimer({(32, 8): 1.0, (16, 16): 2.0})
+    tuner = Autotuner(AutotuneStore(str(tmp_path / "autotune.json")),
+                      candidates=[(16, 16), (32, 8), (8, 8)], timer=timer, repeats=2)
+
+    assert tuner.resolve(BOX_BLUR_5, image, 8.0, "cuda") == (32, 8)
+    assert len(timer.calls) == 3 * 2
+
+
+def test_winner_is_persisted_and_reused(tmp_path, image):
+    path = str(tmp_path / "autotune.json")
+    timer = FakeTimer({(8, 8): 0.5})
+    Autotuner(AutotuneStore(path), candidates=[(16, 16), (8, 8)], timer=timer).resolve(
+        BOX_BLUR_5, image, 8.0, "cuda")
+
+    with open(path) as f:
+        entries = json.load(f)
+    key = tune_key("cuda", "box_blur", 5, "direct", 600, 800)
+    assert entries[key]["block_dim"] == [8, 8]
+
+    # A fresh process reads the stored winner instead of tuning again
+    fresh_timer = FakeTimer({})
+    fresh = Autotuner(AutotuneStore(path), timer=fresh_timer)
+    assert fresh.resolve(BOX_BLUR_5, image, 8.0, "cuda") == (8, 8)
+    # Same shape bucket, different exact size
+    assert fresh.resolve(BOX_BLUR_5, np.zeros((1000, 1000), np.float32), 8.0, "cuda") == (8, 8)
+    assert fresh_timer.calls == []
+
+
+def test_stores_merge_entries_from_other_processes(tmp_path, image):
+    path = str(tmp_path / "autotune.json")
+    first, second = AutotuneStore(path), AutotuneStore(path)
+    assert first.get("a") is None and second.get("b") is None
+
+    first.put("a", {"block_dim": [32, 8]})
+    second.put("b", {"block_dim": [8, 8]})
+
+    with open(path) as f:
+        assert set(json.load(f)) == {"a", "b"}
+    assert first.get("b") == {"block_dim": [8, 8]}
+
+
+def test_failed_write_keeps_entry_and_leaves_no_temp_file(tmp_path):
+    store = AutotuneStore(str(tmp_path / "autotune.json"))
+    store.put("bad", {"block_dim": object()})  # not JSON-serializable
+
+    assert store.get("bad") is not None
+    assert not [p for p in tmp_path.iterdir() if p.suffix == ".tmp"]
+
+
+def test_fft_engine_is_not_tuned(tmp_path, image):
+    timer = FakeTimer({})
+    tuner = Autotuner(AutotuneStore(str(tmp_path / "autotune.json")), timer=timer)
+
+    assert tuner.resolve(FFT_21, image, 8.0, "cuda") == DEFAULT_BLOCK_DIM
+    assert timer.calls == []
+
+
+def test_candidates_and_repeats_are_capped(tmp_path):
+    many = [(8, 8), (16, 8)] * 3 + [(x, 4) for x in range(1, 20)]
+    tuner = Autotuner(AutotuneStore(str(tmp_path / "autotune.json")),
+                      candidates=many, repeats=50)
+
+    assert tuner.candidates[0] == DEFAULT_BLOCK_DIM
+    assert len(tuner.candidates) == MAX_CANDIDATES
+    assert len(set(tuner.candidates)) == len(tuner.candidates)
+    assert tuner.repeats == MAX_REPEATS
+
+
+def test_budget_stops_tuning_after_first_candidate(tmp_path, image):
+    timer = FakeTimer({})
+    tuner = Autotuner(AutotuneStore(str(tmp_path / "autotune.json")), timer=timer, budget_ms=0.0)
+
+    assert tuner.resolve(BOX_BLUR_5, image, 8.0, "cuda") == DEFAULT_BLOCK_DIM
+    assert set(timer.calls) == {DEFAULT_BLOCK_DIM}
+
+
+def test_parse_block_dim():
+    assert parse_block_dim("AUTO") == "auto"
+    assert parse_block_dim([32, 8]) == (32, 8)
+    with pytest.raises(ValueError):
+        parse_block_dim([64, 32])
+    with pytest.raises(ValueError):
+        parse_block_dim("fast")
+
+
+def test_shape_bucket_rounds_up_to_powers_of_two():
+    assert shape_bucket(1080, 1920) == "2048x2048"
+    assert shape_bucket(600, 800) == "1024x1024"
@@ -0,0 +1,62 @@
+# tests/test_batch_convolution.py
+# /convolve-batch service path: lazy per-image decode and per-item errors (CPU backend)
+
+import base64
+import io
+
+import numpy as np
+from PIL import Image
+
+import convolution_service
+from convolution_service import iter_batch_convolution, process_batch_convolution_request
+
+
+def encode_png(image: np.ndarray) -> str:
+    buf = io.BytesIO()
+    Image.fromarray(image).save(buf, "PNG")
+    return base64.b64encode(buf.getvalue()).decode()
+
+
+def batch(images):
+    return {
+        "images": images,
+        "filters": [
+            {"type": "gaussian", "mask_size": 5},
+            {"type": "prewitt", "mask_size": 3},
+            {"type": "gaussian", "mask_size": 5},
+        ],
+        "cuda_config": {"block_dim": [16, 16], "grid_dim": [1, 1]},
+        "backend": "cpu",
+    }
+
+
+def test_images_are_decoded_one_at_a_time(monkeypatch):
+    decoded = []
+    real_decode = convolution_service.decode_image_base64
+
+    def counting_decode(image_b64, color_mode):
+        decoded.append(image_b64)
+        return real_decode(image_b64, color_mode)
+
+    monkeypatch.setattr(convolution_service, "decode_image_base64", counting_decode)
+    rng = np.random.default_rng(0)
+    images = [encode_png(rng.integers(0, 256, (12, 15), dtype=np.uint8)) for _ in range(3)]
+
+    results = iter_batch_convolution(batch(images))
+    first_image = [next(results) for _ in range(3)]
+
+    assert decoded == images[:1]
+    assert {r["image_index"] for r in first_image} == {0}
+    assert len(list(results)) == 6
+    assert decoded == images
+
+
+def test_invalid_image_fails_only_its_items():
+    good = encode_png(np.zeros((8, 8), dtype=np.uint8))
+
+    response = process_batch_convolution_request(batch([good, "not an image", good]))
+
+    assert response["total_items"] == 9
+    assert response["failed_items"] == 3
+    for r in response["results"]:
+        assert (r["status"] == "error") == (r["image_index"] == 1)
@@ -0,0 +1,29 @@
+# tests/test_box_blur_engines.py
+# Box blur running_sum engine against the direct engine (CPU backend)
+
+import numpy as np
+import pytest
+
+from filters import apply_filter, get_filter_kernel
+
+
+@pytest.fixture
+def image():
+    return np.random.default_rng(0).integers(0, 256, (37, 53)).astype(np.float32)
+
+
+def box_blur(image, mask_size, engine):
+    info = get_filter_kernel("box_blur", mask_size, engine)
+    result, _ = apply_filter(info, image, (16, 16), (1, 1), backend="cpu")
+    return result
+
+
+@pytest.mark.parametrize("mask_size", [3, 5, 15, 21, 51, 75])
+def test_running_sum_matches_direct_exactly(image, mask_size):
+    # 75 is wider than the image: every window is mostly clamped border
+    assert np.array_equal(box_blur(image, mask_size, "running_sum"), box_blur(image, mask_size, "direct"))
+
+
+def test_running_sum_matches_direct_per_channel(image):
+    rgb = np.stack([image, image[::-1], 255 - image], axis=2)
+    assert np.array_equal(box_blur(rgb, 21, "running_sum"), box_blur(rgb, 21, "direct"))
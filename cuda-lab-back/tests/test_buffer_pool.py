@@ -0,0 +1,125 @@
+# tests/test_buffer_pool.py
+# BufferPool size classes, reuse, cap handling and overflow with a fake allocator
+
+import pytest
+
+from buffer_pool import MIN_SIZE_CLASS, BufferPool, FakeDeviceAllocator, size_class
+
+
+@pytest.mark.parametrize("nbytes, expected", [
+    (1, MIN_SIZE_CLASS),
+    (4096, 4096),
+    (4097, 5120),
+    (8192, 8192),
+    (8193, 10240),
+    (10241, 12288),
+    (1 << 20, 1 << 20),
+    ((1 << 20) + 1, 1310720),
+])
+def test_size_class(nbytes, expected):
+    assert size_class(nbytes) == expected
+
+
+def test_size_class_padding_is_under_25_percent():
+    for nbytes in range(MIN_SIZE_CLASS, 1 << 20, 997):
+        cls = size_class(nbytes)
+        assert nbytes <= cls < nbytes * 1.25
+
+
+def test_released_buffers_are_reused():
+    allocator = FakeDeviceAllocator()
+    pool = BufferPool(allocator)
+
+    lease = pool.acquire(5000)
+    buf = lease.buffer
+    lease.release()
+    again = pool.acquire(5100)  # same 5 KiB class
+
+    assert again.buffer is buf
+    assert allocator.allocs == 1
+    assert pool.stats()["hits"] == 1 and pool.stats()["misses"] == 1
+
+
+def test_different_classes_do_not_share_buffers():
+    allocator = FakeDeviceAllocator()
+    pool = BufferPool(allocator)
+
+    pool.acquire(5000).release()
+    pool.acquire(9000).release()
+
+    assert allocator.allocs == 2
+    assert pool.stats()["pooled_bytes"] == 5120 + 10240
+
+
+def test_lease_group_releases_everything():
+    pool = BufferPool(FakeDeviceAllocator())
+    with pool.leases() as group:
+        group.alloc(4096)
+        group.alloc(8192)
+        assert pool.stats()["live_bytes"] == 4096 + 8192
+
+    stats = pool.stats()
+    assert stats["live_bytes"] == 0
+    assert stats["high_water_bytes"] == 4096 + 8192
+
+
+def test_cap_evicts_oldest_idle_buffers_first():
+    allocator = FakeDeviceAllocator()
+    pool = BufferPool(allocator, max_bytes=3 * 4096)
+
+    first, second = pool.acquire(4096), pool.acquire(4096)
+    first.release()
+    second.release()
+    kept = second.buffer
+
+    pool.acquire(8192)  # needs one idle 4 KiB buffer freed
+
+    stats = pool.stats()
+    assert stats["evictions"] == 1 and stats["overflows"] == 0
+    assert pool.acquire(4096).buffer is kept  # the newest survived
+
+
+def test_over_cap_falls_back_to_direct_allocation():
+    allocator = FakeDeviceAllocator()
+    pool = BufferPool(allocator, max_bytes=8192)
+
+    pooled = pool.acquire(8000)
+    direct = pool.acquire(5000)  # does not fit: nothing idle to evict
+
+    assert pooled.pooled and not direct.pooled
+    assert len(direct.buffer) == 5000
+    assert pool.stats()["overflow_bytes"] == 5000
+    assert pool.stats()["live_bytes"] == 8192
+
+    direct.release()
+    stats = pool.stats()
+    assert stats["overflows"] == 1 and stats["overflow_bytes"] == 0
+    assert stats["pooled_bytes"] == 0  # direct buffers are freed, not kept
+    assert allocator.frees == 1
+
+
+def test_trim_frees_idle_buffers():
+    allocator = FakeDeviceAllocator()
+    pool = BufferPool(allocator)
+    for n in (4096, 6000, 20000):
+        pool.acquire(n).release()
+
+    pool.trim()
+
+    assert allocator.live == 0
+    assert pool.stats()["pooled_bytes"] == 0
+
+
+def test_failed_allocation_does_not_leak_accounting():
+    class FailingAllocator(FakeDeviceAllocator):
+        def alloc(self, nbytes):
+            raise MemoryError("out of device memory")
+
+    pool = BufferPool(FailingAllocator(), max_bytes=4096)
+    with pytest.raises(MemoryError):
+        pool.acquire(4096)
+    with pytest.raises(MemoryError):
+        pool.acquire(9000)  # direct path
+
+    stats = pool.stats()
+    assert stats["live_bytes"] == 0 and stats["overflow_bytes"] == 0
@@ -0,0 +1,86 @@
+# tests/test_channel_planes.py
+# Multi-channel filtering: (C, H, W) plane layout, per-plane kernel offsets and
+# channel independence
+
+import re
+
+import numpy as np
+import pytest
+
+import filters
+from filters import FILTER_ENGINES, apply_custom_kernel, apply_filter, get_filter_kernel, plan_custom_kernel
+from cuda_kernels import from_planes, to_planes
+from kernel_specialization import SPECIALIZATIONS, SPECIALIZED_MASK_SIZES
+
+
+def kernel_bodies(source):
+    """{kernel name: body} of every __global__ function in source."""
+    bodies = {}
+    for m in re.finditer(r"__global__\s+void\s+(\w+)\s*\([^)]*\)\s*\{", source):
+        depth, i = 1, m.end()
+        while depth:
+            depth += {"{": 1, "}": -1}.get(source[i], 0)
+            i += 1
+        bodies[m.group(1)] = source[m.end():i]
+    return bodies
+
+
+@pytest.mark.parametrize("shape", [(5, 7), (5, 7, 1), (5, 7, 3), (5, 7, 4)])
+def test_planes_round_trip(shape):
+    image = np.arange(np.prod(shape), dtype=np.float32).reshape(shape)
+    planes = to_planes(image)
+
+    assert planes.flags["C_CONTIGUOUS"]
+    assert planes.shape == (shape[2] if len(shape) == 3 else 1, 5, 7)
+    assert np.array_equal(planes[-1], image if image.ndim == 2 else image[..., -1])
+    assert np.array_equal(from_planes(planes, image.ndim), image)
+
+
+@pytest.mark.parametrize("channels", [3, 4])
+@pytest.mark.parametrize("filter_type, engine", [
+    (filter_type, engine) for filter_type, engines in FILTER_ENGINES.items() for engine in engines
+])
+def test_each_channel_is_filtered_on_its_own(filter_type, engine, channels):
+    image = np.random.default_rng(channels).integers(0, 256, (19, 24, channels)).astype(np.float32)
+    info = get_filter_kernel(filter_type, 5, engine)
+
+    together, _ = apply_filter(info, image, (16, 16), (1, 1), gain=4.0, backend="cpu")
+
+    assert together.shape == image.shape
+    for c in range(channels):
+        alone, _ = apply_filter(info, image[..., c], (16, 16), (1, 1), gain=4.0, backend="cpu")
+        assert np.array_equal(together[..., c], alone)
+
+
+@pytest.mark.parametrize("kernel", [
+    [[1, 2, 1], [2, 4, 2], [1, 2, 1]],      # rank 1
+    [[0, -1, 0], [-1, 5, -1], [0, -1, 0]],  # sharpen, rank > 1
+])
+def test_custom_kernel_filters_each_channel_on_its_own(kernel):
+    image = np.random.default_rng(5).integers(0, 256, (19, 24, 3)).astype(np.float32)
+    plan = plan_custom_kernel(kernel, 3, 1e-5)
+
+    together, _ = apply_custom_kernel(plan, image, (16, 16), "cpu", "clip")
+
+    for c in range(3):
+        alone, _ = apply_custom_kernel(plan, image[..., c], (16, 16), "cpu", "clip")
+        assert np.array_equal(together[..., c], alone)
+
+
+def all_sources():
+    """{label: CUDA source} of every generic module and specialized variant."""
+    sources = {filter_type: source for filter_type, (source, _) in filters.CUDA_MODULES.items()}
+    for filter_type, generate in SPECIALIZATIONS.items():
+        for N in SPECIALIZED_MASK_SIZES:
+            generated = generate(N)
+            if generated is not None:
+                sources[f"{filter_type}_n{N}"] = generated[0]
+    return sources
+
+
+@pytest.mark.parametrize("label", sorted(all_sources()))
+def test_every_kernel_selects_its_plane(label):
+    bodies = kernel_bodies(all_sources()[label])
+    assert bodies
+    for kernel, body in bodies.items():
+        assert "blockIdx.z" in body, f"{label}: {kernel} ignores the channel plane"
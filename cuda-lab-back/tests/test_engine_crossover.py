@@ -0,0 +1,39 @@
+# tests/test_engine_crossover.py
+# "auto" engine selection from the measured direct vs. alternative crossover table
+
+import pytest
+
+from filters import resolve_engine
+from filters.engine_crossover import set_engine_crossover
+from filters.prewitt import SAT_MAX_MASK, SAT_MIN_MASK
+
+
+@pytest.fixture
+def table():
+    set_engine_crossover({
+        "cpu": {"prewitt": {"sat": 5}, "laplacian": {"separable": 3}},
+        "cuda": {"prewitt": {"sat": None}},
+    })
+    yield
+    set_engine_crossover(None)
+
+
+def test_measured_entry_sets_the_threshold(table):
+    assert resolve_engine("prewitt", 3, "auto", "cpu") == "direct"
+    assert resolve_engine("prewitt", 5, "auto", "cpu") == "sat"
+    assert resolve_engine("prewitt", SAT_MAX_MASK + 2, "auto", "cpu") == "direct"
+
+
+def test_null_entry_never_picks_the_alternative(table):
+    assert resolve_engine("prewitt", 51, "auto", "cuda") == "direct"
+
+
+def test_separable_log_needs_a_log_mask(table):
+    # mask_size 3 is the classic integer Laplacian, whatever the table says
+    assert resolve_engine("laplacian", 3, "auto", "cpu") == "direct"
+    assert resolve_engine("laplacian", 5, "auto", "cpu") == "separable"
+
+
+def test_unmeasured_backend_uses_the_default(table):
+    assert resolve_engine("prewitt", SAT_MIN_MASK - 2, "auto") == "direct"
+    assert resolve_engine("prewitt", SAT_MIN_MASK, "auto") == "sat"
@@ -0,0 +1,33 @@
+# tests/test_fft_engine.py
+# FFT engine selection and the backend it reports
+
+import pytest
+
+from filters import executed_backend, get_filter_kernel, resolve_engine
+from filters.fft import set_crossover_table
+
+
+@pytest.fixture
+def crossover():
+    set_crossover_table({"cpu": {"laplacian": 7}, "cuda": {"laplacian": 7}})
+    yield
+    set_crossover_table(None)
+
+
+def test_auto_picks_fft_from_the_cpu_table(crossover):
+    assert resolve_engine("laplacian", 21, "auto", "cpu") == "fft"
+    assert resolve_engine("laplacian", 5, "auto", "cpu") != "fft"
+
+
+def test_auto_never_picks_fft_on_cuda(crossover):
+    # The engine would run on the host there, whatever a table says
+    assert resolve_engine("laplacian", 21, "auto", "cuda") != "fft"
+
+
+def test_fft_reports_the_cpu_backend():
+    fft = get_filter_kernel("gaussian", 51, "fft", "cuda")
+    direct = get_filter_kernel("gaussian", 51, "direct", "cuda")
+
+    assert executed_backend(fft, "cuda") == "cpu"
+    assert executed_backend(fft, "cpu") == "cpu"
+    assert executed_backend(direct, "cuda") == "cuda"
@@ -0,0 +1,181 @@
+# tests/test_kernel_specialization.py
+# Specialization cache, source generation and generic fallback with a stub compiler
+
+import re
+import threading
+
+import numpy as np
+import pytest
+
+import filters
+import kernel_specialization
+from kernel_specialization import (
+    SPECIALIZATIONS, SPECIALIZED_MASK_SIZES, SpecializationCache,
+    float_array, float_literal, get_kernel, specialized_name,
+)
+
+
+class StubModule:
+    """Loaded module stand-in: functions are just their names."""
+
+    def __init__(self, source):
+        self.source = source
+
+    def get_function(self, name):
+        if f" {name}(" not in self.source:
+            raise LookupError(name)
+        return name
+
+
+class StubCompiler:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.sources = []
+
+    def __call__(self, source):
+        self.sources.append(source)
+        if self.fail:
+            raise RuntimeError("nvcc: syntax error")
+        return StubModule(source)
+
+
+def kernel_params(source):
+    """{kernel name: parameter types} of every __global__ function in source."""
+    params = {}
+    for name, args in re.findall(r"__global__\s+void\s+(\w+)\s*\(([^)]*)\)", source):
+        types = [re.sub(r"\s+", " ", a.strip()).rsplit(" ", 1)[0].replace("__restrict__", "").strip()
+                 for a in args.split(",")]
+        params[name] = types
+    return params
+
+
+def test_lookup_compiles_once_then_hits():
+    compiler = StubCompiler()
+    cache = SpecializationCache(compiler=compiler)
+
+    first = cache.lookup("gaussian", 5)
+    second = cache.lookup("gaussian", 5)
+
+    assert first is second
+    assert first == {"gauss_horiz_f": "gauss_horiz_f_n5", "gauss_vert_f": "gauss_vert_f_n5"}
+    assert len(compiler.sources) == 1
+    assert cache.stats() == {"hits": 1, "compiles": 1, "fallbacks": 0, "errors": 0, "variants": 1}
+
+
+def test_unspecialized_size_or_filter_falls_back():
+    compiler = StubCompiler()
+    cache = SpecializationCache(compiler=compiler, sizes=(3, 5))
+
+    assert cache.lookup("gaussian", 11) is None
+    assert cache.lookup("custom", 5) is None
+    assert compiler.sources == []
+    assert cache.stats()["fallbacks"] == 2
+
+
+def test_compile_error_falls_back_and_is_not_retried():
+    compiler = StubCompiler(fail=True)
+    cache = SpecializationCache(compiler=compiler)
+
+    assert cache.lookup("box_blur", 7) is None
+    assert cache.lookup("box_blur", 7) is None
+
+    stats = cache.stats()
+    assert len(compiler.sources) == 1
+    assert stats["errors"] == 1 and stats["fallbacks"] == 2 and stats["variants"] == 0
+    assert "box_blur N=7" in cache.last_error
+
+
+class BlockingCompiler(StubCompiler):
+    """Compiles stall until release is set, like a slow nvcc run."""
+
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, source):
+        self.started.set()
+        assert self.release.wait(5)
+        return super().__call__(source)
+
+
+def test_compile_does_not_block_other_keys():
+    compiler = BlockingCompiler()
+    cache = SpecializationCache(compiler=compiler)
+    cache._entries[("box_blur", 3)] = {"box_blur_h": "hit"}
+
+    slow = threading.Thread(target=cache.lookup, args=("gaussian", 5))
+    slow.start()
+    assert compiler.started.wait(5)
+
+    # Served while the gaussian N=5 compile is still running
+    assert cache.lookup("box_blur", 3) == {"box_blur_h": "hit"}
+    assert cache.stats()["hits"] == 1
+
+    compiler.release.set()
+    slow.join(5)
+    assert cache.stats()["compiles"] == 1
+
+
+def test_concurrent_lookups_of_one_key_compile_once():
+    compiler = BlockingCompiler()
+    cache = SpecializationCache(compiler=compiler)
+    results = []
+
+    threads = [threading.Thread(target=lambda: results.append(cache.lookup("gaussian", 5)))
+               for _ in range(4)]
+    for t in threads:
+        t.start()
+    assert compiler.started.wait(5)
+    compiler.release.set()
+    for t in threads:
+        t.join(5)
+
+    assert len(compiler.sources) == 1
+    assert len(results) == 4 and all(r == results[0] and r is not None for r in results)
+    assert cache.stats()["compiles"] == 1 and cache.stats()["hits"] == 3
+
+
+def test_get_kernel_uses_variant_or_generic(monkeypatch):
+    class GenericModule:
+        def get_function(self, name):
+            return f"generic:{name}"
+
+    monkeypatch.setattr(kernel_specialization, "_cache", SpecializationCache(compiler=StubCompiler()))
+    monkeypatch.setenv("CUDA_LAB_SPECIALIZE", "1")
+    assert get_kernel("box_blur", 5, "box_horiz_u8_to_f", GenericModule()) == "box_horiz_u8_to_f_n5"
+    assert get_kernel("box_blur", 11, "box_horiz_u8_to_f", GenericModule()) == "generic:box_horiz_u8_to_f"
+
+    monkeypatch.setenv("CUDA_LAB_SPECIALIZE", "0")
+    assert get_kernel("box_blur", 5, "box_horiz_u8_to_f", GenericModule()) == "generic:box_horiz_u8_to_f"
+
+
+@pytest.mark.parametrize("filter_type", sorted(SPECIALIZATIONS))
+@pytest.mark.parametrize("N", SPECIALIZED_MASK_SIZES)
+def test_variants_keep_the_generic_parameter_lists(filter_type, N):
+    generic_src = filters.CUDA_MODULES[filter_type][0]
+    generated = SPECIALIZATIONS[filter_type](N)
+    if generated is None:
+        return
+    source, names = generated
+
+    generic = kernel_params(generic_src)
+    specialized = kernel_params(source)
+    for name in names:
+        assert specialized[specialized_name(name, N)] == generic[name]
+    assert f"const int N = {N};" in source
+
+
+def test_gaussian_weights_are_baked_in_exactly():
+    from filters.gaussian import make_gauss_1d
+
+    source, _ = SPECIALIZATIONS["gaussian"](7)
+    weights = make_gauss_1d(7)
+    assert f"const float k1d[7] = {float_array(weights)};" in source
+
+
+@pytest.mark.parametrize("value", [0.1, 1.0 / 3.0, 2.5e-8, -7.0, 0.0])
+def test_float_literal_round_trips_float32(value):
+    literal = float_literal(value)
+    assert literal.endswith("f")
+    assert np.float32(float(literal[:-1])) == np.float32(value)
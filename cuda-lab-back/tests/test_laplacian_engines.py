@@ -0,0 +1,36 @@
+# tests/test_laplacian_engines.py
+# Separable LoG engine against the dense LoG (CPU backend)
+
+import numpy as np
+import pytest
+
+from filters import apply_filter, get_filter_kernel
+from filters.laplacian import make_log_kernel, separable_log_error
+
+
+@pytest.fixture
+def image():
+    return np.random.default_rng(2).integers(0, 256, (45, 38)).astype(np.float32)
+
+
+def laplacian(image, mask_size, engine):
+    info = get_filter_kernel("laplacian", mask_size, engine)
+    result, _ = apply_filter(info, image, (16, 16), (1, 1), backend="cpu")
+    return result
+
+
+@pytest.mark.parametrize("mask_size", [5, 7, 9, 21, 31])
+def test_separable_matches_direct_within_one(image, mask_size):
+    diff = np.abs(laplacian(image, mask_size, "separable") - laplacian(image, mask_size, "direct"))
+    assert diff.max() <= 1
+    assert (diff > 0).mean() < 0.01  # rounding ties only, on isolated pixels
+
+
+@pytest.mark.parametrize("mask_size", [5, 9, 21, 51])
+def test_separable_factors_rebuild_the_log_kernel(mask_size):
+    assert separable_log_error(mask_size) < 1e-6 * np.abs(make_log_kernel(mask_size)).max()
+
+
+def test_separable_rejects_the_3x3_laplacian(image):
+    with pytest.raises(ValueError):
+        laplacian(image, 3, "separable")
@@ -0,0 +1,124 @@
+# tests/test_micro_batching.py
+# Compute worker micro-batching and grouped /convolve launches (CPU backend)
+
+import asyncio
+import base64
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from compute_worker import ComputeWorker
+from convolution_service import convolution_batch_key, process_convolution_batch, process_convolution_request
+
+
+def run(coro):
+    return asyncio.new_event_loop().run_until_complete(coro)
+
+
+def test_same_key_jobs_share_one_batch_call():
+    calls = []
+
+    def batch_fn(items):
+        calls.append(list(items))
+        return [item * 10 for item in items]
+
+    async def main():
+        worker = ComputeWorker(batch_window_ms=20, max_batch=8)
+        worker.start()
+        results = await asyncio.gather(*(worker.submit_batched(batch_fn, i, "k") for i in range(4)))
+        stats = worker.stats()
+        await worker.stop()
+        return results, stats
+
+    results, stats = run(main())
+
+    assert results == [0, 10, 20, 30]
+    assert calls == [[0, 1, 2, 3]]
+    assert stats["batches"] == 1 and stats["batched_jobs"] == 4 and stats["completed"] == 4
+
+
+def test_other_keys_keep_their_order_and_max_batch_is_respected():
+    calls = []
+
+    def batch_fn(items):
+        calls.append([key for key, _ in items])
+        return [i for _, i in items]
+
+    async def main():
+        worker = ComputeWorker(batch_window_ms=20, max_batch=2)
+        worker.start()
+        jobs = [("a", 0), ("b", 1), ("a", 2), ("a", 3), ("b", 4)]
+        results = await asyncio.gather(*(worker.submit_batched(batch_fn, job, job[0]) for job in jobs))
+        await worker.stop()
+        return results
+
+    assert run(main()) == [0, 1, 2, 3, 4]
+    assert calls == [["a", "a"], ["b", "b"], ["a"]]
+
+
+def test_an_item_exception_fails_only_that_job():
+    def batch_fn(items):
+        return [ValueError("bad") if item < 0 else item for item in items]
+
+    async def main():
+        worker = ComputeWorker(batch_window_ms=20)
+        worker.start()
+        results = await asyncio.gather(
+            *(worker.submit_batched(batch_fn, i, "k") for i in (1, -1, 2)), return_exceptions=True
+        )
+        await worker.stop()
+        return results
+
+    ok, failed, ok2 = run(main())
+    assert (ok, ok2) == (1, 2)
+    assert isinstance(failed, ValueError)
+
+
+def encode_png(image: np.ndarray) -> str:
+    buf = io.BytesIO()
+    Image.fromarray(image).save(buf, "PNG")
+    return base64.b64encode(buf.getvalue()).decode()
+
+
+def payload(image_base64, filter_type, engine, color_mode):
+    return {
+        "image_base64": image_base64,
+        "filter": {"type": filter_type, "mask_size": 5, "gain": 4.0, "engine": engine},
+        "cuda_config": {"block_dim": [16, 16], "grid_dim": [1, 1]},
+        "backend": "cpu",
+        "color_mode": color_mode,
+    }
+
+
+@pytest.mark.parametrize("color_mode, shape", [("grayscale", (21, 26)), ("rgb", (21, 26, 3))])
+@pytest.mark.parametrize("filter_type, engine", [
+    ("box_blur", "direct"), ("box_blur", "running_sum"), ("gaussian", "direct"),
+    ("laplacian", "separable"), ("prewitt", "sat"), ("prewitt", "fft"),
+])
+def test_grouped_launch_matches_single_requests(color_mode, shape, filter_type, engine):
+    rng = np.random.default_rng(0)
+    payloads = [
+        payload(encode_png(rng.integers(0, 256, shape, dtype=np.uint8)), filter_type, engine, color_mode)
+        for _ in range(3)
+    ]
+    assert len({convolution_batch_key(p) for p in payloads}) == 1
+
+    grouped = process_convolution_batch(payloads)
+
+    for p, result in zip(payloads, grouped):
+        alone = process_convolution_request(p)
+        assert result["result_image_base64"] == alone["result_image_base64"]
+        assert result["channels"] == alone["channels"]
+
+
+def test_invalid_request_does_not_fail_its_group():
+    image = encode_png(np.zeros((8, 8), dtype=np.uint8))
+    good = payload(image, "gaussian", "direct", "grayscale")
+    bad = payload("not an image", "gaussian", "direct", "grayscale")
+
+    first, second = process_convolution_batch([good, bad])
+
+    assert first["status"] == "ok"
+    assert isinstance(second, ValueError)
@@ -0,0 +1,35 @@
+# tests/test_prewitt_engines.py
+# Prewitt summed-area-table engine against the direct engine (CPU backend)
+
+import numpy as np
+import pytest
+
+from filters import apply_filter, get_filter_kernel
+
+
+@pytest.fixture
+def image():
+    return np.random.default_rng(1).integers(0, 256, (41, 29)).astype(np.float32)
+
+
+def prewitt(image, mask_size, engine, gain=8.0):
+    info = get_filter_kernel("prewitt", mask_size, engine)
+    result, _ = apply_filter(info, image, (16, 16), (1, 1), gain=gain, backend="cpu")
+    return result
+
+
+@pytest.mark.parametrize("mask_size", [3, 5, 9, 21, 51])
+@pytest.mark.parametrize("gain", [1.0, 8.0])
+def test_sat_matches_direct_exactly(image, mask_size, gain):
+    assert np.array_equal(prewitt(image, mask_size, "sat", gain), prewitt(image, mask_size, "direct", gain))
+
+
+def test_sat_matches_direct_on_flat_and_saturated_images():
+    for value in (0.0, 255.0):
+        flat = np.full((16, 16), value, dtype=np.float32)
+        assert np.array_equal(prewitt(flat, 9, "sat"), prewitt(flat, 9, "direct"))
+
+
+def test_sat_matches_direct_per_channel(image):
+    rgb = np.stack([image, image[::-1], 255 - image], axis=2)
+    assert np.array_equal(prewitt(rgb, 9, "sat"), prewitt(rgb, 9, "direct"))
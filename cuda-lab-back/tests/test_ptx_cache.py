@@ -0,0 +1,136 @@
+# tests/test_ptx_cache.py
+# PTX disk cache: hits/misses, invalidation and compile_cuda_kernel_to_ptx with a stub nvcc
+
+import os
+import stat
+import time
+
+import pytest
+
+import cuda_kernels
+import ptx_cache
+from ptx_cache import PtxCache
+
+SOURCE = 'extern "C" __global__ void k(float* x) { x[0] = 1.0f; }'
+
+# Fake nvcc: `--version` prints $FAKE_NVCC_VERSION, `-arch=... --ptx in.cu -o out.ptx`
+# writes a fake PTX for the source and appends one line per compile to $FAKE_NVCC_LOG
+STUB_NVCC = """#!/bin/sh
+if [ "$1" = "--version" ]; then
+    echo "Cuda compilation tools, release ${FAKE_NVCC_VERSION:-12.4}"
+    exit 0
+fi
+echo "$1" >> "$FAKE_NVCC_LOG"
+{ echo "// fake ptx $1"; cat "$3"; } > "$5"
+"""
+
+
+@pytest.fixture
+def stub_nvcc(tmp_path, monkeypatch):
+    """Puts a fake nvcc first on PATH and points the PTX cache at tmp_path."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    nvcc = bin_dir / "nvcc"
+    nvcc.write_text(STUB_NVCC)
+    nvcc.chmod(nvcc.stat().st_mode | stat.S_IEXEC)
+
+    log = tmp_path / "nvcc.log"
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("FAKE_NVCC_LOG", str(log))
+    monkeypatch.setenv("CUDA_LAB_PTX_CACHE", "1")
+    monkeypatch.setenv("CUDA_LAB_PTX_CACHE_DIR", str(tmp_path / "ptx"))
+    monkeypatch.setattr(ptx_cache, "_cache", None)
+    monkeypatch.setattr(ptx_cache, "_nvcc_versions", {})
+    monkeypatch.setattr(cuda_kernels, "_ptx_memo", {})
+
+    def compiles():
+        return log.read_text().splitlines() if log.exists() else []
+    return compiles
+
+
+def new_process(monkeypatch):
+    """Forget everything held in memory, as a restarted worker would."""
+    monkeypatch.setattr(ptx_cache, "_cache", None)
+    monkeypatch.setattr(ptx_cache, "_nvcc_versions", {})
+    monkeypatch.setattr(cuda_kernels, "_ptx_memo", {})
+
+
+def test_get_put_roundtrip(tmp_path):
+    cache = PtxCache(str(tmp_path))
+    key = cache.make_key(SOURCE, "sm_89", "12.4")
+
+    assert cache.get(key) is None
+    cache.put(key, "ptx")
+    assert cache.get(key) == "ptx"
+    assert cache.stats() == {"hits": 1, "misses": 1, "writes": 1, "evictions": 0, "errors": 0}
+    assert not [p for p in tmp_path.iterdir() if p.suffix == ".tmp"]
+
+
+def test_key_changes_with_source_arch_and_compiler():
+    key = PtxCache.make_key(SOURCE, "sm_89", "12.4")
+    assert PtxCache.make_key(SOURCE + " ", "sm_89", "12.4") != key
+    assert PtxCache.make_key(SOURCE, "sm_86", "12.4") != key
+    assert PtxCache.make_key(SOURCE, "sm_89", "12.5") != key
+    assert PtxCache.make_key(SOURCE, "sm_89", "12.4") == key
+
+
+def test_eviction_drops_least_recently_used(tmp_path):
+    cache = PtxCache(str(tmp_path), max_bytes=250)
+    for i, key in enumerate(("a", "b")):
+        cache.put(key, "x" * 100)
+        past = time.time() - 100 + i
+        os.utime(tmp_path / f"{key}.ptx", (past, past))
+
+    cache.get("a")  # now the most recently used
+    cache.put("c", "x" * 100)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_unwritable_cache_dir_does_not_raise(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    cache = PtxCache(str(blocker / "ptx"))
+
+    cache.put("k", "ptx")
+    assert cache.get("k") is None
+    assert cache.stats()["errors"] >= 1
+
+
+def test_compile_misses_then_hits_across_processes(stub_nvcc, monkeypatch):
+    ptx = cuda_kernels.compile_cuda_kernel_to_ptx(SOURCE, arch="sm_89")
+    assert SOURCE in ptx
+    assert stub_nvcc() == ["-arch=sm_89"]
+
+    # Same process: in-memory memo
+    assert cuda_kernels.compile_cuda_kernel_to_ptx(SOURCE, arch="sm_89") == ptx
+
+    # Restarted process: served from disk without running nvcc
+    new_process(monkeypatch)
+    assert cuda_kernels.compile_cuda_kernel_to_ptx(SOURCE, arch="sm_89") == ptx
+    assert stub_nvcc() == ["-arch=sm_89"]
+    assert ptx_cache.get_ptx_cache_stats()["hits"] == 1
+
+
+def test_compile_invalidated_by_source_arch_and_nvcc_version(stub_nvcc, monkeypatch):
+    cuda_kernels.compile_cuda_kernel_to_ptx(SOURCE, arch="sm_89")
+    cuda_kernels.compile_cuda_kernel_to_ptx(SOURCE.replace("1.0f", "2.0f"), arch="sm_89")
+    cuda_kernels.compile_cuda_kernel_to_ptx(SOURCE, arch="sm_86")
+    assert len(stub_nvcc()) == 3
+
+    new_process(monkeypatch)
+    monkeypatch.setenv("FAKE_NVCC_VERSION", "12.5")
+    cuda_kernels.compile_cuda_kernel_to_ptx(SOURCE, arch="sm_89")
+    assert len(stub_nvcc()) == 4
+
+
+def test_disabled_cache_always_runs_nvcc_per_process(stub_nvcc, monkeypatch):
+    monkeypatch.setenv("CUDA_LAB_PTX_CACHE", "0")
+    cuda_kernels.compile_cuda_kernel_to_ptx(SOURCE, arch="sm_89")
+    new_process(monkeypatch)
+    cuda_kernels.compile_cuda_kernel_to_ptx(SOURCE, arch="sm_89")
+
+    assert len(stub_nvcc()) == 2
+    assert ptx_cache.get_ptx_cache() is None
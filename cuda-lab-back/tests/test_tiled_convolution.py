@@ -0,0 +1,44 @@
+# tests/test_tiled_convolution.py
+# Tiled execution against the untiled apply_filter() for every filter and engine (CPU backend)
+
+import numpy as np
+import pytest
+
+from filters import FILTER_ENGINES, apply_filter, get_filter_kernel
+from tiled_convolution import choose_tile_size, tiled_apply_filter
+
+CASES = [
+    (filter_type, engine, mask_size)
+    for filter_type, engines in FILTER_ENGINES.items()
+    for engine in engines
+    for mask_size in (3, 9)
+    if not (filter_type == "laplacian" and engine == "separable" and mask_size == 3)
+]
+
+
+@pytest.fixture(params=[(47, 61), (47, 61, 3)], ids=["gray", "rgb"])
+def image(request):
+    return np.random.default_rng(3).integers(0, 256, request.param).astype(np.float32)
+
+
+@pytest.mark.parametrize("filter_type, engine, mask_size", CASES)
+def test_tiled_matches_untiled(image, filter_type, engine, mask_size):
+    info = get_filter_kernel(filter_type, mask_size, engine)
+    expected, _ = apply_filter(info, image, (16, 16), (1, 1), gain=8.0, backend="cpu")
+
+    # Odd tile size: tiles and halos never line up with the image edges
+    result, timings = tiled_apply_filter(info, image, (16, 16), (1, 1), gain=8.0, backend="cpu", tile_size=13)
+
+    assert timings["tiles"] > 1
+    assert result.shape == expected.shape
+    assert np.array_equal(result, expected)
+
+
+def test_tile_size_fits_the_budget():
+    tile = choose_tile_size("gaussian", 21, 24 * 100 * 100)
+    assert tile == 100 - 2 * 10
+
+
+def test_budget_too_small_is_rejected():
+    with pytest.raises(ValueError):
+        choose_tile_size("prewitt", 51, 48 * 10 * 10)
@@ -0,0 +1,193 @@
+# cuda-lab-back/tiled_convolution.py
+"""
+Tiled, memory-bounded execution of any registered filter.
+
+The image is split into square tiles; each tile is read together with a
+halo of mask_size // 2 pixels on every side, filtered with the normal
+apply_filter() path, and only its interior is written to the output.
+Halo pixels give every output pixel exactly the same neighbourhood as in
+the untiled run, and tiles on the image border see the border, so clamping
+is unchanged: the stitched output is bit-identical to the untiled result.
+
+Only one tile (plus its halo) is materialized at a time, so the input can be
+a memory-mapped array (np.load(..., mmap_mode="r") / np.memmap) and the
+output can be a memory-mapped .npy as well.
+
+Usage (CLI):
+    python tiled_convolution.py input.npy output.npy --filter gaussian --mask-size 21
+"""
+
+import argparse
+import math
+import os
+import time
+from typing import Dict, Optional, Tuple, Union
+
+import numpy as np
+
+from filters import get_filter_kernel, apply_filter, resolve_backend, resolve_block_dim
+from stage_timing import add_timings
+
+DEFAULT_MEMORY_BUDGET_BYTES = 256 * 1024 * 1024
+
+# Peak working set per tile pixel (host + device, worst of both backends):
+# float32 tile copy, uint8 staging, float32 result, plus each filter's temporaries
+TILE_BYTES_PER_PIXEL = {
+    "box_blur": 24,
+    "gaussian": 24,
+    "laplacian": 16,
+    "prewitt": 48,
+}
+
+
+def get_memory_budget() -> int:
+    """Budget from CUDA_LAB_TILE_MEMORY_BUDGET (bytes), default 256 MiB."""
+    return int(os.environ.get("CUDA_LAB_TILE_MEMORY_BUDGET", DEFAULT_MEMORY_BUDGET_BYTES))
+
+
+def estimate_working_set(filter_type: str, height: int, width: int, channels: int = 1) -> int:
+    """Approximate peak bytes needed to filter an (height, width[, channels]) image in one go."""
+    return TILE_BYTES_PER_PIXEL[filter_type] * height * width * channels
+
+
+def choose_tile_size(filter_type: str, mask_size: int, memory_budget_bytes: int, channels: int = 1) -> int:
+    """
+    Largest square tile whose haloed working set fits in the budget.
+
+    Raises:
+        ValueError: If not even a 1x1 tile plus halo fits
+    """
+    halo = mask_size // 2
+    side = int(math.isqrt(memory_budget_bytes // (TILE_BYTES_PER_PIXEL[filter_type] * channels)))
+    tile = side - 2 * halo
+    if tile < 1:
+        raise ValueError(
+            f"Memory budget of {memory_budget_bytes} bytes is too small for "
+            f"{filter_type} with mask_size {mask_size}"
+        )
+    return tile
+
+
+def tiled_apply_filter(
+    filter_info: dict,
+    image: np.ndarray,
+    block_dim: Union[Tuple[int, int], str],
+    grid_dim: Tuple[int, int],
+    gain: float = 8.0,
+    backend: str = "cuda",
+    memory_budget_bytes: Optional[int] = None,
+    tile_size: Optional[int] = None,
+    out: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, Dict[str, float]]:
+    """
+    Drop-in replacement for apply_filter() that processes the image tile by tile.
+
+    Args:
+        filter_info: dict returned by get_filter_kernel()
+        image: (H, W) or (H, W, C) array-like (ndarray or memmap); only tiles
+               are read into memory
+        block_dim, grid_dim, gain, backend: as in apply_filter()
+        memory_budget_bytes: Working-set budget used to size tiles
+                             (default CUDA_LAB_TILE_MEMORY_BUDGET)
+        tile_size: Explicit tile side (overrides the budget)
+        out: Optional output array (e.g. an open_memmap); default float32 ndarray
+
+    Returns:
+        (result_image, timings_dict) with summed per-tile timings and tile stats
+    """
+    if image.ndim not in (2, 3):
+        raise ValueError("Image must be 2D (grayscale) or 3D (H, W, C)")
+
+    height, width = image.shape[:2]
+    channels = image.shape[2] if image.ndim == 3 else 1
+    filter_type = filter_info["type"]
+    halo = filter_info["mask_size_used"] // 2
+
+    if tile_size is None:
+        budget = memory_budget_bytes if memory_budget_bytes is not None else get_memory_budget()
+        tile_size = choose_tile_size(filter_type, filter_info["mask_size_used"], budget, channels)
+    if tile_size < 1:
+        raise ValueError(f"tile_size must be >= 1, got {tile_size}")
+
+    if out is None:
+        out = np.empty(image.shape, dtype=np.float32)
+    elif out.shape != image.shape:
+        raise ValueError(f"out has shape {out.shape}, expected {image.shape}")
+
+    # "auto" is resolved once, on a full-size tile, and reused for every tile
+    if block_dim == "auto":
+        side = tile_size + 2 * halo
+        sample = np.ascontiguousarray(image[:side, :side], dtype=np.float32)
+        block_dim = resolve_block_dim(filter_info, sample, block_dim, gain, backend)
+
+    start = time.perf_counter()
+    totals: Dict[str, float] = {}
+    tiles = 0
+
+    for ty in range(0, height, tile_size):
+        ty_end = min(ty + tile_size, height)
+        y0, y1 = max(0, ty - halo), min(height, ty_end + halo)
+
+        for tx in range(0, width, tile_size):
+            tx_end = min(tx + tile_size, width)
+            x0, x1 = max(0, tx - halo), min(width, tx_end + halo)
+
+            # Materialize only this tile (+ halo) from a possibly memory-mapped source
+            tile = np.ascontiguousarray(image[y0:y1, x0:x1], dtype=np.float32)
+
+            tile_result, timings = apply_filter(
+                filter_info, tile, block_dim, grid_dim, gain=gain, backend=backend
+            )
+            out[ty:ty_end, tx:tx_end] = tile_result[ty - y0:ty_end - y0, tx - x0:tx_end - x0]
+
+            add_timings(totals, timings)
+            tiles += 1
+
+    return out, {
+        **totals,
+        "wall_time_ms": (time.perf_counter() - start) * 1000.0,
+        "tiles": tiles,
+        "tile_size": tile_size,
+        "halo": halo,
+        "block_dim": list(block_dim),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiled convolution of a (memory-mapped) .npy image")
+    parser.add_argument("input", help="(H, W) or (H, W, C) .npy input (opened memory-mapped)")
+    parser.add_argument("output", help=".npy output (written memory-mapped)")
+    parser.add_argument("--filter", required=True, dest="filter_type")
+    parser.add_argument("--mask-size", type=int, required=True)
+    parser.add_argument("--gain", type=float, default=8.0)
+    parser.add_argument("--engine", default="auto")
+    parser.add_argument("--block-dim", type=int, nargs=2, default=[16, 16])
+    parser.add_argument("--backend", default="auto")
+    parser.add_argument("--memory-budget", type=int, default=None, help="bytes")
+    parser.add_argument("--tile-size", type=int, default=None)
+    parser.add_argument("--dtype", default="uint8", choices=["uint8", "float32"])
+    args = parser.parse_args()
+
+    image = np.load(args.input, mmap_mode="r")
+    backend = resolve_backend(args.backend)
+    filter_info = get_filter_kernel(args.filter_type, args.mask_size, args.engine, backend)
+    out = np.lib.format.open_memmap(args.output, mode="w+", dtype=args.dtype, shape=image.shape)
+
+    _, stats = tiled_apply_filter(
+        filter_info,
+        image,
+        tuple(args.block_dim),
+        (1, 1),
+        gain=args.gain,
+        backend=backend,
+        memory_budget_bytes=args.memory_budget,
+        tile_size=args.tile_size,
+        out=out,
+    )
+    out.flush()
+    print(f"{args.output}: {stats['tiles']} tiles of {stats['tile_size']}px "
+          f"(halo {stats['halo']}), {stats['wall_time_ms']:.1f} ms on {backend}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+# cuda-lab-back/warmup.py
+"""
+Startup warm-up: device init plus precompilation of every filter's CUDA module.
+
+Without it the first request to each filter pays _initialize_cuda() and an
+nvcc run. The FastAPI lifespan starts run_warmup() as a background task:
+
+1. Device init runs on the compute worker thread (it owns the CUDA context).
+2. The PTX of all filter modules (filters.CUDA_MODULES) and of their
+   mask-size-specialized variants (kernel_specialization) is compiled in
+   parallel, one thread per nvcc subprocess; results land in the in-process
+   PTX memo and the on-disk PTX cache.
+3. The modules are loaded on the compute worker thread, the variants into
+   the specialization cache. With a worker pool (CUDA_LAB_WORKERS) the pool
+   processes load them from the PTX cache on first use instead, so only
+   step 2 runs here.
+
+On the CPU backend there is nothing to compile and warm-up finishes right
+after the device probe. GET /ready answers 503 until warm-up has finished
+(and keeps doing so if it failed).
+
+Configuration (environment variables):
+    CUDA_LAB_WARMUP  "0" skips warm-up (ready immediately, compile on first use)
+"""
+
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger("uvicorn.error")
+
+
+def warmup_enabled() -> bool:
+    return os.environ.get("CUDA_LAB_WARMUP", "1") != "0"
+
+
+class WarmupState:
+    """Progress of the startup warm-up, reported by /ready and /health."""
+
+    def __init__(self):
+        self.status = "pending"   # pending | running | ready | failed | disabled
+        self.backend: Optional[str] = None
+        self.duration_ms: Optional[float] = None
+        self.modules: Dict[str, Dict[str, float]] = {}  # name -> compile_ms / load_ms
+        self.error: Optional[str] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.status in ("ready", "disabled")
+
+    def as_dict(self) -> dict:
+        return {
+            "status": self.status,
+            "backend": self.backend,
+            "duration_ms": self.duration_ms,
+            "modules": self.modules,
+            "error": self.error,
+        }
+
+
+_state = WarmupState()
+
+
+def get_warmup_state() -> WarmupState:
+    return _state
+
+
+def _compile_ptx(name: str, source: str, arch: str) -> Tuple[str, float]:
+    from cuda_kernels import compile_cuda_kernel_to_ptx
+
+    start = time.perf_counter()
+    compile_cuda_kernel_to_ptx(source, arch=arch)
+    return name, (time.perf_counter() - start) * 1000.0
+
+
+async def run_warmup(worker, state: Optional[WarmupState] = None) -> WarmupState:
+    """
+    Initialize the device and precompile all filter modules.
+
+    Args:
+        worker: The started ComputeWorker (device init and module loads run on it)
+        state: State to update (default: the process-wide one)
+
+    Returns:
+        The updated state; errors are recorded in it, never raised
+    """
+    from cuda_kernels import is_cuda_available
+    from filters import CUDA_ARCH, CUDA_MODULES
+    from kernel_specialization import get_specialization_cache, specialization_enabled, specialization_sources
+    from worker_pool import get_worker_pool
+
+    state = state or _state
+    if not warmup_enabled():
+        state.status = "disabled"
+        return state
+
+    state.status = "running"
+    start = time.perf_counter()
+    try:
+        pool = get_worker_pool()
+        if pool is not None:
+            state.backend = pool.default_backend
+        else:
+            state.backend = "cuda" if await worker.submit(is_cuda_available) else "cpu"
+
+        if state.backend == "cuda":
+            sources = {name: source for name, (source, _) in CUDA_MODULES.items()}
+            variants = {}
+            if specialization_enabled():
+                for filter_type, N, source in specialization_sources():
+                    variants[f"{filter_type}_n{N}"] = (filter_type, N)
+                    sources[f"{filter_type}_n{N}"] = source
+
+            loop = asyncio.get_running_loop()
+            max_workers = min(len(sources), max(len(CUDA_MODULES), os.cpu_count() or 1))
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cuda-lab-nvcc") as nvcc:
+                compiled = await asyncio.gather(*(
+                    loop.run_in_executor(nvcc, _compile_ptx, name, source, CUDA_ARCH)
+                    for name, source in sources.items()
+                ))
+            state.modules = {name: {"compile_ms": ms} for name, ms in compiled}
+
+            if pool is None:
+                for name, (_, ensure_compiled) in CUDA_MODULES.items():
+                    load_start = time.perf_counter()
+                    await worker.submit(ensure_compiled)
+                    state.modules[name]["load_ms"] = (time.perf_counter() - load_start) * 1000.0
+                cache = get_specialization_cache()
+                for name, (filter_type, N) in variants.items():
+                    load_start = time.perf_counter()
+                    await worker.submit(cache.lookup, filter_type, N)
+                    state.modules[name]["load_ms"] = (time.perf_counter() - load_start) * 1000.0
+
+        state.status = "ready"
+    except Exception as e:
+        state.status = "failed"
+        state.error = str(e)
+    finally:
+        state.duration_ms = (time.perf_counter() - start) * 1000.0
+
+    logger.info(
+        "Warm-up %s in %.0f ms (backend=%s, modules=%d)",
+        state.status, state.duration_ms, state.backend, len(state.modules),
+    )
+    if state.error:
+        logger.error("Warm-up error: %s", state.error)
+    return state
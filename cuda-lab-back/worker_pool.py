@@ -0,0 +1,451 @@
+# cuda-lab-back/worker_pool.py
+"""
+Multi-process compute pool: shards filter work across GPUs or CPU cores.
+
+A single uvicorn process has one CUDA context and one GIL. With
+CUDA_LAB_WORKERS=N the API process starts N compute processes (spawned,
+so no CUDA state is inherited) and only decodes / encodes images itself:
+
+- Pinning: worker i sees one GPU through CUDA_VISIBLE_DEVICES (taken
+  round-robin from CUDA_LAB_WORKER_DEVICES) and is restricted to its own
+  slice of the available CPU cores with sched_setaffinity.
+- Dispatch: each job goes to the live worker with the fewest jobs in flight.
+- Handoff: the decoded float32 image and the result are exchanged through
+  multiprocessing.shared_memory blocks; only small metadata is pickled.
+- Health: a monitor thread pings the workers, restarts any that died and
+  kills ones stuck on a job longer than the job timeout, or idle ones that
+  stopped answering pings (alive but hung); their in-flight jobs fail with
+  RuntimeError (HTTP 503).
+
+The hooks sit in filters.apply_filter() and filters.apply_custom_kernel(),
+so every path (/convolve, batch, graph, stream, tiles, /convolve-custom)
+runs in the pool and the API process never touches CUDA; workers call the
+same functions in-process, so results are identical, and everything runs
+end-to-end on the CPU backend.
+
+Configuration (environment variables):
+    CUDA_LAB_WORKERS           number of worker processes (default 0 = in-process)
+    CUDA_LAB_WORKER_DEVICES    comma-separated GPU ids, e.g. "0,1" (default: no pinning)
+    CUDA_LAB_WORKER_TIMEOUT_S  max seconds per job before the worker is restarted (default 120)
+"""
+
+import itertools
+import multiprocessing as mp
+import os
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+DEFAULT_JOB_TIMEOUT_S = 120.0
+HEALTH_INTERVAL_S = 1.0
+PONG_TIMEOUT_S = 5 * HEALTH_INTERVAL_S
+STARTUP_TIMEOUT_S = 60.0
+
+
+# ---------- worker process ----------
+
+def _worker_main(index: int, device: Optional[str], cpus: Optional[Set[int]], requests, results):
+    """Entry point of a compute process."""
+    # Pin before anything touches CUDA or spawns threads
+    if device is not None:
+        os.environ["CUDA_VISIBLE_DEVICES"] = device
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+
+    from cuda_kernels import is_cuda_available
+
+    results.put(("ready", index, os.getpid(), is_cuda_available()))
+
+    while True:
+        msg = requests.get()
+        if msg is None:
+            break
+        if msg[0] == "ping":
+            results.put(("pong", index, msg[1]))
+            continue
+
+        _, job_id, in_name, out_name, shape, task = msg
+        shm_in = shm_out = None
+        try:
+            shm_in = shared_memory.SharedMemory(name=in_name)
+            shm_out = shared_memory.SharedMemory(name=out_name)
+            image = np.ndarray(shape, dtype=np.float32, buffer=shm_in.buf)
+            out = np.ndarray(shape, dtype=np.float32, buffer=shm_out.buf)
+
+            result, timings = _run_task(task, image)
+            out[...] = result
+            del image, out
+            results.put(("done", index, job_id, timings, None))
+        except Exception as e:
+            error_type = "ValueError" if isinstance(e, ValueError) else "RuntimeError"
+            results.put(("done", index, job_id, None, (error_type, str(e))))
+        finally:
+            for shm in (shm_in, shm_out):
+                if shm is not None:
+                    shm.close()
+
+
+def _run_task(task: tuple, image: np.ndarray):
+    """Run one pool task in the worker: ("filter", ...) or ("custom", ...)."""
+    from filters import get_filter_kernel, apply_filter, apply_custom_kernel
+
+    if task[0] == "filter":
+        _, filter_type, mask_size, engine, block_dim, grid_dim, gain, backend = task
+        filter_info = get_filter_kernel(filter_type, mask_size, engine)
+        return apply_filter(filter_info, image, block_dim, grid_dim, gain, backend)
+    if task[0] == "custom":
+        _, plan, block_dim, backend, postprocess = task
+        return apply_custom_kernel(plan, image, block_dim, backend, postprocess)
+    raise RuntimeError(f"Unknown pool task: {task[0]}")
+
+
+# ---------- supervisor ----------
+
+class _Worker:
+    def __init__(self, index: int, device: Optional[str], cpus: Optional[Set[int]]):
+        self.index = index
+        self.device = device
+        self.cpus = cpus
+        self.process = None
+        self.requests = None
+        self.pid = None
+        self.ready = False
+        self.cuda_available = False
+        self.in_flight: Dict[int, float] = {}  # job_id -> start time
+        self.dispatched = 0
+        self.completed = 0
+        self.restarts = 0
+        self.last_pong = 0.0   # last message of any kind (pong, ready or done)
+
+
+class _Job:
+    __slots__ = ("future", "worker", "shm_in", "shm_out", "shape")
+
+    def __init__(self, future, worker, shm_in, shm_out, shape):
+        self.future = future
+        self.worker = worker
+        self.shm_in = shm_in
+        self.shm_out = shm_out
+        self.shape = shape
+
+
+def _free(*blocks: shared_memory.SharedMemory):
+    for shm in blocks:
+        try:
+            shm.close()
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def split_cpus(num_workers: int, cpus: Sequence[int]) -> List[Set[int]]:
+    """Split the available cores into num_workers contiguous, near-equal sets."""
+    cpus = sorted(cpus)
+    if num_workers <= 0 or len(cpus) < num_workers:
+        return [set(cpus) for _ in range(max(num_workers, 0))]
+    base, extra = divmod(len(cpus), num_workers)
+    sets, start = [], 0
+    for i in range(num_workers):
+        size = base + (1 if i < extra else 0)
+        sets.append(set(cpus[start:start + size]))
+        start += size
+    return sets
+
+
+class WorkerPool:
+    """Supervisor of N pinned compute processes with least-loaded dispatch."""
+
+    def __init__(
+        self,
+        num_workers: int,
+        devices: Optional[List[str]] = None,
+        pin_cpus: bool = True,
+        job_timeout_s: float = DEFAULT_JOB_TIMEOUT_S,
+        pong_timeout_s: float = PONG_TIMEOUT_S,
+    ):
+        if num_workers < 1:
+            raise ValueError(f"num_workers must be >= 1, got {num_workers}")
+
+        cpu_sets: List[Optional[Set[int]]] = [None] * num_workers
+        if pin_cpus and hasattr(os, "sched_getaffinity"):
+            cpu_sets = split_cpus(num_workers, list(os.sched_getaffinity(0)))
+
+        self._workers = [
+            _Worker(i, devices[i % len(devices)] if devices else None, cpu_sets[i])
+            for i in range(num_workers)
+        ]
+        self.job_timeout_s = job_timeout_s
+        # A healthy idle worker's last pong can be up to one interval old
+        self.pong_timeout_s = max(pong_timeout_s, 2 * HEALTH_INTERVAL_S)
+
+        self._ctx = mp.get_context("spawn")
+        self._results = None
+        self._jobs: Dict[int, _Job] = {}
+        self._job_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    # ---------- lifecycle ----------
+
+    def start(self, timeout_s: float = STARTUP_TIMEOUT_S):
+        """Spawn the workers and wait until each one reported ready."""
+        self._results = self._ctx.Queue()
+        for worker in self._workers:
+            self._spawn(worker)
+
+        self._threads = [
+            threading.Thread(target=self._collect, name="worker-pool-collect", daemon=True),
+            threading.Thread(target=self._monitor, name="worker-pool-monitor", daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+
+        deadline = time.monotonic() + timeout_s
+        while not all(w.ready for w in self._workers):
+            if time.monotonic() > deadline:
+                self.stop()
+                raise RuntimeError("Compute workers did not start in time")
+            time.sleep(0.01)
+
+    def _spawn(self, worker: _Worker):
+        worker.requests = self._ctx.Queue()
+        worker.ready = False
+        worker.process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker.index, worker.device, worker.cpus, worker.requests, self._results),
+            name=f"cuda-lab-worker-{worker.index}",
+            daemon=True,
+        )
+        worker.process.start()
+        worker.pid = worker.process.pid
+
+    def stop(self, timeout_s: float = 5.0):
+        """Stop all workers and fail whatever is still in flight."""
+        self._stopping.set()
+        for worker in self._workers:
+            try:
+                worker.requests.put(None)
+            except (OSError, ValueError):
+                pass
+        for worker in self._workers:
+            worker.process.join(timeout_s)
+            if worker.process.is_alive():
+                worker.process.terminate()
+                worker.process.join(timeout_s)
+
+        self._results.put(None)  # wakes the collector
+        for t in self._threads:
+            t.join(timeout_s)
+
+        with self._lock:
+            jobs, self._jobs = list(self._jobs.values()), {}
+        for job in jobs:
+            _free(job.shm_in, job.shm_out)
+            if not job.future.done():
+                job.future.set_exception(RuntimeError("Worker pool stopped"))
+
+    # ---------- dispatch ----------
+
+    @property
+    def default_backend(self) -> str:
+        """What "auto" means inside the workers: "cuda" if they see a device."""
+        return "cuda" if any(w.cuda_available for w in self._workers) else "cpu"
+
+    def submit(
+        self,
+        filter_info: dict,
+        image: np.ndarray,
+        block_dim,
+        grid_dim: Tuple[int, int],
+        gain: float,
+        backend: str,
+    ) -> Future:
+        """Hand an image to the least-loaded worker; the future yields (result, timings)."""
+        return self._submit(image, (
+            "filter", filter_info["type"], filter_info["mask_size_used"], filter_info.get("engine", "auto"),
+            block_dim, grid_dim, gain, backend,
+        ))
+
+    def submit_custom(self, plan: dict, image: np.ndarray, block_dim, backend: str, postprocess: str) -> Future:
+        """Like submit(), for a kernel planned by filters.plan_custom_kernel()."""
+        return self._submit(image, ("custom", plan, block_dim, backend, postprocess))
+
+    def _submit(self, image: np.ndarray, task: tuple) -> Future:
+        if self._stopping.is_set():
+            raise RuntimeError("Worker pool is stopped")
+
+        image = np.ascontiguousarray(image, dtype=np.float32)
+        nbytes = max(image.nbytes, 1)
+        shm_in = shared_memory.SharedMemory(create=True, size=nbytes)
+        shm_out = shared_memory.SharedMemory(create=True, size=nbytes)
+        np.ndarray(image.shape, dtype=np.float32, buffer=shm_in.buf)[...] = image
+
+        future: Future = Future()
+        with self._lock:
+            live = [w for w in self._workers if w.ready]
+            if not live:
+                _free(shm_in, shm_out)
+                raise RuntimeError("No compute worker is available")
+            worker = min(live, key=lambda w: (len(w.in_flight), w.dispatched))
+
+            job_id = next(self._job_ids)
+            self._jobs[job_id] = _Job(future, worker, shm_in, shm_out, image.shape)
+            worker.in_flight[job_id] = time.monotonic()
+            worker.dispatched += 1
+            requests = worker.requests
+
+        requests.put(("job", job_id, shm_in.name, shm_out.name, image.shape, task))
+        return future
+
+    def apply_filter(self, filter_info: dict, image: np.ndarray, block_dim,
+                     grid_dim: Tuple[int, int], gain: float, backend: str) -> Tuple[np.ndarray, dict]:
+        """Blocking equivalent of filters.apply_filter() on the pool."""
+        return self.submit(filter_info, image, block_dim, grid_dim, gain, backend).result()
+
+    def apply_custom_kernel(self, plan: dict, image: np.ndarray, block_dim, backend: str,
+                            postprocess: str) -> Tuple[np.ndarray, dict]:
+        """Blocking equivalent of filters.apply_custom_kernel() on the pool."""
+        return self.submit_custom(plan, image, block_dim, backend, postprocess).result()
+
+    # ---------- background threads ----------
+
+    def _collect(self):
+        while True:
+            try:
+                msg = self._results.get()
+            except (EOFError, OSError):
+                return
+            if msg is None:
+                return
+
+            kind, index = msg[0], msg[1]
+            worker = self._workers[index]
+
+            if kind == "ready":
+                with self._lock:
+                    worker.pid, worker.cuda_available = msg[2], msg[3]
+                    worker.last_pong = time.monotonic()
+                    worker.ready = True
+            elif kind == "pong":
+                worker.last_pong = time.monotonic()
+            elif kind == "done":
+                _, _, job_id, meta, error = msg
+                with self._lock:
+                    job = self._jobs.pop(job_id, None)
+                    worker.in_flight.pop(job_id, None)
+                    worker.completed += 1
+                    worker.last_pong = time.monotonic()
+                if job is None:
+                    continue  # already failed by the monitor
+
+                if error is not None:
+                    error_type, detail = error
+                    exc_cls = ValueError if error_type == "ValueError" else RuntimeError
+                    job.future.set_exception(exc_cls(detail))
+                else:
+                    result = np.ndarray(job.shape, dtype=np.float32, buffer=job.shm_out.buf).copy()
+                    job.future.set_result((result, {**meta, "worker": index}))
+                _free(job.shm_in, job.shm_out)
+
+    def _monitor(self):
+        while not self._stopping.wait(HEALTH_INTERVAL_S):
+            now = time.monotonic()
+            for worker in self._workers:
+                if not worker.ready:
+                    if worker.process.is_alive():
+                        continue  # still starting
+                    self._restart(worker, f"Worker {worker.index} exited during startup")
+                elif not worker.process.is_alive():
+                    self._restart(worker, f"Worker {worker.index} exited "
+                                          f"(code {worker.process.exitcode})")
+                elif worker.in_flight and now - min(worker.in_flight.values()) > self.job_timeout_s:
+                    worker.process.kill()
+                    worker.process.join(5.0)
+                    self._restart(worker, f"Worker {worker.index} exceeded "
+                                          f"{self.job_timeout_s:.0f}s on a job")
+                elif not worker.in_flight and now - worker.last_pong > self.pong_timeout_s:
+                    # Idle but silent: pings go unanswered (deadlock, stuck in the driver)
+                    worker.process.kill()
+                    worker.process.join(5.0)
+                    self._restart(worker, f"Worker {worker.index} did not answer pings "
+                                          f"for {self.pong_timeout_s:.0f}s")
+                else:
+                    try:
+                        worker.requests.put(("ping", now))
+                    except (OSError, ValueError):
+                        pass
+
+    def _restart(self, worker: _Worker, reason: str):
+        if self._stopping.is_set():
+            return
+        with self._lock:
+            worker.ready = False
+            failed = [self._jobs.pop(job_id) for job_id in list(worker.in_flight)
+                      if job_id in self._jobs]
+            worker.in_flight.clear()
+            worker.restarts += 1
+        for job in failed:
+            _free(job.shm_in, job.shm_out)
+            if not job.future.done():
+                job.future.set_exception(RuntimeError(reason))
+        self._spawn(worker)
+
+    # ---------- metrics ----------
+
+    def health(self) -> List[dict]:
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "index": w.index,
+                    "pid": w.pid,
+                    "alive": w.process is not None and w.process.is_alive(),
+                    "ready": w.ready,
+                    "device": w.device,
+                    "cpus": sorted(w.cpus) if w.cpus else None,
+                    "cuda_available": w.cuda_available,
+                    "in_flight": len(w.in_flight),
+                    "completed": w.completed,
+                    "restarts": w.restarts,
+                    "last_seen_s": round(now - w.last_pong, 3) if w.last_pong else None,
+                }
+                for w in self._workers
+            ]
+
+
+_pool: Optional[WorkerPool] = None
+
+
+def get_worker_pool() -> Optional[WorkerPool]:
+    """The running pool, or None when compute runs in-process."""
+    return _pool
+
+
+def start_worker_pool() -> Optional[WorkerPool]:
+    """Start the pool configured by CUDA_LAB_WORKERS (no-op when 0)."""
+    global _pool
+    num_workers = int(os.environ.get("CUDA_LAB_WORKERS", 0))
+    if num_workers <= 0 or _pool is not None:
+        return _pool
+
+    devices = [d.strip() for d in os.environ.get("CUDA_LAB_WORKER_DEVICES", "").split(",") if d.strip()]
+    pool = WorkerPool(
+        num_workers,
+        devices=devices or None,
+        job_timeout_s=float(os.environ.get("CUDA_LAB_WORKER_TIMEOUT_S", DEFAULT_JOB_TIMEOUT_S)),
+    )
+    pool.start()
+    _pool = pool
+    return _pool
+
+
+def stop_worker_pool():
+    global _pool
+    if _pool is not None:
+        _pool.stop()
+        _pool = None
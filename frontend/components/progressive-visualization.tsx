@@ -22,8 +22,19 @@ interface StreamUpdate {
   total_chunks: number
   rows_processed: number
   total_rows: number
+  image_width: number
   elapsed_ms: number
-  result_image_base64: string
+  // Intermediate events: only the newly finished row band
+  row_offset?: number
+  band_rows?: number
+  band_image_base64?: string
+  // Preview mode: the band is downscaled to preview_width, placed at preview_row_offset
+  preview_width?: number
+  preview_height?: number
+  preview_row_offset?: number
+  preview_band_rows?: number
+  // Final event: full-resolution result
+  result_image_base64?: string
   filter_used: string
   mask_size_used: number
   completed?: boolean
@@ -40,7 +51,7 @@ export function ProgressiveVisualization({
 }: ProgressiveVisualizationProps) {
   const [isProcessing, setIsProcessing] = useState(false)
   const [progress, setProgress] = useState(0)
-  const [currentFrame, setCurrentFrame] = useState<string | null>(null)
+  const [hasFrame, setHasFrame] = useState(false)
   const [originalImage, setOriginalImage] = useState<string | null>(null)
   const [stats, setStats] = useState({
     rowsProcessed: 0,
@@ -51,6 +62,41 @@ export function ProgressiveVisualization({
     filterUsed: "",
   })
   const abortControllerRef = useRef<AbortController | null>(null)
+  const canvasRef = useRef<HTMLCanvasElement | null>(null)
+  const panelRef = useRef<HTMLDivElement | null>(null)
+
+  const toDataUrl = (b64: string) =>
+    b64.startsWith("data:") ? b64 : `data:image/png;base64,${b64}`
+
+  // Bumped per run; image loads from an earlier run are dropped
+  const runRef = useRef(0)
+  // Set once the final frame is queued; band loads finishing after it are dropped
+  const finalQueuedRef = useRef(false)
+
+  // Size the canvas once per run, from the first event's full dimensions.
+  // Resizing clears the canvas, so it never happens inside an image onload.
+  const sizeCanvas = (width: number, height: number) => {
+    const canvas = canvasRef.current
+    if (!canvas || (canvas.width === width && canvas.height === height)) return
+    canvas.width = width
+    canvas.height = height
+  }
+
+  // Draw a PNG (band or full image) onto the result canvas at the given row.
+  // Preview bands are stretched to the canvas width by scale (full / preview).
+  const drawRows = (b64: string, rowOffset: number, scale = 1, final = false) => {
+    const canvas = canvasRef.current
+    if (!canvas) return
+    const run = runRef.current
+    if (final) finalQueuedRef.current = true
+    const img = new Image()
+    img.onload = () => {
+      if (run !== runRef.current || (!final && finalQueuedRef.current)) return
+      canvas.getContext("2d")?.drawImage(img, 0, rowOffset * scale, canvas.width, img.height * scale)
+    }
+    img.src = toDataUrl(b64)
+    setHasFrame(true)
+  }
 
   // Load original image preview
   useEffect(() => {
@@ -68,7 +114,11 @@ export function ProgressiveVisualization({
 
     setIsProcessing(true)
     setProgress(0)
-    setCurrentFrame(null)
+    setHasFrame(false)
+    runRef.current += 1
+    finalQueuedRef.current = false
+    let canvasSized = false
+    canvasRef.current?.getContext("2d")?.clearRect(0, 0, canvasRef.current.width, canvasRef.current.height)
 
     // Convert image to base64
     const reader = new FileReader()
@@ -80,7 +130,12 @@ export function ProgressiveVisualization({
 
       try {
         const apiUrl = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000"
-        const response = await fetch(`${apiUrl}/convolve-stream`, {
+        // Intermediate bands only need the panel's on-screen resolution;
+        // the final event still carries the full-resolution result
+        const panelWidth = panelRef.current?.clientWidth ?? 0
+        const previewWidth = Math.round(panelWidth * (window.devicePixelRatio || 1))
+        // delay_ms paces the animation; the backend no longer sleeps by default
+        const response = await fetch(`${apiUrl}/convolve-stream?delay_ms=50&preview_width=${previewWidth}`, {
           method: "POST",
           headers: {
             "Content-Type": "application/json",
@@ -140,17 +195,23 @@ export function ProgressiveVisualization({
                   progress: update.progress,
                   chunk: update.chunk,
                   rows: update.rows_processed,
-                  hasImage: !!update.result_image_base64
+                  rowOffset: update.row_offset,
+                  bandRows: update.band_rows,
                 })
 
                 // Update UI with progress
                 setProgress(update.progress)
-                // Check if base64 already has data URI prefix
-                const imageData = update.result_image_base64.startsWith("data:")
-                  ? update.result_image_base64
-                  : `data:image/png;base64,${update.result_image_base64}`
-                console.log("Setting image, length:", imageData.length)
-                setCurrentFrame(imageData)
+                if (!canvasSized) {
+                  sizeCanvas(update.image_width, update.total_rows)
+                  canvasSized = true
+                }
+                if (update.band_image_base64 && update.preview_width && update.preview_height) {
+                  drawRows(update.band_image_base64, update.preview_row_offset ?? 0, update.total_rows / update.preview_height)
+                } else if (update.band_image_base64) {
+                  drawRows(update.band_image_base64, update.row_offset ?? 0)
+                } else if (update.result_image_base64) {
+                  drawRows(update.result_image_base64, 0, 1, true)
+                }
                 setStats({
                   rowsProcessed: update.rows_processed,
                   totalRows: update.total_rows,
@@ -283,14 +344,12 @@ export function ProgressiveVisualization({
                 <span className="animate-pulse text-primary">●</span>
               )}
             </div>
-            <div className="relative aspect-square overflow-hidden rounded-lg border bg-muted">
-              {currentFrame ? (
-                <img
-                  src={currentFrame}
-                  alt="Processing"
-                  className="h-full w-full object-contain"
-                />
-              ) : (
+            <div ref={panelRef} className="relative aspect-square overflow-hidden rounded-lg border bg-muted">
+              <canvas
+                ref={canvasRef}
+                className={hasFrame ? "h-full w-full object-contain" : "hidden"}
+              />
+              {!hasFrame && (
                 <div className="flex h-full items-center justify-center text-muted-foreground">
                   {isProcessing ? "Starting..." : "Waiting to start"}
                 </div>